@@ -0,0 +1,292 @@
+"""
+Compact binary serialization of parsed documents, so ASTs can be stored
+and reloaded without re-parsing the markdown.
+
+    data = dump(doc)
+    doc = load(data)
+
+Layout (all integers are unsigned LEB128 varints unless noted):
+
+    magic      b"OMAST"
+    version    1 byte, FORMAT_VERSION
+    strings    count, then the length of each string in characters, then
+               the byte length and UTF-8 bytes of all strings concatenated.
+               Every distinct string is stored once.
+    nodes      the tree in pre-order. Each node is its NodeType value (1
+               byte), its fields, then (for containers) its child count:
+
+               DOCUMENT, PARAGRAPH, LIST_ITEM, ITALIC, BOLD, INLINE_CODE  -
+               HEADING      level
+               CODE_BLOCK   language (string index)
+               LIST         ordered (1 byte)
+               TEXT         content (string index)
+               WIKILINK     target (string index), alias (string index + 1, 0 for none)
+               FRONT_MATTER meta (a value, see _dump_value)
+
+SourceText leaves are stored as plain Text, and lazy blocks are inline-parsed
+before they are written: a loaded tree never refers back to the source or a
+parser.
+"""
+import struct
+from typing import Any, Dict, List, Tuple
+
+from ast_nodes import (Bold, CodeBlock, Document, FrontMatter, Heading, InlineCode, Italic, ListItem, ListNode,
+                       Node, NodeType, Paragraph, Text, WikiLink)
+
+MAGIC = b"OMAST"
+# Bump whenever the layout or the meaning of a tag changes.
+FORMAT_VERSION = 1
+
+# Node types that carry nothing but their children
+_CONTAINERS = {
+    NodeType.DOCUMENT: Document,
+    NodeType.PARAGRAPH: Paragraph,
+    NodeType.LIST_ITEM: ListItem,
+    NodeType.ITALIC: Italic,
+    NodeType.BOLD: Bold,
+    NodeType.INLINE_CODE: InlineCode,
+}
+
+# Tags of FrontMatter values
+_NONE, _FALSE, _TRUE, _INT, _STR, _LIST, _DICT, _FLOAT = range(8)
+_DOUBLE = struct.Struct("<d")
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _read_varint(data: bytes, pos: int) -> Tuple[int, int]:
+    n = shift = 0
+    while True:
+        byte = data[pos]
+        pos += 1
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            return n, pos
+        shift += 7
+
+class _Strings:
+    """The string table being built by `dump`."""
+    def __init__(self):
+        self.index: Dict[str, int] = {}
+
+    def id(self, s: str) -> int:
+        i = self.index.get(s)
+        if i is None:
+            i = self.index[s] = len(self.index)
+        return i
+
+    def add(self, out: bytearray, s: str):
+        _write_varint(out, self.id(s))
+
+def _dump_value(out: bytearray, strings: _Strings, value: Any):
+    # Front matter is small and shallow, so plain recursion is fine here.
+    if value is None:
+        out.append(_NONE)
+    elif value is True or value is False:
+        out.append(_TRUE if value else _FALSE)
+    elif isinstance(value, int):
+        out.append(_INT)
+        _write_varint(out, value << 1 if value >= 0 else (-value << 1) - 1) # zigzag
+    elif isinstance(value, float):
+        out.append(_FLOAT)
+        out += _DOUBLE.pack(value)
+    elif isinstance(value, str):
+        out.append(_STR)
+        strings.add(out, value)
+    elif isinstance(value, (list, tuple)):
+        out.append(_LIST)
+        _write_varint(out, len(value))
+        for item in value:
+            _dump_value(out, strings, item)
+    elif isinstance(value, dict):
+        out.append(_DICT)
+        _write_varint(out, len(value))
+        for key, item in value.items():
+            strings.add(out, str(key))
+            _dump_value(out, strings, item)
+    else:
+        raise TypeError(f"Cannot serialize front matter value of type {type(value).__name__}")
+
+def _load_value(data: bytes, pos: int, strings: List[str]) -> Tuple[Any, int]:
+    tag = data[pos]
+    pos += 1
+    if tag == _STR:
+        i, pos = _read_varint(data, pos)
+        return strings[i], pos
+    if tag == _INT:
+        n, pos = _read_varint(data, pos)
+        return (n >> 1) if not n & 1 else -((n + 1) >> 1), pos
+    if tag == _LIST:
+        count, pos = _read_varint(data, pos)
+        items = []
+        for _ in range(count):
+            item, pos = _load_value(data, pos, strings)
+            items.append(item)
+        return items, pos
+    if tag == _DICT:
+        count, pos = _read_varint(data, pos)
+        result = {}
+        for _ in range(count):
+            i, pos = _read_varint(data, pos)
+            result[strings[i]], pos = _load_value(data, pos, strings)
+        return result, pos
+    if tag == _FLOAT:
+        return _DOUBLE.unpack_from(data, pos)[0], pos + _DOUBLE.size
+    if tag in (_NONE, _FALSE, _TRUE):
+        return (None, False, True)[tag], pos
+    raise ValueError(f"Unknown front matter value tag {tag}")
+
+def dump(doc: Node) -> bytes:
+    """Serializes the tree under `doc` (usually a Document)."""
+    strings = _Strings()
+    add_string = strings.add
+    body = bytearray()
+    stack = [doc]
+    while stack:
+        node = stack.pop()
+        node_type = node.type
+        body.append(node_type.value)
+        if node_type is NodeType.TEXT:
+            add_string(body, node.content)
+            continue
+        if node_type is NodeType.WIKILINK:
+            add_string(body, node.target)
+            if node.alias is None:
+                body.append(0)
+            else:
+                _write_varint(body, strings.id(node.alias) + 1)
+            continue
+        if node_type is NodeType.FRONT_MATTER:
+            _dump_value(body, strings, node.meta)
+            continue
+        if node_type is NodeType.HEADING:
+            _write_varint(body, node.level)
+        elif node_type is NodeType.CODE_BLOCK:
+            add_string(body, node.language)
+        elif node_type is NodeType.LIST:
+            body.append(1 if node.ordered else 0)
+        elif node_type not in _CONTAINERS:
+            raise TypeError(f"Cannot serialize {node.__class__.__name__}")
+        children = node.children
+        _write_varint(body, len(children))
+        stack.extend(reversed(children))
+
+    table = list(strings.index)
+    out = bytearray(MAGIC)
+    out.append(FORMAT_VERSION)
+    _write_varint(out, len(table))
+    for s in table:
+        _write_varint(out, len(s))
+    blob = "".join(table).encode('utf-8')
+    _write_varint(out, len(blob))
+    out += blob
+    out += body
+    return bytes(out)
+
+def load(data: bytes) -> Node:
+    """
+    Rebuilds the tree written by `dump`. Raises ValueError on foreign,
+    outdated, truncated or corrupted data.
+    """
+    if data[:len(MAGIC)] != MAGIC or len(data) == len(MAGIC):
+        raise ValueError("Not a serialized document")
+    if data[len(MAGIC)] != FORMAT_VERSION:
+        raise ValueError(f"Unsupported document format version {data[len(MAGIC)]}")
+    try:
+        root, pos = _load_nodes(data, len(MAGIC) + 1)
+    except (IndexError, struct.error, RecursionError) as e:
+        # Reading past the end, a string index out of range, or front matter nested without end
+        raise ValueError("Truncated or corrupted document") from e
+    if pos != len(data):
+        raise ValueError("Trailing data after the document")
+    return root
+
+def _load_nodes(data: bytes, pos: int) -> Tuple[Node, int]:
+    """Decodes the string table and the tree at `pos`; returns the tree and where it ends."""
+    count, pos = _read_varint(data, pos)
+    lengths = []
+    for _ in range(count):
+        n = data[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _read_varint(data, pos)
+        lengths.append(n)
+    size, pos = _read_varint(data, pos)
+    if pos + size > len(data):
+        raise ValueError("Truncated string table")
+    try:
+        text = data[pos:pos + size].decode('utf-8')
+    except UnicodeDecodeError as e:
+        raise ValueError("Corrupted string table") from e
+    if sum(lengths) != len(text):
+        raise ValueError("Corrupted string table")
+    pos += size
+    strings = []
+    start = 0
+    for n in lengths:
+        strings.append(text[start:start + n])
+        start += n
+
+    TEXT, WIKILINK, HEADING, CODE_BLOCK, LIST, FRONT_MATTER = (
+        t.value for t in (NodeType.TEXT, NodeType.WIKILINK, NodeType.HEADING, NodeType.CODE_BLOCK,
+                          NodeType.LIST, NodeType.FRONT_MATTER))
+    containers = {t.value: cls for t, cls in _CONTAINERS.items()}
+
+    # Pre-order rebuild with an explicit stack of [children list, nodes still to read]
+    root: List[Node] = []
+    stack = [[root, 1]]
+    while stack:
+        frame = stack[-1]
+        if not frame[1]:
+            stack.pop()
+            continue
+        frame[1] -= 1
+        tag = data[pos]
+        i = data[pos + 1]
+        if tag == TEXT and i < 0x80:
+            # The common case: a Text whose string index fits in one byte
+            frame[0].append(Text(strings[i]))
+            pos += 2
+            continue
+        pos += 1
+        if tag == TEXT:
+            i, pos = _read_varint(data, pos)
+            frame[0].append(Text(strings[i]))
+            continue
+        if tag == WIKILINK:
+            i, pos = _read_varint(data, pos)
+            alias, pos = _read_varint(data, pos)
+            frame[0].append(WikiLink(strings[i], strings[alias - 1] if alias else None))
+            continue
+        if tag == FRONT_MATTER:
+            meta, pos = _load_value(data, pos, strings)
+            frame[0].append(FrontMatter(meta))
+            continue
+
+        cls = containers.get(tag)
+        if cls is not None:
+            node = cls()
+        elif tag == HEADING:
+            level, pos = _read_varint(data, pos)
+            node = Heading(level)
+        elif tag == CODE_BLOCK:
+            i, pos = _read_varint(data, pos)
+            node = CodeBlock(strings[i])
+        elif tag == LIST:
+            node = ListNode(bool(data[pos]))
+            pos += 1
+        else:
+            raise ValueError(f"Unknown node tag {tag}")
+        frame[0].append(node)
+        n = data[pos]
+        if n < 0x80:
+            pos += 1
+        else:
+            n, pos = _read_varint(data, pos)
+        if n:
+            stack.append([node.children, n])
+    return root[0], pos
@@ -1,5 +1,5 @@
-from dataclasses import dataclass, field
-from typing import List, Optional, Union
+import copy
+from typing import Any, Iterable, List, Optional, Sequence, Tuple
 from enum import Enum, auto
 
 # 1. Node Types
@@ -12,124 +12,389 @@ class NodeType(Enum):
     LIST = auto()
     LIST_ITEM = auto()
     TEXT = auto()
-    WIKILINK = auto()  
+    WIKILINK = auto()
     ITALIC = auto()
     BOLD = auto()
     INLINE_CODE = auto()
     FRONT_MATTER = auto()
 
-# 2. Base Node
-@dataclass
+# 2. Base Nodes
+#
+# Nodes use __slots__ instead of dataclasses: no per-instance __dict__, and
+# the NodeType lives on the class rather than on every instance. Leaf nodes
+# share an empty tuple for `children` instead of allocating a list each.
 class Node:
-    type: NodeType
-    children: List['Node'] = field(default_factory=list)
+    __slots__ = ()
+
+    type: Optional[NodeType] = None
+    children: Sequence['Node'] = ()
     content: Optional[str] = None # For leaf nodes (Text)
-    
+
+    # Attributes listed in pretty() output (when set), in order.
+    pretty_fields: Tuple[str, ...] = ()
+    # Every slot along the MRO; filled in by __init_subclass__. Used by __eq__/__repr__.
+    _fields: Tuple[str, ...] = ()
+    # The slot storage copy() transfers, bookkeeping slots included.
+    _slot_descriptors: Tuple[Any, ...] = ()
+    # The class itself, or for a read-only node (see freeze_nodes) the class
+    # it was made from.
+    _mutable_class: type = None
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        fields = []
+        descriptors = []
+        for klass in reversed(cls.__mro__):
+            for name in klass.__dict__.get('__slots__', ()):
+                # Underscored slots are bookkeeping, not part of the node's value
+                if name not in fields and not name.startswith('_'):
+                    fields.append(name)
+                attr = getattr(cls, name)
+                if isinstance(attr, property) and attr.fset is None:
+                    continue # Computed instead (SourceText.content): the slot is never set
+                descriptors.append(klass.__dict__[name])
+        cls._fields = tuple(fields)
+        cls._slot_descriptors = tuple(descriptors)
+        if '_mutable_class' not in cls.__dict__:
+            cls._mutable_class = cls
+
     def add(self, node: 'Node'):
-        self.children.append(node)
+        raise TypeError(f"{self.__class__.__name__} cannot have children")
+
+    def __eq__(self, other: Any) -> bool:
+        if other.__class__ is not self.__class__ and getattr(other, '_mutable_class', None) is not self._mutable_class:
+            return NotImplemented
+        return all(getattr(self, name) == getattr(other, name) for name in self._fields)
+
+    __hash__ = None # Mutable, like the dataclasses this replaces
+
+    def __repr__(self) -> str:
+        args = ", ".join(f"{name}={getattr(self, name)!r}" for name in self._fields)
+        return f"{self.__class__.__name__}({args})"
+
+    def copy(self) -> 'Node':
+        """A deep copy of the tree under this node; see `copy_nodes`."""
+        return copy_nodes([self])[0]
 
     def pretty(self, level: int = 0) -> str:
+        lines: List[str] = []
+        self._pretty_lines(level, lines)
+        return "".join(lines)
+
+    def _pretty_lines(self, level: int, lines: List[str]):
         indent = "  " * level
         name = self.__class__.__name__
-        
+
         details = []
         if self.content:
             details.append(f"content={repr(self.content)}")
-        
-        if hasattr(self, 'level'):
-            details.append(f"level={getattr(self, 'level')}")
-        
-        language = getattr(self, 'language', None)
-        if language:
-            details.append(f"language={language}")
-            
-        target = getattr(self, 'target', None)
-        if target:
-            details.append(f"target={target}")
-            
-        alias = getattr(self, 'alias', None)
-        if alias:
-            details.append(f"alias={alias}")
-            
+        for field in self.pretty_fields:
+            value = getattr(self, field)
+            if value:
+                details.append(f"{field}={value}")
+
         detail_str = f" ({', '.join(details)})" if details else ""
-        
-        result = f"{indent}{name}{detail_str}\n"
-        
+        lines.append(f"{indent}{name}{detail_str}\n")
+
         for child in self.children:
-            result += child.pretty(level + 1)
-            
-        return result
+            child._pretty_lines(level + 1, lines)
+
+class ContainerNode(Node):
+    """A node that owns a list of child nodes."""
+    __slots__ = ('children',)
+
+    def __init__(self):
+        self.children: List[Node] = []
+
+    def add(self, node: Node):
+        self.children.append(node)
+
+# The plain slot storage behind ContainerNode.children
+_children_slot = ContainerNode.__dict__['children']
+
+class InlineContainer(ContainerNode):
+    """
+    A block whose children come from inline-parsing its text (headings,
+    paragraphs, list items).
+
+    With `Parser.parse(..., lazy=True)` the block keeps its raw Text child
+    and a reference to the parser in `_pending`; inline parsing runs the
+    first time `children` is read.
+    """
+    __slots__ = ('_pending',)
+
+    @property
+    def children(self) -> List[Node]:
+        parser = self._pending
+        if parser is not None:
+            self._pending = None
+            parser._process_inline_elements(self)
+        return _children_slot.__get__(self)
+
+    @children.setter
+    def children(self, value: List[Node]):
+        self._pending = None
+        _children_slot.__set__(self, value)
+
+    @property
+    def inline_parsed(self) -> bool:
+        return self._pending is None
+
+    @property
+    def raw_text(self) -> Optional[str]:
+        """
+        The block's markdown text before inline parsing, without parsing it,
+        or None once the children have been parsed.
+        """
+        if self._pending is None:
+            return None
+        return "".join(child.content or "" for child in _children_slot.__get__(self))
+
+class LeafNode(Node):
+    """A node without children."""
+    __slots__ = ()
 
 # 3. Block Nodes
-@dataclass
-class Document(Node):
+class Document(ContainerNode):
+    # Source offset of each top-level block, set by Parser.parse for reparse()
+    __slots__ = ('_block_starts',)
+    type = NodeType.DOCUMENT
+
     def __init__(self):
-        super().__init__(NodeType.DOCUMENT)
+        super().__init__()
+        self._block_starts: Optional[Tuple[int, ...]] = None
+
+class FrontMatter(LeafNode):
+    __slots__ = ('meta',)
+    type = NodeType.FRONT_MATTER
 
-@dataclass
-class FrontMatter(Node):
-    meta: dict = field(default_factory=dict)
     def __init__(self, meta: dict = None):
-        super().__init__(NodeType.FRONT_MATTER)
         self.meta = meta if meta is not None else {}
 
-@dataclass
-class Heading(Node):
-    level: int = 1
+class Heading(InlineContainer):
+    __slots__ = ('level',)
+    type = NodeType.HEADING
+    pretty_fields = ('level',)
+
     def __init__(self, level: int):
-        super().__init__(NodeType.HEADING)
+        super().__init__()
         self.level = level
 
-@dataclass
-class Paragraph(Node):
-    def __init__(self):
-        super().__init__(NodeType.PARAGRAPH)
+class Paragraph(InlineContainer):
+    __slots__ = ()
+    type = NodeType.PARAGRAPH
+
+class CodeBlock(ContainerNode):
+    # Its children are the code as Text leaves: never inline-parsed
+    __slots__ = ('language',)
+    type = NodeType.CODE_BLOCK
+    pretty_fields = ('language',)
 
-@dataclass
-class CodeBlock(Node):
-    language: str = ""
     def __init__(self, language: str = ""):
-        super().__init__(NodeType.CODE_BLOCK)
+        super().__init__()
         self.language = language
 
-@dataclass
-class ListNode(Node):
-    ordered: bool = False
+class ListNode(ContainerNode):
+    __slots__ = ('ordered',)
+    type = NodeType.LIST
+
     def __init__(self, ordered: bool = False):
-        super().__init__(NodeType.LIST)
+        super().__init__()
         self.ordered = ordered
 
-@dataclass
-class ListItem(Node):
-    def __init__(self):
-        super().__init__(NodeType.LIST_ITEM)
+class ListItem(InlineContainer):
+    __slots__ = ()
+    type = NodeType.LIST_ITEM
 
 # 4. Inline Nodes
-@dataclass
-class Text(Node):
+class Text(LeafNode):
+    __slots__ = ('content',)
+    type = NodeType.TEXT
+
     def __init__(self, text: str):
-        super().__init__(NodeType.TEXT, content=text)
+        self.content = text
+
+class SourceText(Text):
+    """
+    A Text whose content is the slice `source[start:end]` of one shared
+    source string, produced by `Parser.parse(text, spans=True)`. The string
+    is only built when `content` is read. With `fold`, newlines inside the
+    span read as spaces (paragraph lines are joined that way).
+    """
+    __slots__ = ('source', 'start', 'end', 'fold')
+
+    def __init__(self, source: str, start: int, end: int, fold: bool = False):
+        self.source = source
+        self.start = start
+        self.end = end
+        self.fold = fold
+
+    @property
+    def content(self) -> str:
+        text = self.source[self.start:self.end]
+        return text.replace('\n', ' ') if self.fold else text
+
+    def __repr__(self) -> str:
+        return f"SourceText(start={self.start}, end={self.end}, content={self.content!r})"
+
+class WikiLink(LeafNode):
+    __slots__ = ('target', 'alias')
+    type = NodeType.WIKILINK
+    pretty_fields = ('target', 'alias')
 
-@dataclass
-class WikiLink(Node):
-    target: str = ""
-    alias: Optional[str] = None
     def __init__(self, target: str, alias: Optional[str] = None):
-        super().__init__(NodeType.WIKILINK)
         self.target = target
         self.alias = alias
 
-@dataclass
-class Italic(Node):
-    def __init__(self):
-        super().__init__(NodeType.ITALIC)
+class Italic(ContainerNode):
+    __slots__ = ()
+    type = NodeType.ITALIC
 
-@dataclass
-class Bold(Node):
-    def __init__(self):
-        super().__init__(NodeType.BOLD)
+class Bold(ContainerNode):
+    __slots__ = ()
+    type = NodeType.BOLD
 
-@dataclass
-class InlineCode(Node):
-    def __init__(self):
-        super().__init__(NodeType.INLINE_CODE)
+class InlineCode(ContainerNode):
+    __slots__ = ()
+    type = NodeType.INLINE_CODE
+
+def copy_nodes(nodes: Sequence[Node]) -> List[Node]:
+    """
+    Deep copies of the trees in `nodes`, sharing nothing mutable with them
+    (strings are shared). Lazy blocks stay lazy, and copies of read-only
+    nodes are ordinary, mutable ones. Walks with an explicit stack, so
+    depth is not limited by the recursion limit.
+    """
+    result = [None] * len(nodes)
+    stack = [(nodes, result)]
+    while stack:
+        originals, copies = stack.pop()
+        for i, node in enumerate(originals):
+            cls = node._mutable_class
+            new = cls.__new__(cls)
+            for slot in cls._slot_descriptors:
+                value = slot.__get__(node)
+                if value.__class__ is list or value.__class__ is ReadOnlyList:
+                    # `children`, read raw so lazy blocks are not parsed here
+                    children = [None] * len(value)
+                    stack.append((value, children))
+                    value = children
+                elif isinstance(value, dict):
+                    value = _copy_value(value) # FrontMatter.meta
+                slot.__set__(new, value)
+            copies[i] = new
+    return result
+
+def _copy_value(value: Any) -> Any:
+    """A mutable deep copy of front matter data, read-only or not."""
+    if isinstance(value, dict):
+        return {key: _copy_value(item) for key, item in value.items()}
+    if isinstance(value, list):
+        return [_copy_value(item) for item in value]
+    return copy.deepcopy(value)
+
+def _read_only(self, *args, **kwargs):
+    raise TypeError(f"This {self.__class__.__name__} belongs to a read-only node; change a copy() of the node instead")
+
+class ReadOnlyList(list):
+    """The children (or front matter lists) of a read-only node: a list that refuses changes."""
+    __slots__ = ()
+    append = extend = insert = remove = pop = clear = sort = reverse = _read_only
+    __setitem__ = __delitem__ = __iadd__ = __imul__ = _read_only
+
+class ReadOnlyDict(dict):
+    """The front matter of a read-only FrontMatter node: a dict that refuses changes."""
+    __slots__ = ()
+    pop = popitem = clear = update = setdefault = _read_only
+    __setitem__ = __delitem__ = __ior__ = _read_only
+
+def _read_only_value(value: Any) -> Any:
+    if isinstance(value, dict):
+        return ReadOnlyDict((key, _read_only_value(item)) for key, item in value.items())
+    if isinstance(value, list):
+        return ReadOnlyList(_read_only_value(item) for item in value)
+    return value
+
+def _read_only_setattr(self, name: str, value: Any):
+    raise AttributeError(f"{self.__class__.__name__} is read-only; change a copy() of it instead")
+
+def _read_only_delattr(self, name: str):
+    raise AttributeError(f"{self.__class__.__name__} is read-only; change a copy() of it instead")
+
+# Node class -> its read-only twin, made on first use
+_read_only_classes = {}
+
+def _read_only_class(cls: type) -> type:
+    read_only = _read_only_classes.get(cls)
+    if read_only is None:
+        read_only = _read_only_classes[cls] = type(cls.__name__, (cls,), {
+            '__slots__': (),
+            '__module__': cls.__module__,
+            '__qualname__': cls.__qualname__,
+            '__setattr__': _read_only_setattr,
+            '__delattr__': _read_only_delattr,
+            '_mutable_class': cls,
+        })
+    return read_only
+
+def freeze_nodes(nodes: Iterable[Node]):
+    """
+    Makes the trees in `nodes` read-only, in place, so they can be shared
+    between documents: assigning to an attribute raises AttributeError, and
+    changing a `children` list or front matter data raises TypeError. The
+    nodes keep their class name, visitor methods and equality with mutable
+    nodes; `copy()` gives back a mutable tree. Lazy blocks are inline-parsed
+    first.
+    """
+    read_only_classes = _read_only_classes
+    stack = list(nodes)
+    pop = stack.pop
+    push = stack.extend
+    while stack:
+        node = pop()
+        cls = node.__class__
+        read_only = read_only_classes.get(cls)
+        if read_only is None:
+            if cls._mutable_class is not cls:
+                continue # Already read-only
+            read_only = _read_only_class(cls)
+        if isinstance(node, ContainerNode):
+            children = node.children # parses lazy blocks
+            _children_slot.__set__(node, ReadOnlyList(children))
+            push(children)
+        elif isinstance(node, FrontMatter):
+            node.meta = _read_only_value(node.meta)
+        node.__class__ = read_only
+
+def source_range(node: Node) -> Optional[Tuple[int, int]]:
+    """
+    Returns the `(start, end)` source offsets covered by the SourceText
+    leaves under `node`, or None if the tree was not parsed with spans.
+    """
+    start = end = None
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, SourceText):
+            start = current.start if start is None else min(start, current.start)
+            end = current.end if end is None else max(end, current.end)
+        else:
+            stack.extend(current.children)
+    return None if start is None else (start, end)
+
+class BlockEdit:
+    """
+    The result of `Parser.reparse`: `doc.children[start:end]` are newly
+    parsed and replace `children[start:old_end]` of the previous document;
+    every other top-level block is the previous document's own node.
+    """
+    __slots__ = ('doc', 'start', 'end', 'old_end')
+
+    def __init__(self, doc: Document, start: int, end: int, old_end: int):
+        self.doc = doc
+        self.start = start
+        self.end = end
+        self.old_end = old_end
+
+    def __repr__(self) -> str:
+        return f"BlockEdit(start={self.start}, end={self.end}, old_end={self.old_end})"
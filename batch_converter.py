@@ -1,76 +1,479 @@
 from pathlib import Path
-from typing import List
+from typing import Dict, List, Optional, Sequence, Tuple
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import hashlib
+import json
 import os
 from md_parser import Parser
-from renderer import HTMLRenderer
+from renderer import HTMLRenderer, MultiRenderer
+from manifest import BuildManifest, content_digest, file_digest
+from link_index import LINKS_NAME, LinkIndex, LinkResolver
+from page_template import Asset, PageTemplate
+from memory_budget import MemoryBudget
+from profiler import NULL_PROFILER, Profiler
+from search_index import SEARCH_INDEX_NAME, IndexBuilder, SearchIndex
 
-def convert_all(input_dir: str, output_dir: str):
-    input_path = Path(input_dir).expanduser()
-    output_path = Path(output_dir).expanduser()
-    
-    # Ensure output directory exists
-    output_path.mkdir(parents=True, exist_ok=True)
-    
-    parser = Parser()
-    renderer = HTMLRenderer()
-    
-    print(f"Scanning {input_path} for markdown files...")
-    
-    files_processed = 0
+# Per-process state for the parallel path. Each worker builds its own
+# Parser/HTMLRenderer once in `_init_worker` and reuses them for every file.
+_worker_state = {}
+
+# What `convert_all` can write per note, and the extension of each file:
+# the page, its plain text, and a JSON record for search (title, headings,
+# WikiLinks and text). The first one requested is the note's primary output.
+OUTPUTS = {"html": ".html", "text": ".txt", "search": ".json"}
+
+# What convert_file returns: (digest, converted, links, terms)
+Converted = Tuple[str, bool, List[str], Optional[Dict[str, int]]]
+
+def collect_sources(input_path: Path) -> List[str]:
+    """
+    Walks the vault and returns the relative path (posix style) of every
+    markdown file to convert, in the same deterministic order the serial
+    loop visits them.
+    """
+    sources = []
     for root, dirs, files in os.walk(input_path):
         # Modify dirs in-place to skip unwanted directories
         dirs[:] = [d for d in dirs if d not in {".obsidian", ".git"}]
-        
+
         if not any(f.lower() == 'readme.md' for f in files): # Flag check: Only process directory if README.md exists (case-insensitive)
             continue
-            
-        root_path = Path(root)
-        
+
+        # Plain string joins: on large vaults pathlib dominates a no-op rebuild.
+        rel_dir = os.path.relpath(root, input_path).replace(os.sep, '/')
+        prefix = "" if rel_dir == "." else rel_dir + "/"
+
         for file in sorted(files):
             if not file.endswith(".md"):
                 continue
-                
-            md_file = root_path / file
-            rp = md_file.relative_to(input_path)
-            print(f"Processing {rp}...")
-            
+            sources.append(prefix + file)
+    return sources
+
+def shard_of(rel: str, count: int) -> int:
+    """
+    The shard (0..count-1) that converts the note at `rel`. Hashes the path
+    itself, so every host agrees on it regardless of PYTHONHASHSEED.
+    """
+    digest = hashlib.blake2b(rel.encode('utf-8'), digest_size=8).digest()
+    return int.from_bytes(digest, 'little') % count
+
+def parse_shard(spec: str) -> Tuple[int, int]:
+    """Parses 'i/N' into (i, N); raises ValueError unless 0 <= i < N."""
+    index, sep, count = spec.partition('/')
+    try:
+        index, count = int(index), int(count)
+    except ValueError:
+        index = count = -1
+    if not sep or not 0 <= index < count:
+        raise ValueError(f"Invalid shard {spec!r}: expected i/N with 0 <= i < N")
+    return index, count
+
+def output_file_for(rel: str, output_path: Path, ext: str = ".html") -> str:
+    return os.path.join(output_path, rel[:-len(".md")] + ext)
+
+def check_outputs(outputs: Sequence[str]) -> Tuple[str, ...]:
+    """`outputs` in canonical (OUTPUTS) order; raises ValueError on unknown or no outputs."""
+    unknown = set(outputs).difference(OUTPUTS)
+    if unknown:
+        raise ValueError(f"Unknown outputs: {', '.join(sorted(unknown))}")
+    if not outputs:
+        raise ValueError("No outputs requested")
+    return tuple(name for name in OUTPUTS if name in outputs)
+
+def make_renderer(resolver: LinkResolver, outputs: Sequence[str] = ("html",), search_index: bool = False) -> MultiRenderer:
+    """
+    A renderer producing what `outputs` need in one walk, plus the links for
+    the link index and, with `search_index`, the terms for the search index.
+    """
+    collect = ["links"]
+    if search_index:
+        collect.append("terms")
+    if "html" in outputs:
+        collect.append("html")
+    if "text" in outputs or "search" in outputs:
+        collect.append("text")
+    if "search" in outputs:
+        collect.append("toc")
+    return MultiRenderer(resolver, outputs=collect)
+
+def build_key(renderer: HTMLRenderer, template: PageTemplate, outputs: Sequence[str] = ("html",)) -> str:
+    """Identifies everything besides the note itself that shapes its outputs."""
+    return f"renderer={renderer.VERSION};{template.key};outputs={','.join(outputs)}"
+
+def page_template(renderer: HTMLRenderer, inline_css: bool = False) -> PageTemplate:
+    """The page layout for a run: the renderer's stylesheet as a shared asset (or inlined)."""
+    css = renderer.get_css()
+    return PageTemplate([Asset("style.css", css.encode('utf-8'))] if css else [], inline_css=inline_css)
+
+def read_source(md_file: Path) -> Tuple[bytes, str]:
+    """Returns the raw bytes (for hashing) and the decoded text of a note."""
+    with open(md_file, 'rb') as f:
+        data = f.read()
+    content = data.decode('utf-8')
+    # Match text-mode reads: normalise Windows/old-Mac line endings.
+    if '\r' in content:
+        content = content.replace('\r\n', '\n').replace('\r', '\n')
+    return data, content
+
+def convert_file(rel: str, input_path: Path, output_path: Path, parser: Parser, renderer: MultiRenderer,
+                 known_digest: Optional[str] = None, template: Optional[PageTemplate] = None,
+                 profiler: Optional[Profiler] = None, outputs: Sequence[str] = ("html",),
+                 stream: bool = False) -> Converted:
+    """
+    Parses, renders and writes the note at `rel` (relative to `input_path`).
+
+    Returns `(digest, converted, links, terms)`, where `links` are the note's
+    WikiLink targets and `terms` its weighted search terms (None unless the
+    renderer collects them). When the content hash equals `known_digest` and
+    the primary output already exists, the note is not parsed, `converted`
+    is False and `links` is empty.
+
+    `outputs` (see OUTPUTS) are all produced by a single walk of the AST;
+    `renderer` must collect what they need (see `make_renderer`).
+    Pages are wrapped in `template` (by default, the renderer's stylesheet
+    inlined). Its shared assets must already have been written.
+
+    With a `profiler`, the note's phases are timed (see profiler.py).
+
+    With `stream`, the note is never held whole: it is hashed in one pass,
+    then parsed, rendered and written one top-level block at a time (its
+    parse time counts as "render"). The outputs are the same.
+    """
+    if template is None:
+        template = page_template(renderer, inline_css=True)
+    if profiler is None:
+        profiler = NULL_PROFILER
+    md_file = input_path / rel
+    output_file = Path(output_file_for(rel, output_path, OUTPUTS[outputs[0]]))
+
+    with profiler.note(rel):
+        if stream:
+            with profiler.phase("read"):
+                digest = file_digest(md_file)
+                if digest == known_digest and output_file.exists():
+                    return digest, False, [], None
+            # Parsed block by block as the renderer walks it; the parsing
+            # still counts as parsing, not rendering
+            doc = profiler.phase_iter("parse", parser.parse_file(md_file))
+            profiler.parsed(os.path.getsize(md_file), None)
+        else:
             # Read Markdown
-            with open(md_file, 'r', encoding='utf-8') as f:
-                content = f.read()
-                
-            # Parse and Render
-            doc = parser.parse(content)
-            html_content = renderer.render(doc)
-            
-            # Wrap in a basic HTML structure for better viewing
-            full_html = f"""<!DOCTYPE html>
-<html>
-<head>
-    <title>{md_file.stem}</title>
-    <style>
-        {renderer.get_css()}
-    </style>
-</head>
-<body>
-    {html_content}
-</body>
-</html>"""
-            
-            # Write HTML
-            relative_path = md_file.relative_to(input_path)
-            output_file = output_path / relative_path.with_suffix('.html')
+            with profiler.phase("read"):
+                data, content = read_source(md_file)
+                digest = content_digest(data)
+                if digest == known_digest and output_file.exists():
+                    return digest, False, [], None
+
+            # Parse
+            with profiler.phase("parse"):
+                doc = parser.parse(content)
+            profiler.parsed(len(data), doc)
+            del data, content
+        renderer.page = rel
+        with profiler.phase("write"):
             output_file.parent.mkdir(parents=True, exist_ok=True)
 
-            with open(output_file, 'w', encoding='utf-8') as f:
-                f.write(full_html)
-                
+        if "html" in outputs:
+            # Write HTML: the page header, then the body streamed straight from the
+            # renderer, then the footer, without ever building the whole page string.
+            # "write" covers opening and flushing the file; buffered writes made
+            # while streaming count towards "render".
+            with profiler.phase("write"):
+                f = open(output_file, 'w', encoding='utf-8')
+            with f:
+                with profiler.phase("render"):
+                    # Wrap in a basic HTML structure for better viewing
+                    f.write(template.header(rel, md_file.stem))
+                    result = renderer.render_all(doc, f)
+                    f.write(template.FOOTER)
+                with profiler.phase("write"):
+                    f.close()
+        else:
+            with profiler.phase("render"):
+                result = renderer.render_all(doc)
+
+        with profiler.phase("write"):
+            if "text" in outputs:
+                with open(output_file_for(rel, output_path, OUTPUTS["text"]), 'w', encoding='utf-8') as f:
+                    f.write(result.text)
+            if "search" in outputs:
+                record = {"title": md_file.stem, "toc": result.toc, "links": result.links, "text": result.text}
+                with open(output_file_for(rel, output_path, OUTPUTS["search"]), 'w', encoding='utf-8') as f:
+                    json.dump(record, f, ensure_ascii=False)
+    return digest, True, result.links, result.terms
+
+def prune_outputs(removed: List[str], output_path: Path):
+    """Deletes the outputs of notes that no longer exist, plus any directories left empty."""
+    for rel in removed:
+        for ext in OUTPUTS.values():
+            output_file = Path(output_file_for(rel, output_path, ext))
+            try:
+                output_file.unlink()
+            except FileNotFoundError:
+                pass
+        parent = output_file.parent
+        while parent != output_path:
+            try:
+                parent.rmdir()
+            except OSError:
+                break
+            parent = parent.parent
+
+def _init_worker(input_path: Path, output_path: Path, resolver: LinkResolver, template: PageTemplate,
+                 profile: bool = False, outputs: Sequence[str] = ("html",), search_index: bool = False):
+    _worker_state['parser'] = Parser()
+    _worker_state['renderer'] = make_renderer(resolver, outputs, search_index)
+    _worker_state['outputs'] = outputs
+    _worker_state['template'] = template
+    _worker_state['input_path'] = input_path
+    _worker_state['output_path'] = output_path
+    _worker_state['profiler'] = None
+    if profile:
+        profiler = _worker_state['profiler'] = Profiler()
+        profiler.instrument(_worker_state['parser'])
+
+def _convert_in_worker(job: Tuple[str, Optional[str]]) -> Converted:
+    rel, known_digest = job
+    return convert_file(
+        rel,
+        _worker_state['input_path'],
+        _worker_state['output_path'],
+        _worker_state['parser'],
+        _worker_state['renderer'],
+        known_digest,
+        _worker_state['template'],
+        _worker_state['profiler'],
+        _worker_state['outputs'],
+    )
+
+def _profile_in_worker(job: Tuple[str, Optional[str]]) -> Tuple[Converted, tuple]:
+    """Like `_convert_in_worker`, also handing back what the worker's profiler recorded."""
+    result = _convert_in_worker(job)
+    return result, _worker_state['profiler'].drain()
+
+def _chunk_size(total: int, workers: int) -> int:
+    # A few chunks per worker keeps the pool balanced without paying
+    # one IPC round trip per note.
+    return max(1, total // (workers * 4))
+
+def convert_all(input_dir: str, output_dir: str, workers: Optional[int] = 1, incremental: bool = True,
+                inline_css: bool = False, profiler: Optional[Profiler] = None, outputs: Sequence[str] = ("html",),
+                search_index: bool = False, shard: Optional[Tuple[int, int]] = None,
+                memory_budget: Optional[int] = None):
+    """
+    Converts every note under `input_dir` to HTML in `output_dir`.
+
+    `workers` > 1 fans the files out to a process pool (None uses every core).
+    Output files and progress lines are identical to the serial path.
+
+    With `incremental`, a build manifest in `output_dir` is used to skip notes
+    whose content has not changed and to delete pages of removed notes.
+
+    WikiLinks are resolved to the pages of the notes they name, and the link
+    graph is kept in a SQLite index in `output_dir` (see link_index.py).
+    When notes appear or disappear, pages linking to them are rebuilt.
+
+    The stylesheet is written once to a content-hashed file that every page
+    links to (see page_template.py); `inline_css` embeds it in each page instead.
+
+    A `profiler` records per-note phases, block processor calls and the
+    run-wide steps, including what worker processes did (see profiler.py).
+
+    `outputs` picks what is written per note (see OUTPUTS): any combination
+    costs one parse and one walk of its AST.
+
+    With `search_index`, a full-text index of the vault is kept in
+    `output_dir` (see search_index.py), updated from the notes converted in
+    this run. Runs without it delete the index, which they would leave
+    outdated.
+
+    With `shard` = (i, N), only the notes `shard_of` assigns to shard i are
+    converted, so N runs can build one vault side by side; links still
+    resolve against the whole vault. `shards.merge_shards` combines their
+    output directories.
+
+    A `memory_budget` (bytes) runs the low-memory mode of memory_budget.py:
+    notes too large for the budget are streamed, the garbage collector is
+    tuned around each note, and each note's peak RSS is reported. It needs
+    a serial run (`workers` = 1), as every worker process would add its own
+    resident set.
+    """
+    outputs = check_outputs(outputs)
+    input_path = Path(input_dir).expanduser()
+    output_path = Path(output_dir).expanduser()
+
+    # Ensure output directory exists
+    output_path.mkdir(parents=True, exist_ok=True)
+
+    profile = profiler is not None
+    if profiler is None:
+        profiler = NULL_PROFILER
+
+    print(f"Scanning {input_path} for markdown files...")
+    with profiler.run_phase("scan"):
+        sources = collect_sources(input_path)
+        own = sources
+        if shard is not None:
+            index, count = shard
+            own = [rel for rel in sources if shard_of(rel, count) == index]
+
+    if workers is None:
+        workers = os.cpu_count() or 1
+    if memory_budget is not None and workers > 1:
+        raise ValueError("A memory budget needs a serial run (workers=1)")
+    budget = MemoryBudget(memory_budget) if memory_budget is not None else None
+
+    parser = Parser()
+    if profile:
+        profiler.instrument(parser)
+    resolver = LinkResolver(sources)
+    renderer = make_renderer(resolver, outputs, search_index)
+    template = page_template(renderer, inline_css)
+    with profiler.run_phase("load_state"):
+        if "html" in outputs:
+            template.write_assets(output_path)
+        manifest = BuildManifest.load(output_path, build_key(renderer, template, outputs))
+        link_index = LinkIndex(os.path.join(output_path, LINKS_NAME))
+        if not incremental or link_index.created:
+            manifest.stale = True
+
+        # Notes that appeared or disappeared change how other notes' links
+        # resolve; the reverse edges say which pages have to be re-rendered.
+        known_notes = link_index.notes()
+        relinked = link_index.sources_linking_to(known_notes.symmetric_difference(sources)) if known_notes else set()
+
+        # The search index takes unchanged notes from its previous version;
+        # without one, every note has to be converted to index it.
+        search_path = os.path.join(output_path, SEARCH_INDEX_NAME)
+        search_base = None
+        search_builder = IndexBuilder() if search_index else None
+        if search_index:
+            try:
+                search_base = SearchIndex.open(search_path)
+            except (OSError, ValueError):
+                manifest.stale = True
+        elif os.path.exists(search_path):
+            os.unlink(search_path)
+
+    # Stat every source; anything whose mtime and size match the manifest
+    # is skipped without being opened.
+    jobs = []
+    stats = {}
+    with profiler.run_phase("stat"):
+        for rel in own:
+            st = os.stat(os.path.join(input_path, rel))
+            if rel in relinked:
+                stats[rel] = st
+                jobs.append((rel, None))
+                continue
+            if manifest.is_fresh(rel, st) and os.path.exists(output_file_for(rel, output_path, OUTPUTS[outputs[0]])):
+                continue
+            stats[rel] = st
+            jobs.append((rel, manifest.known_digest(rel)))
+
+    files_processed = 0
+
+    def record(rel: str, digest: str, converted: bool, links: List[str], terms: Optional[Dict[str, int]]):
+        nonlocal files_processed
+        manifest.record(rel, digest, stats[rel])
+        if converted:
+            print(f"Processing {rel}..." + (budget.describe(rel) if budget is not None else ""))
+            link_index.set_links(rel, links, resolver)
+            if search_builder is not None:
+                search_builder.add(rel, terms)
             files_processed += 1
-        
-    print(f"Done! Processed {files_processed} files. Check {output_path} for results.")
 
-if __name__ == "__main__":
+    try:
+        if budget is not None:
+            budget.start()
+            for rel, known_digest in jobs:
+                stream = budget.should_stream(stats[rel].st_size)
+                with budget.note(rel, stream):
+                    converted = convert_file(rel, input_path, output_path, parser, renderer, known_digest, template,
+                                             profiler if profile else None, outputs, stream)
+                record(rel, *converted)
+                del converted
+        elif workers <= 1 or len(jobs) <= 1:
+            for rel, known_digest in jobs:
+                record(rel, *convert_file(rel, input_path, output_path, parser, renderer, known_digest, template,
+                                          profiler if profile else None, outputs))
+        else:
+            with ProcessPoolExecutor(max_workers=workers, initializer=_init_worker,
+                                     initargs=(input_path, output_path, resolver, template, profile, outputs, search_index)) as pool:
+                # `map` yields results in submission order, so progress is reported
+                # in the same order as the serial loop regardless of completion order.
+                convert = _profile_in_worker if profile else _convert_in_worker
+                results = pool.map(convert, jobs, chunksize=_chunk_size(len(jobs), workers))
+                for (rel, _), result in zip(jobs, results):
+                    if profile:
+                        result, recorded = result
+                        profiler.merge(recorded)
+                    record(rel, *result)
+
+        with profiler.run_phase("save_state"):
+            removed = manifest.prune(own)
+            prune_outputs(removed, output_path)
+            # Every note of the vault, so a shard also notices notes
+            # appearing or disappearing in other shards
+            link_index.set_notes(sources)
+            if search_builder is not None:
+                search_builder.write(search_path, own, search_base)
+    finally:
+        if budget is not None:
+            budget.finish()
+        link_index.close()
+        if search_base is not None:
+            search_base.close()
+    with profiler.run_phase("save_state"):
+        manifest.save()
+
+    skipped = len(own) - files_processed
+    print(f"Done! Processed {files_processed} files ({skipped} unchanged, {len(removed)} removed). Check {output_path} for results.")
+    if budget is not None:
+        print(budget.report())
+
+def shard_arg(spec: str) -> Tuple[int, int]:
+    try:
+        return parse_shard(spec)
+    except ValueError as e:
+        raise argparse.ArgumentTypeError(str(e))
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Convert an Obsidian vault to HTML.")
     # You can configure these paths
-    INPUT_DIR = "~/Obsidian_Vault"
-    OUTPUT_DIR = "output_html"
-    
-    convert_all(INPUT_DIR, OUTPUT_DIR)
+    ap.add_argument("input_dir", nargs="?", default="~/Obsidian_Vault")
+    ap.add_argument("output_dir", nargs="?", default="output_html")
+    ap.add_argument("-j", "--workers", type=int, default=1,
+                    help="number of worker processes (0 = one per CPU core)")
+    ap.add_argument("--force", action="store_true",
+                    help="ignore the build manifest and reconvert every note")
+    ap.add_argument("--inline-css", action="store_true",
+                    help="embed the stylesheet in every page instead of linking a shared file")
+    ap.add_argument("--outputs", default="html",
+                    help="comma-separated outputs per note: html, text (.txt), search (.json); default: html")
+    ap.add_argument("--search-index", action="store_true",
+                    help=f"keep a full-text search index in output_dir/{SEARCH_INDEX_NAME} (see search_index.py)")
+    ap.add_argument("--shard", metavar="I/N", type=shard_arg,
+                    help="convert only shard I of N (0-based) of the notes; see shards.py to merge the shards")
+    ap.add_argument("--memory-budget", metavar="MB", type=float,
+                    help="low-memory mode: convert one note at a time, streaming notes too large for MB "
+                         "megabytes of RSS, and report each note's peak RSS (see memory_budget.py)")
+    ap.add_argument("--profile", action="store_true",
+                    help="print where the time went: per phase, per block processor and the slowest notes")
+    ap.add_argument("--trace", metavar="FILE",
+                    help="write a Chrome trace-event JSON timeline of the run to FILE (implies --profile)")
+    return ap
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    profiler = Profiler() if args.profile or args.trace else None
+    convert_all(args.input_dir, args.output_dir, workers=args.workers or None, incremental=not args.force,
+                inline_css=args.inline_css, profiler=profiler, outputs=args.outputs.split(","),
+                search_index=args.search_index, shard=args.shard,
+                memory_budget=int(args.memory_budget * 1024 * 1024) if args.memory_budget else None)
+    if profiler is not None:
+        print(profiler.report())
+        if args.trace:
+            profiler.write_trace(args.trace)
+            print(f"Trace written to {args.trace}")
@@ -0,0 +1,5 @@
+"""
+Performance harness. Run modules from the repository root, e.g.
+
+    python -m bench.parallel
+"""
@@ -0,0 +1,42 @@
+"""Reloading stored ASTs vs. re-parsing the markdown: ast_codec.load against Parser.parse and pickle, with sizes."""
+import argparse
+import pickle
+
+from ast_codec import dump, load
+from md_parser import Parser
+from bench.timing import best_of
+from bench.vault import VaultSpec, make_note
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=500)
+    ap.add_argument("--note-bytes", type=int, default=4000)
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    spec = VaultSpec(notes=args.notes, note_bytes=args.note_bytes)
+    texts = [make_note(spec, i) for i in range(args.notes)]
+    parser = Parser()
+    docs = [parser.parse(text) for text in texts]
+    blobs = [dump(doc) for doc in docs]
+    pickles = [pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL) for doc in docs]
+    assert all(load(blob) == doc for blob, doc in zip(blobs, docs))
+
+    source_bytes = sum(len(text.encode("utf-8")) for text in texts)
+    rows = [
+        ("parse markdown", best_of(lambda: [parser.parse(text) for text in texts], args.runs), source_bytes),
+        ("ast_codec.load", best_of(lambda: [load(blob) for blob in blobs], args.runs), sum(map(len, blobs))),
+        ("pickle.loads", best_of(lambda: [pickle.loads(blob) for blob in pickles], args.runs), sum(map(len, pickles))),
+    ]
+    dump_time = best_of(lambda: [dump(doc) for doc in docs], args.runs)
+    pickle_time = best_of(lambda: [pickle.dumps(doc, protocol=pickle.HIGHEST_PROTOCOL) for doc in docs], args.runs)
+
+    parse_time = rows[0][1]
+    print(f"{args.notes} notes")
+    print(f"{'':<16}{'time':>10}{'vs parse':>10}{'bytes':>12}")
+    for name, seconds, size in rows:
+        print(f"{name:<16}{seconds * 1000:>8.1f}ms{parse_time / seconds:>9.2f}x{size:>12,}")
+    print(f"dump: {dump_time * 1000:.1f}ms, pickle.dumps: {pickle_time * 1000:.1f}ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,26 @@
+"""Lines per second through the block pass (no inline parsing)."""
+import argparse
+
+from block_processors import LineReader
+from md_parser import Parser
+from bench.timing import best_of
+from bench.vault import NOTE
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=20000, help="copies of the sample note in the document")
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    lines = (NOTE.format(i=0, j=1) * args.repeat).split("\n")
+    parser = Parser()
+
+    def block_pass():
+        for _ in parser._iter_blocks(LineReader(lines)):
+            pass
+    best = best_of(block_pass, args.rounds)
+
+    print(f"lines={len(lines)} best={best:.3f}s  {len(lines) / best:,.0f} lines/s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+"""Parse time with and without CachingParser (and with its fragment cache only): templated daily notes, notes parsed twice, and unique notes (the miss overhead)."""
+import argparse
+import random
+
+from md_parser import Parser
+from parse_cache import CachingParser
+from bench.timing import best_interleaved
+from bench.vault import VaultSpec, make_note
+
+TEMPLATE = """---
+tags: [daily]
+---
+# {date}
+## Tasks
+- [ ] Review inbox
+- [ ] Plan the day
+- [ ] Water the plants
+{tasks}
+## Log
+{log}
+## Links
+- [[Weekly review]]
+- [[Projects]]
+"""
+
+def daily_note(rng: random.Random, i: int) -> str:
+    tasks = "\n".join(f"- [ ] Follow up on *item {rng.randrange(50)}*" for _ in range(rng.randint(1, 4)))
+    log = "\n".join(f"Worked on `task-{rng.randrange(1000)}` with [[Person {rng.randrange(20)}]]."
+                    for _ in range(rng.randint(2, 6)))
+    return TEMPLATE.format(date=f"2024-{i // 28 % 12 + 1:02d}-{i % 28 + 1:02d}", tasks=tasks, log=log)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=1000)
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    rng = random.Random(0)
+    daily = [daily_note(rng, i) for i in range(args.notes)]
+    unique = [make_note(VaultSpec(notes=args.notes), i) for i in range(args.notes)]
+
+    def parse_all(make_parser, notes, passes=1):
+        def run():
+            parser = make_parser()
+            for _ in range(passes):
+                for text in notes:
+                    parser.parse(text)
+        return run
+
+    variants = {"plain": Parser, "cached": CachingParser,
+                "fragments": lambda: CachingParser(max_documents=0, max_fragments=65536)}
+    print(f"{'workload':<28}{'Parser':>10}{'Caching':>10}{'fragments':>11}")
+    for name, notes, passes in (("daily notes", daily, 1), ("daily notes, parsed twice", daily, 2),
+                                ("unique notes", unique, 1), ("unique notes, parsed twice", unique, 2)):
+        best = best_interleaved({variant: parse_all(make_parser, notes, passes)
+                                 for variant, make_parser in variants.items()}, args.runs)
+        plain, cached, fragments = best["plain"], best["cached"], best["fragments"]
+        print(f"{name:<28}{plain * 1000:>8.0f}ms{cached * 1000:>8.0f}ms{fragments * 1000:>9.0f}ms")
+
+    parser = CachingParser()
+    for text in daily:
+        parser.parse(text)
+    for cache, stats in parser.stats().items():
+        print(f"{cache}: {stats['hits']} hits, {stats['misses']} misses, {stats['entries']} entries, {stats['bytes']:,} bytes")
+
+if __name__ == "__main__":
+    main()
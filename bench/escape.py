@@ -0,0 +1,43 @@
+"""Cost of HTML escaping in `render()`: escaped vs. raw output for prose and code-heavy notes, and a large code block rendered again (escape cache hit)."""
+import argparse
+
+from md_parser import Parser
+from renderer import HTMLRenderer
+from bench.timing import best_interleaved, best_of
+from bench.vault import VaultSpec, make_note
+
+class RawRenderer(HTMLRenderer):
+    """The renderer as it was before escaping: text goes out verbatim."""
+    def visit_Text(self, node):
+        return node.content or ""
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=500)
+    ap.add_argument("--runs", type=int, default=7)
+    args = ap.parse_args()
+
+    parser = Parser()
+    print(f"{'workload':<34}{'raw':>9}{'escaped':>10}{'overhead':>10}")
+    for name, code_ratio in (("prose (15% code blocks)", 0.15), ("code-heavy (60% code blocks)", 0.6)):
+        spec = VaultSpec(notes=args.notes, code_ratio=code_ratio, list_ratio=0.1)
+        docs = [parser.parse(make_note(spec, i).replace(" * ", " < ")) for i in range(args.notes)]
+
+        def render_all(renderer):
+            return lambda: [renderer.render(doc) for doc in docs]
+        best = best_interleaved({"raw": render_all(RawRenderer()), "escaped": render_all(HTMLRenderer())}, args.runs)
+        raw, escaped = best["raw"], best["escaped"]
+        print(f"{name:<34}{raw * 1000:>7.1f}ms{escaped * 1000:>8.1f}ms{escaped / raw - 1:>+10.1%}")
+
+    code = "".join(f"if (a_{n} < b && c > d) {{ s = \"x\"; }}\n" for n in range(5000))
+    doc = parser.parse(f"```c\n{code}```\n")
+    raw = best_of(lambda: RawRenderer().render(doc), args.runs)
+    first = best_of(lambda: HTMLRenderer().render(doc), args.runs)
+    renderer = HTMLRenderer()
+    renderer.render(doc)
+    again = best_of(lambda: renderer.render(doc), args.runs)
+    print(f"\n{len(code) / 1000:.0f} KB code block: raw {raw * 1000:.2f}ms, escaped {first * 1000:.2f}ms, "
+          f"escaped again (cached) {again * 1000:.2f}ms")
+
+if __name__ == "__main__":
+    main()
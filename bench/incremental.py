@@ -0,0 +1,40 @@
+"""Full conversion vs. a no-op incremental rebuild of the same vault."""
+import argparse
+import contextlib
+import io
+import tempfile
+import time
+from pathlib import Path
+
+from batch_converter import convert_all
+from bench.vault import make_vault
+
+def timed_build(vault: Path, out: Path, **kwargs) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_all(str(vault), str(out), **kwargs)
+    return time.perf_counter() - start
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=10000)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        out = Path(tmp) / "out"
+        make_vault(vault, args.notes, repeat=5)
+        full = timed_build(vault, out)
+        noop = timed_build(vault, out)
+        (vault / "note_00000.md").write_text("# Edited\n", encoding="utf-8")
+        one = timed_build(vault, out)
+        forced = timed_build(vault, out, incremental=False)
+
+    print(f"notes={args.notes + 1}")
+    print(f"first build:      {full:.3f}s")
+    print(f"no-op rebuild:    {noop:.3f}s")
+    print(f"one note changed: {one:.3f}s")
+    print(f"forced rebuild:   {forced:.3f}s")
+
+if __name__ == "__main__":
+    main()
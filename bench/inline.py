@@ -0,0 +1,60 @@
+"""Inline parsing time of the delimiter-stack scanner vs. the previous combined regex, on typical and worst-case paragraphs."""
+import argparse
+import re
+
+from ast_nodes import Bold, InlineCode, Italic, Text, WikiLink
+from inline_parser import InlineParser
+from bench.timing import best_of
+from bench.vault import VaultSpec, make_note
+
+# The previous tokenizer: five alternated patterns with lazy bodies.
+TOKEN_RE = re.compile(r'(`([^`]+)`)|(\[\[(.*?)(?:\|(.*?))?\]\])|(__(\S.+?)__)|(\*(.+?)\*)|(_(.+?)_)')
+
+def regex_parse(text: str) -> list:
+    nodes = []
+    last = 0
+    for match in TOKEN_RE.finditer(text):
+        start, end = match.span()
+        if start > last:
+            nodes.append(Text(text[last:start]))
+        if match.group(1):
+            node = InlineCode()
+            node.add(Text(match.group(2)))
+        elif match.group(3):
+            node = WikiLink(match.group(4), match.group(5))
+        else:
+            group = 7 if match.group(6) else 9 if match.group(8) else 11
+            node = Bold() if group == 7 else Italic()
+            node.add(Text(match.group(group)))
+        nodes.append(node)
+        last = end
+    if last < len(text):
+        nodes.append(Text(text[last:]))
+    return nodes
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--size", type=int, default=20000, help="characters per worst-case paragraph")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    typical = [line for i in range(200) for line in make_note(VaultSpec(notes=200), i).split("\n") if line]
+    n = args.size
+    cases = {
+        "typical notes": typical,
+        "unclosed [[": ["[[x " * (n // 4)],
+        "unclosed `": ["a ` " + "b " * (n // 2)],
+        "lone * per word": ["*a " * (n // 3)],
+        "mixed unmatched": ["[[ *a _b `c " * (n // 12)],
+        "nested emphasis": ["*a __b *c* d__ e* " * (n // 18)],
+    }
+    parser = InlineParser()
+    print(f"{'input':<18}{'chars':>9}{'regex':>11}{'scanner':>11}")
+    for name, lines in cases.items():
+        chars = sum(map(len, lines))
+        old = best_of(lambda: [regex_parse(line) for line in lines], args.runs)
+        new = best_of(lambda: [parser.parse(line) for line in lines], args.runs)
+        print(f"{name:<18}{chars:>9,}{old * 1000:>9.1f}ms{new * 1000:>9.1f}ms")
+
+if __name__ == "__main__":
+    main()
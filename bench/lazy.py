@@ -0,0 +1,36 @@
+"""Heading-outline extraction: eager `parse()` vs. `parse(lazy=True)` vs. the block pass alone."""
+import argparse
+
+from ast_nodes import Heading
+from block_processors import LineReader
+from md_parser import Parser
+from bench.timing import best_of
+from bench.vault import NOTE
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=5000, help="copies of the sample note in the document")
+    ap.add_argument("--rounds", type=int, default=5)
+    args = ap.parse_args()
+
+    text = NOTE.format(i=0, j=1) * args.repeat
+    parser = Parser()
+
+    def eager_outline():
+        doc = parser.parse(text)
+        return [(h.level, len(h.children)) for h in doc.children if isinstance(h, Heading)]
+
+    def lazy_outline():
+        doc = parser.parse(text, lazy=True)
+        return [(h.level, h.raw_text) for h in doc.children if isinstance(h, Heading)]
+
+    def block_pass():
+        for _ in parser._iter_blocks(LineReader(text.split("\n"))):
+            pass
+
+    print(f"eager parse + outline: {best_of(eager_outline, args.rounds):.3f}s")
+    print(f"lazy parse + outline:  {best_of(lazy_outline, args.rounds):.3f}s")
+    print(f"block pass only:       {best_of(block_pass, args.rounds):.3f}s")
+
+if __name__ == "__main__":
+    main()
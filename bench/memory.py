@@ -0,0 +1,103 @@
+"""
+Peak RSS and time of convert_all on a vault with a few oversized notes: the
+default mode vs. the low-memory mode (memory_budget.py). Each run gets a
+fresh process, so peaks do not carry over.
+"""
+import argparse
+import contextlib
+import io
+import json
+import os
+import resource
+import shutil
+import subprocess
+import sys
+import tempfile
+import time
+from pathlib import Path
+
+from bench.vault import NOTE, VaultSpec, make_synthetic_vault
+
+MB = 1024 * 1024
+
+def child(vault: str, out: str, budget_mb: float):
+    from batch_converter import convert_all
+    from memory_budget import MemoryBudget
+    budgets = []
+    if budget_mb:
+        # Keep hold of the run's budget to report its per-note peaks
+        original = MemoryBudget.__init__
+        def init(self, limit):
+            original(self, limit)
+            budgets.append(self)
+        MemoryBudget.__init__ = init
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_all(vault, out, incremental=False, memory_budget=int(budget_mb * MB) if budget_mb else None)
+    elapsed = time.perf_counter() - start
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss * 1024
+    report = {"seconds": elapsed, "peak": peak}
+    if budgets:
+        budget = budgets[0]
+        report.update(baseline=budget.baseline, streamed=sorted(budget.streamed), peaks=budget.peaks)
+    print(json.dumps(report))
+
+def run(vault: Path, out: str, budget_mb: float) -> dict:
+    shutil.rmtree(out, ignore_errors=True)
+    cmd = [sys.executable, "-m", "bench.memory", "--child", str(vault), out, str(budget_mb)]
+    return json.loads(subprocess.run(cmd, check=True, capture_output=True, text=True).stdout)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=2000)
+    ap.add_argument("--big", type=int, default=2, help="number of oversized notes")
+    ap.add_argument("--big-mb", type=float, default=20, help="size of each oversized note")
+    ap.add_argument("--budget-mb", type=float, default=96)
+    ap.add_argument("--runs", type=int, default=2)
+    ap.add_argument("--child", nargs=3, help=argparse.SUPPRESS)
+    args = ap.parse_args()
+    if args.child:
+        child(args.child[0], args.child[1], float(args.child[2]))
+        return
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        make_synthetic_vault(vault, VaultSpec(notes=args.notes))
+        chunk = NOTE.format(i=0, j=1)
+        big_sizes = {}
+        for n in range(args.big):
+            path = vault / f"big_{n}.md"
+            with open(path, "w", encoding="utf-8") as f:
+                for _ in range(int(args.big_mb * MB / len(chunk))):
+                    f.write(chunk)
+            big_sizes[path.name] = path.stat().st_size
+        out = os.path.join(tmp, "out")
+
+        default = low = None
+        for _ in range(args.runs):
+            # Interleaved, so drift on a busy machine hits both alike
+            d = run(vault, out, 0)
+            l = run(vault, out, args.budget_mb)
+            if default is None or d["seconds"] < default["seconds"]:
+                default = d
+            if low is None or l["seconds"] < low["seconds"]:
+                low = l
+        # No streaming: how much each note costs converted whole
+        whole = run(vault, out, 1e6)
+
+    print(f"notes={args.notes} + {args.big} x {args.big_mb:.0f} MB, budget {args.budget_mb:.0f} MB")
+    print(f"default:     {default['seconds']:6.2f}s  peak RSS {default['peak'] / MB:7.1f} MB")
+    print(f"low-memory:  {low['seconds']:6.2f}s  peak RSS {low['peak'] / MB:7.1f} MB  "
+          f"({len(low['streamed'])} streamed, baseline {low['baseline'] / MB:.1f} MB)")
+    peaks = low["peaks"]
+    small = sorted(peak for rel, peak in peaks.items() if rel not in big_sizes)
+    print(f"per-note peak RSS, low-memory: median {small[len(small) // 2] / MB:.1f} MB, "
+          f"max {small[-1] / MB:.1f} MB (regular), "
+          + ", ".join(f"{rel} {peaks[rel] / MB:.1f} MB" for rel in big_sizes))
+    for rel, size in big_sizes.items():
+        overhead = (whole["peaks"][rel] - whole["baseline"]) / size
+        print(f"{rel} converted whole: peak RSS {whole['peaks'][rel] / MB:.1f} MB, "
+              f"{overhead:.1f} bytes per source byte over the baseline")
+
+if __name__ == "__main__":
+    main()
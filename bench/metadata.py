@@ -0,0 +1,45 @@
+"""Front-matter index of a vault: fast scan vs. full `Parser.parse` of every note."""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from batch_converter import collect_sources
+from md_parser import Parser
+from metadata_index import build_metadata_index
+from bench.vault import make_vault
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=20000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        make_vault(vault, args.notes, repeat=5)
+        build_metadata_index(str(vault)) # Warm the page cache
+
+        start = time.perf_counter()
+        index = build_metadata_index(str(vault))
+        scan = time.perf_counter() - start
+
+        start = time.perf_counter()
+        index_parallel = build_metadata_index(str(vault), workers=args.workers)
+        parallel = time.perf_counter() - start
+        assert index == index_parallel
+
+        parser = Parser()
+        start = time.perf_counter()
+        for rel in collect_sources(vault):
+            parser.parse((vault / rel).read_text(encoding="utf-8"))
+        full = time.perf_counter() - start
+
+    print(f"notes={args.notes + 1} indexed={len(index)}")
+    print(f"front-matter scan:          {scan:.3f}s")
+    print(f"front-matter scan, j={args.workers:<3}    {parallel:.3f}s")
+    print(f"full parse of every note:   {full:.3f}s")
+
+if __name__ == "__main__":
+    main()
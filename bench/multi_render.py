@@ -0,0 +1,63 @@
+"""One MultiRenderer walk vs. a walk per output (HTML, plain text, TOC, links), and the cost of the fused renderer for HTML alone."""
+import argparse
+
+from link_index import collect_links
+from md_parser import Parser
+from renderer import HTMLRenderer, MultiRenderer
+from bench.timing import best_interleaved
+from bench.vault import VaultSpec, make_note
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=1000)
+    ap.add_argument("--runs", type=int, default=7)
+    args = ap.parse_args()
+
+    spec = VaultSpec(notes=args.notes)
+    parser = Parser()
+    docs = [parser.parse(make_note(spec, i)) for i in range(args.notes)]
+    html = HTMLRenderer()
+    text = MultiRenderer(outputs=("text",))
+    toc = MultiRenderer(outputs=("toc",))
+    fused = MultiRenderer()
+    html_links = MultiRenderer(outputs=("html", "links"))
+
+    def separate():
+        for doc in docs:
+            html.render(doc)
+            text.render_all(doc)
+            toc.render_all(doc)
+            collect_links(doc)
+
+    def one_walk():
+        for doc in docs:
+            fused.render_all(doc)
+
+    def html_then_links():
+        # What convert_file did before: render, then collect_links
+        for doc in docs:
+            html.render(doc)
+            collect_links(doc)
+
+    def html_and_links():
+        for doc in docs:
+            html_links.render_all(doc)
+
+    def html_only():
+        for doc in docs:
+            html.render(doc)
+
+    timings = best_interleaved({"separate": separate, "one_walk": one_walk, "html_then_links": html_then_links,
+                                "html_and_links": html_and_links, "html_only": html_only}, args.runs)
+
+    ms = {name: seconds * 1000 for name, seconds in timings.items()}
+    print(f"{args.notes} notes")
+    print(f"HTML + text + TOC + links, a walk each:  {ms['separate']:7.1f} ms")
+    print(f"HTML + text + TOC + links, one walk:     {ms['one_walk']:7.1f} ms  ({ms['one_walk'] / ms['separate'] - 1:+.0%})")
+    print(f"HTML, then collect_links:                {ms['html_then_links']:7.1f} ms")
+    print(f"HTML + links, one walk:                  {ms['html_and_links']:7.1f} ms  "
+          f"({ms['html_and_links'] / ms['html_then_links'] - 1:+.0%})")
+    print(f"HTML alone (HTMLRenderer):               {ms['html_only']:7.1f} ms")
+
+if __name__ == "__main__":
+    main()
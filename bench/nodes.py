@@ -0,0 +1,44 @@
+"""Retained memory per AST node after parsing a large document."""
+import argparse
+import gc
+import time
+import tracemalloc
+from collections import Counter
+
+from md_parser import Parser
+from bench.vault import NOTE
+
+def walk(node):
+    stack = [node]
+    while stack:
+        node = stack.pop()
+        yield node
+        stack.extend(node.children)
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=5000, help="copies of the sample note in the document")
+    ap.add_argument("--spans", action="store_true", help="parse with SourceText spans instead of substrings")
+    args = ap.parse_args()
+
+    text = NOTE.format(i=0, j=1) * args.repeat
+    parser = Parser()
+    parser.parse("warm *up*")
+
+    start = time.perf_counter()
+    parser.parse(text, spans=args.spans)
+    elapsed = time.perf_counter() - start
+
+    gc.collect()
+    tracemalloc.start()
+    doc = parser.parse(text, spans=args.spans)
+    retained, _ = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+
+    counts = Counter(type(n).__name__ for n in walk(doc))
+    nodes = sum(counts.values())
+    print(f"nodes={nodes} retained={retained / 2**20:.1f} MB  per-node={retained / nodes:.0f} B  parse={elapsed:.3f}s")
+    print("  " + ", ".join(f"{name}={count}" for name, count in counts.most_common()))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,37 @@
+"""Throughput of `convert_all` serial loop vs. the process-pool path."""
+import argparse
+import contextlib
+import io
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from batch_converter import convert_all
+from bench.vault import make_vault
+
+def time_convert(vault: Path, out: Path, workers) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        convert_all(str(vault), str(out), workers=workers)
+    return time.perf_counter() - start
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=2000)
+    ap.add_argument("--workers", type=int, default=os.cpu_count() or 1)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        make_vault(vault, args.notes)
+        serial = time_convert(vault, Path(tmp) / "serial", 1)
+        parallel = time_convert(vault, Path(tmp) / "parallel", args.workers)
+
+    print(f"notes={args.notes + 1} cpus={os.cpu_count()}")
+    print(f"serial:           {serial:.3f}s  {(args.notes + 1) / serial:,.0f} notes/s")
+    print(f"workers={args.workers:<3}       {parallel:.3f}s  {(args.notes + 1) / parallel:,.0f} notes/s")
+    print(f"speedup:          {serial / parallel:.2f}x")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,58 @@
+"""Peak memory and time of `render()` + write vs. streaming `render_to()` for a large document."""
+import argparse
+import os
+import tempfile
+import time
+import tracemalloc
+
+from md_parser import Parser
+from renderer import HTMLRenderer
+from bench.vault import NOTE
+
+def measure(fn, trace: bool):
+    if trace:
+        tracemalloc.start()
+    start = time.perf_counter()
+    fn()
+    elapsed = time.perf_counter() - start
+    peak = 0
+    if trace:
+        _, peak = tracemalloc.get_traced_memory()
+        tracemalloc.stop()
+    return elapsed, peak
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=20000, help="copies of the sample note in the document")
+    args = ap.parse_args()
+
+    doc = Parser().parse(NOTE.format(i=0, j=1) * args.repeat)
+    renderer = HTMLRenderer()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        path = os.path.join(tmp, "out.html")
+
+        def whole():
+            html = renderer.render(doc)
+            with open(path, "w", encoding="utf-8") as f:
+                f.write(f"<html><body>{html}</body></html>")
+
+        def streamed():
+            with open(path, "w", encoding="utf-8") as f:
+                f.write("<html><body>")
+                renderer.render_to(doc, f)
+                f.write("</body></html>")
+
+        # Time without tracemalloc overhead, then measure peak separately.
+        t_whole, _ = measure(whole, False)
+        t_stream, _ = measure(streamed, False)
+        _, peak_whole = measure(whole, True)
+        _, peak_stream = measure(streamed, True)
+        size = os.path.getsize(path) / 2**20
+
+    print(f"html={size:.1f} MB")
+    print(f"render() + write:  {t_whole:.3f}s  peak {peak_whole / 2**20:7.1f} MB")
+    print(f"render_to(file):   {t_stream:.3f}s  peak {peak_stream / 2**20:7.1f} MB")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+"""Keystroke latency in a large note: full parse + render vs. Parser.reparse + HTMLRenderer.update_blocks."""
+import argparse
+import random
+import statistics
+import time
+
+from md_parser import Parser
+from renderer import HTMLRenderer
+from bench.vault import VaultSpec, make_note
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=100, help="synthetic notes concatenated into one document")
+    ap.add_argument("--edits", type=int, default=200)
+    args = ap.parse_args()
+
+    spec = VaultSpec(notes=args.notes, front_matter=False)
+    text = "\n".join(make_note(spec, i) for i in range(args.notes))
+    parser = Parser()
+    renderer = HTMLRenderer()
+    rng = random.Random(0)
+
+    start = time.perf_counter()
+    doc = parser.parse(text)
+    blocks = renderer.render_blocks(doc)
+    full_ms = (time.perf_counter() - start) * 1000
+
+    reparse_ms, update_ms, reparsed = [], [], []
+    for _ in range(args.edits):
+        # Type a character somewhere, as an editor would on a keystroke
+        at = rng.randrange(len(text))
+        new_text = text[:at] + rng.choice("abc *_`\n") + text[at:]
+        start = time.perf_counter()
+        edit = parser.reparse(doc, text, new_text)
+        middle = time.perf_counter()
+        renderer.update_blocks(blocks, edit)
+        html = "".join(blocks)
+        end = time.perf_counter()
+        reparse_ms.append((middle - start) * 1000)
+        update_ms.append((end - middle) * 1000)
+        reparsed.append(edit.end - edit.start)
+        doc, text = edit.doc, new_text
+
+    assert html == renderer.render(parser.parse(text))
+    print(f"document: {len(text):,} chars, {len(doc.children):,} top-level blocks")
+    print(f"full parse + render:        {full_ms:8.1f} ms")
+    print(f"reparse:                    {statistics.median(reparse_ms):8.2f} ms median, {max(reparse_ms):.2f} ms max")
+    print(f"update_blocks + join:       {statistics.median(update_ms):8.2f} ms median, {max(update_ms):.2f} ms max")
+    print(f"blocks re-parsed per edit:  {statistics.median(reparsed):8.0f} median, {max(reparsed)} max")
+
+if __name__ == "__main__":
+    main()
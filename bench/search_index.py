@@ -0,0 +1,71 @@
+"""Cost of keeping the search index during convert_all (full and incremental builds), index size, and query latency."""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from batch_converter import convert_all
+from search_index import SEARCH_INDEX_NAME, SearchIndex
+from bench.vault import VaultSpec, make_synthetic_vault
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    return time.perf_counter() - start
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=2000)
+    ap.add_argument("--edits", type=int, default=20, help="notes changed before the incremental build")
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        spec = VaultSpec(notes=args.notes)
+        make_synthetic_vault(vault, spec)
+        plain_out, index_out = os.path.join(tmp, "plain"), os.path.join(tmp, "indexed")
+
+        full_plain = full_index = incr_plain = incr_index = float("inf")
+        for run in range(args.runs):
+            # Interleaved, so drift on a busy machine hits both alike
+            for out in (plain_out, index_out):
+                shutil.rmtree(out, ignore_errors=True)
+            full_plain = min(full_plain, timed(lambda: convert_all(str(vault), plain_out)))
+            full_index = min(full_index, timed(lambda: convert_all(str(vault), index_out, search_index=True)))
+            for n in range(args.edits):
+                with open(vault / spec.note_path(n), "a", encoding="utf-8") as f:
+                    f.write(f"\nEdited in run {run} with **extra** words.\n")
+            incr_plain = min(incr_plain, timed(lambda: convert_all(str(vault), plain_out)))
+            incr_index = min(incr_index, timed(lambda: convert_all(str(vault), index_out, search_index=True)))
+
+        path = os.path.join(index_out, SEARCH_INDEX_NAME)
+        source_bytes = sum(p.stat().st_size for p in vault.rglob("*.md"))
+        start = time.perf_counter()
+        index = SearchIndex.open(path)
+        open_ms = (time.perf_counter() - start) * 1000
+        queries = ["garden", "project review", "inline token stream cache", "edited extra", "not-there"]
+        start = time.perf_counter()
+        for _ in range(20):
+            for query in queries:
+                index.search(query)
+        query_ms = (time.perf_counter() - start) * 1000 / (20 * len(queries))
+        top = index.search(queries[1], 3)
+        terms = index.term_count
+        index.close()
+        index_bytes = os.path.getsize(path)
+
+    print(f"notes={args.notes + spec.folders}, {source_bytes / 1e6:.1f} MB of markdown")
+    print(f"full build:        {full_plain:6.2f}s plain, {full_index:6.2f}s with index ({full_index / full_plain - 1:+.0%})")
+    print(f"{args.edits} notes changed: {incr_plain:6.2f}s plain, {incr_index:6.2f}s with index")
+    print(f"index: {index_bytes / 1e6:.2f} MB, {terms:,} terms; open {open_ms:.1f} ms, "
+          f"query {query_ms:.2f} ms on average")
+    print(f"top hits for {queries[1]!r}: " + ", ".join(f"{rel} ({score:.3f})" for rel, score in top))
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,109 @@
+"""
+Latency of one preview: a cold `python3` run that imports the parser and
+renderer and converts the note, vs. the conversion server (server.py) reached
+through `python3 client.py`, and from a process that keeps a Client open.
+"""
+import argparse
+import os
+import statistics
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+from pathlib import Path
+
+from client import Client
+from server import ConversionServer
+from bench.vault import VaultSpec, make_note
+
+# What an editor plugin ran per preview before the server existed
+COLD = """
+import sys
+from md_parser import Parser
+from renderer import HTMLRenderer
+with open(sys.argv[1], encoding="utf-8") as f:
+    sys.stdout.write(HTMLRenderer().render(Parser().parse(f.read())))
+"""
+
+def timings(fn, runs: int) -> list:
+    result = []
+    for _ in range(runs):
+        start = time.perf_counter()
+        fn()
+        result.append((time.perf_counter() - start) * 1000)
+    return result
+
+def summary(name: str, ms: list, per: int = 1) -> str:
+    ms = sorted(t / per for t in ms)
+    p95 = ms[min(len(ms) - 1, int(len(ms) * 0.95))]
+    return f"{name:34s} median {statistics.median(ms):7.2f} ms   p95 {p95:7.2f} ms"
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--runs", type=int, default=30, help="runs of each subprocess variant")
+    ap.add_argument("--requests", type=int, default=300, help="requests over an open connection")
+    ap.add_argument("--batch", type=int, default=10, help="notes per batched request")
+    ap.add_argument("--clients", type=int, default=4, help="concurrent clients")
+    args = ap.parse_args()
+
+    spec = VaultSpec(notes=args.batch)
+    notes = [make_note(spec, i) for i in range(args.batch)]
+    root = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+    env = dict(os.environ, PYTHONPATH=root)
+    with tempfile.TemporaryDirectory() as tmp:
+        note = Path(tmp) / "note.md"
+        note.write_text(notes[0], encoding="utf-8")
+        socket_path = os.path.join(tmp, "server.sock")
+        server = ConversionServer(socket_path)
+        thread = threading.Thread(target=server.serve_forever, daemon=True)
+        thread.start()
+        try:
+            cold_cmd = [sys.executable, "-c", COLD, str(note)]
+            client_cmd = [sys.executable, os.path.join(root, "client.py"), "--socket", socket_path, str(note)]
+            expected = subprocess.run(cold_cmd, env=env, capture_output=True, text=True, check=True).stdout
+            assert subprocess.run(client_cmd, capture_output=True, text=True, check=True).stdout == expected
+
+            cold, thin = [], []
+            for _ in range(args.runs):
+                # Interleaved, so drift on a busy machine hits both alike
+                cold += timings(lambda: subprocess.run(cold_cmd, env=env, capture_output=True, check=True), 1)
+                thin += timings(lambda: subprocess.run(client_cmd, capture_output=True, check=True), 1)
+            bare = timings(lambda: subprocess.run([sys.executable, "-c", "pass"], check=True), args.runs)
+
+            with Client(socket_path) as client:
+                one = timings(lambda: client.convert([{"text": notes[0]}]), args.requests)
+                batch = timings(lambda: client.convert([{"text": text} for text in notes]),
+                                max(1, args.requests // args.batch))
+
+            concurrent = []
+            lock = threading.Lock()
+
+            def run_client():
+                with Client(socket_path) as client:
+                    ms = timings(lambda: client.convert([{"text": notes[0]}]), args.requests // args.clients)
+                with lock:
+                    concurrent.extend(ms)
+
+            threads = [threading.Thread(target=run_client) for _ in range(args.clients)]
+            start = time.perf_counter()
+            for t in threads:
+                t.start()
+            for t in threads:
+                t.join()
+            wall = time.perf_counter() - start
+        finally:
+            server.shutdown()
+            server.server_close()
+
+    print(f"note: {len(notes[0])} bytes; {os.cpu_count()} CPU(s)")
+    print(summary("cold python3 + import + convert", cold))
+    print(summary("python3 client.py (warm server)", thin))
+    print(summary("python3 -c pass (startup floor)", bare))
+    print(summary("open Client, one note/request", one))
+    print(summary(f"open Client, {args.batch} notes/request (per note)", batch, args.batch))
+    print(summary(f"{args.clients} concurrent clients", concurrent)
+          + f"   {len(concurrent) / wall:.0f} requests/s")
+
+if __name__ == "__main__":
+    main()
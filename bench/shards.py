@@ -0,0 +1,56 @@
+"""A single convert_all vs. the same vault as N local shards plus the merge, and what the merge alone costs."""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+import tempfile
+import time
+from pathlib import Path
+
+from batch_converter import convert_all
+from shards import build_shards, merge_shards
+from bench.vault import VaultSpec, make_synthetic_vault
+
+def timed(fn) -> float:
+    start = time.perf_counter()
+    with contextlib.redirect_stdout(io.StringIO()):
+        fn()
+    return time.perf_counter() - start
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=2000)
+    ap.add_argument("--shards", type=int, default=4)
+    ap.add_argument("--runs", type=int, default=3)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        make_synthetic_vault(vault, VaultSpec(notes=args.notes))
+        single_out, sharded_out = os.path.join(tmp, "single"), os.path.join(tmp, "sharded")
+        work_dir = os.path.join(tmp, "shards")
+        shard_dirs = [os.path.join(work_dir, str(i)) for i in range(args.shards)]
+
+        single = sharded = merge = remerge = float("inf")
+        for _ in range(args.runs):
+            # Interleaved, so drift on a busy machine hits both alike
+            for out in (single_out, sharded_out, work_dir):
+                shutil.rmtree(out, ignore_errors=True)
+            single = min(single, timed(lambda: convert_all(str(vault), single_out, search_index=True)))
+            sharded = min(sharded, timed(lambda: build_shards(str(vault), sharded_out, args.shards, work_dir,
+                                                              search_index=True)))
+            shutil.rmtree(sharded_out)
+            merge = min(merge, timed(lambda: merge_shards(shard_dirs, sharded_out)))
+            # Nothing changed: pages are skipped, state files are combined again
+            remerge = min(remerge, timed(lambda: merge_shards(shard_dirs, sharded_out)))
+
+    cpus = os.cpu_count() or 1
+    print(f"notes={args.notes}, shards={args.shards}, {cpus} CPU{'s' if cpus > 1 else ''}")
+    print(f"single build:            {single:6.2f}s")
+    print(f"{args.shards} local shards + merge:  {sharded:6.2f}s ({sharded / single - 1:+.0%})")
+    print(f"merge into empty site:   {merge:6.2f}s")
+    print(f"merge, nothing changed:  {remerge:6.2f}s")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,49 @@
+"""Peak memory and time of `Parser.parse` on a whole file vs. `Parser.parse_file` streaming."""
+import argparse
+import tempfile
+import time
+import tracemalloc
+from pathlib import Path
+
+from md_parser import Parser
+from bench.vault import NOTE
+
+def measure(fn):
+    tracemalloc.start()
+    start = time.perf_counter()
+    result = fn()
+    elapsed = time.perf_counter() - start
+    _, peak = tracemalloc.get_traced_memory()
+    tracemalloc.stop()
+    return result, elapsed, peak
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--mb", type=float, default=20)
+    args = ap.parse_args()
+
+    parser = Parser()
+    with tempfile.TemporaryDirectory() as tmp:
+        path = Path(tmp) / "big.md"
+        chunk = NOTE.format(i=0, j=1)
+        with open(path, "w", encoding="utf-8") as f:
+            for _ in range(int(args.mb * 1024 * 1024 / len(chunk))):
+                f.write(chunk)
+        size = path.stat().st_size / (1024 * 1024)
+
+        def whole():
+            return len(parser.parse(path.read_text(encoding="utf-8")).children)
+
+        def streamed():
+            return sum(1 for _ in parser.parse_file(path))
+
+        blocks, t_whole, peak_whole = measure(whole)
+        streamed_blocks, t_stream, peak_stream = measure(streamed)
+        assert blocks == streamed_blocks
+
+    print(f"file={size:.1f} MB blocks={blocks}")
+    print(f"parse(text):      {t_whole:.2f}s  peak {peak_whole / 2**20:8.1f} MB")
+    print(f"parse_file(path): {t_stream:.2f}s  peak {peak_stream / 2**20:8.1f} MB")
+
+if __name__ == "__main__":
+    main()
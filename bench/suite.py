@@ -0,0 +1,180 @@
+"""
+Benchmark suite over a synthetic vault, with results saved as JSON.
+
+    python -m bench.suite run --notes 2000 -o before.json
+    python -m bench.suite run --notes 2000 -o after.json
+    python -m bench.suite compare before.json after.json
+
+`run` times the block pass, the inline pass, rendering and an end-to-end
+`convert_all`, recording throughput and peak (traced) memory per phase.
+`compare` prints the change per phase and exits with status 1 if any phase
+got slower, or used more memory, than the threshold allows.
+"""
+import argparse
+import contextlib
+import dataclasses
+import io
+import json
+import os
+import platform
+import sys
+import tempfile
+import tracemalloc
+from pathlib import Path
+from typing import Callable, Dict, List, Optional, Tuple
+
+from ast_nodes import Document
+from batch_converter import collect_sources, convert_all, read_source
+from block_processors import LineReader
+from link_index import LinkResolver
+from md_parser import Parser
+from renderer import HTMLRenderer
+from bench.timing import best_of
+from bench.vault import VaultSpec, make_synthetic_vault
+
+RESULTS_FORMAT = 1
+
+def _peak_memory(fn: Callable[[], None], setup: Optional[Callable[[], None]] = None) -> int:
+    if setup is not None:
+        setup()
+    tracemalloc.start()
+    try:
+        fn()
+        return tracemalloc.get_traced_memory()[1]
+    finally:
+        tracemalloc.stop()
+
+def run_suite(spec: VaultSpec, runs: int = 5) -> dict:
+    """Builds the vault for `spec` in a temporary directory and measures every phase."""
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        size = make_synthetic_vault(vault, spec)
+        sources = collect_sources(vault)
+        texts = [read_source(vault / rel)[1] for rel in sources]
+
+        parser = Parser()
+        renderer = HTMLRenderer(LinkResolver(sources))
+        blocks: List[Document] = []
+        docs: List[Document] = []
+
+        def parse_blocks():
+            blocks.clear()
+            for text in texts:
+                doc = Document()
+                for block in parser._iter_blocks(LineReader(text.split("\n"))):
+                    doc.add(block)
+                blocks.append(doc)
+
+        def parse_inline():
+            for doc in blocks:
+                parser._process_inline_elements(doc)
+
+        def render():
+            for rel, doc in zip(sources, docs):
+                renderer.page = rel
+                renderer.render(doc)
+
+        def convert():
+            with contextlib.redirect_stdout(io.StringIO()):
+                convert_all(str(vault), os.path.join(tmp, "out"), workers=1, incremental=False)
+
+        def parse_all():
+            docs[:] = [parser.parse(text) for text in texts]
+
+        # name -> (untimed setup, timed phase). The inline pass rewrites the
+        # block trees in place, so each run starts from fresh ones.
+        phases: Dict[str, Tuple[Optional[Callable[[], None]], Callable[[], None]]] = {
+            "parse_blocks": (None, parse_blocks),
+            "parse_inline": (parse_blocks, parse_inline),
+            "render": (parse_all, render),
+            "convert_all": (None, convert),
+        }
+        results = {}
+        for name, (setup, fn) in phases.items():
+            seconds = best_of(fn, runs, setup)
+            results[name] = {
+                "seconds": seconds,
+                "mb_per_s": size / 2**20 / seconds if seconds else None,
+                "notes_per_s": len(sources) / seconds if seconds else None,
+                "peak_bytes": _peak_memory(fn, setup),
+            }
+            blocks.clear()
+            docs.clear()
+
+    return {
+        "format": RESULTS_FORMAT,
+        "spec": dataclasses.asdict(spec),
+        "notes": len(sources),
+        "input_bytes": size,
+        "python": platform.python_version(),
+        "platform": platform.platform(),
+        "runs": runs,
+        "phases": results,
+    }
+
+def compare(old: dict, new: dict, threshold: float = 0.1) -> List[str]:
+    """
+    Prints the per-phase change from `old` to `new` and returns the phases
+    whose time or peak memory grew by more than `threshold` (a fraction).
+    """
+    if old.get("spec") != new.get("spec"):
+        print("warning: the two runs used different vault specs")
+    regressions = []
+    print(f"{'phase':<14}{'old s':>10}{'new s':>10}{'time':>9}{'old MB':>10}{'new MB':>10}{'memory':>9}")
+    for name, before in old["phases"].items():
+        after = new["phases"].get(name)
+        if after is None:
+            continue
+        time_change = after["seconds"] / before["seconds"] - 1 if before["seconds"] else 0.0
+        memory_change = after["peak_bytes"] / before["peak_bytes"] - 1 if before["peak_bytes"] else 0.0
+        flag = ""
+        if time_change > threshold or memory_change > threshold:
+            regressions.append(name)
+            flag = "  REGRESSION"
+        print(f"{name:<14}{before['seconds']:>10.3f}{after['seconds']:>10.3f}{time_change:>+9.1%}"
+              f"{before['peak_bytes'] / 2**20:>10.1f}{after['peak_bytes'] / 2**20:>10.1f}{memory_change:>+9.1%}{flag}")
+    return regressions
+
+def main():
+    ap = argparse.ArgumentParser(description="Benchmark suite over a synthetic vault.")
+    commands = ap.add_subparsers(dest="command", required=True)
+
+    run = commands.add_parser("run", help="measure every phase and write the results as JSON")
+    defaults = VaultSpec()
+    for field in dataclasses.fields(VaultSpec):
+        flag = "--" + field.name.replace("_", "-")
+        default = getattr(defaults, field.name)
+        if field.type in (bool, "bool"):
+            run.add_argument(flag, type=lambda v: v.lower() in ("1", "true", "yes"), default=default)
+        else:
+            run.add_argument(flag, type=type(default), default=default)
+    run.add_argument("--runs", type=int, default=5, help="timed runs per phase (the best is kept)")
+    run.add_argument("-o", "--output", help="results file (default: print only)")
+
+    cmp = commands.add_parser("compare", help="flag regressions between two result files")
+    cmp.add_argument("old")
+    cmp.add_argument("new")
+    cmp.add_argument("--threshold", type=float, default=0.1,
+                     help="allowed slowdown or memory growth as a fraction (default 0.1)")
+    args = ap.parse_args()
+
+    if args.command == "run":
+        spec = VaultSpec(**{field.name: getattr(args, field.name) for field in dataclasses.fields(VaultSpec)})
+        results = run_suite(spec, runs=args.runs)
+        print(f"notes={results['notes']} input={results['input_bytes'] / 2**20:.1f} MB")
+        for name, phase in results["phases"].items():
+            print(f"{name:<14}{phase['seconds']:>8.3f}s {phase['mb_per_s'] or 0:>8.1f} MB/s "
+                  f"{phase['notes_per_s'] or 0:>9,.0f} notes/s  peak {phase['peak_bytes'] / 2**20:7.1f} MB")
+        if args.output:
+            with open(args.output, "w", encoding="utf-8") as f:
+                json.dump(results, f, indent=2)
+    else:
+        with open(args.old, encoding="utf-8") as f:
+            old = json.load(f)
+        with open(args.new, encoding="utf-8") as f:
+            new = json.load(f)
+        if compare(old, new, args.threshold):
+            sys.exit(1)
+
+if __name__ == "__main__":
+    main()
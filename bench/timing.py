@@ -0,0 +1,31 @@
+"""Timing helpers shared by the benchmarks."""
+import gc
+import time
+from typing import Callable, Dict, Optional
+
+def best_of(fn: Callable[[], object], runs: int, setup: Optional[Callable[[], object]] = None) -> float:
+    """
+    The fastest of `runs` calls of `fn`, in seconds. `setup` and a garbage
+    collection run untimed before each call, so garbage left by one call is
+    not collected during the next.
+    """
+    best = float("inf")
+    for _ in range(runs):
+        if setup is not None:
+            setup()
+        gc.collect()
+        start = time.perf_counter()
+        fn()
+        best = min(best, time.perf_counter() - start)
+    return best
+
+def best_interleaved(variants: Dict[str, Callable[[], object]], runs: int) -> Dict[str, float]:
+    """
+    `best_of` for each of `variants`, taking turns every round so drift on
+    a busy machine hits every variant alike.
+    """
+    best = {name: float("inf") for name in variants}
+    for _ in range(runs):
+        for name, fn in variants.items():
+            best[name] = min(best[name], best_of(fn, 1))
+    return best
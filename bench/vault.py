@@ -0,0 +1,113 @@
+"""Synthetic vaults for the benchmarks."""
+import random
+from dataclasses import dataclass
+from pathlib import Path
+from typing import List
+
+NOTE = """---
+title: Note {i}
+tags: [bench, parallel]
+---
+# Note {i}
+Some *italic* and __bold__ text with a [[Note {j}|link]] and `code`.
+
+- item one
+- item _two_
+- item three
+
+```python
+print({i})
+```
+"""
+
+def make_vault(root: Path, notes: int, repeat: int = 20):
+    root.mkdir(parents=True, exist_ok=True)
+    (root / "README.md").write_text("# Vault\n", encoding="utf-8")
+    for i in range(notes):
+        body = NOTE.format(i=i, j=(i + 1) % notes) * repeat
+        (root / f"note_{i:05d}.md").write_text(body, encoding="utf-8")
+
+WORDS = (
+    "vault note idea draft link graph daily review project garden index "
+    "markdown parser render block inline token stream cache page header "
+    "list item code sample value field tag title meta reference archive"
+).split()
+
+@dataclass
+class VaultSpec:
+    """
+    Shape of a synthetic vault. The same spec (including `seed`) always
+    produces byte-identical notes.
+    """
+    notes: int = 1000
+    note_bytes: int = 4000          # Approximate size of each note
+    inline_density: float = 0.1     # Fraction of words wrapped in *, __ or `
+    code_ratio: float = 0.15        # Fraction of blocks that are code blocks
+    list_ratio: float = 0.2         # Fraction of blocks that are lists
+    list_length: int = 5            # Items per list
+    front_matter: bool = True
+    fanout: int = 5                 # WikiLinks per note
+    folders: int = 1                # Notes are spread over this many directories
+    seed: int = 0
+
+    def note_path(self, i: int) -> str:
+        folder = i % self.folders
+        name = f"note_{i:05d}.md"
+        return name if folder == 0 else f"folder_{folder:02d}/{name}"
+
+def _sentence(rng: random.Random, spec: VaultSpec, links: List[str]) -> str:
+    words = []
+    for _ in range(rng.randint(6, 16)):
+        word = rng.choice(WORDS)
+        if rng.random() < spec.inline_density:
+            word = rng.choice(("*{}*", "__{}__", "`{}`", "_{}_")).format(word)
+        words.append(word)
+    if links:
+        words.insert(rng.randrange(len(words) + 1), links.pop())
+    text = " ".join(words)
+    return text[0].upper() + text[1:] + "."
+
+def make_note(spec: VaultSpec, i: int) -> str:
+    """Returns the markdown of note `i` of the vault described by `spec`."""
+    rng = random.Random(spec.seed * 1_000_003 + i)
+    links = []
+    for _ in range(spec.fanout if spec.notes > 1 else 0):
+        target = rng.randrange(spec.notes)
+        name = spec.note_path(target).rsplit("/", 1)[-1][:-len(".md")]
+        links.append(f"[[{name}|{rng.choice(WORDS)}]]" if rng.random() < 0.3 else f"[[{name}]]")
+
+    parts = []
+    if spec.front_matter:
+        parts.append(f"---\ntitle: Note {i}\ntags: [{rng.choice(WORDS)}, {rng.choice(WORDS)}]\ncreated: 2024-01-{i % 28 + 1:02d}\n---\n")
+    parts.append(f"# Note {i}\n")
+    size = sum(map(len, parts))
+    # Always place every link, even if that runs past note_bytes
+    while size < spec.note_bytes or links:
+        roll = rng.random()
+        if roll < spec.code_ratio:
+            body = "\n".join(f"x_{n} = {rng.choice(WORDS)!r} * {n}" for n in range(rng.randint(3, 12)))
+            block = f"```python\n{body}\n```\n"
+        elif roll < spec.code_ratio + spec.list_ratio:
+            marker = rng.choice(("- ", "* ", "1. "))
+            block = "".join(marker + _sentence(rng, spec, links) + "\n" for _ in range(spec.list_length))
+        elif roll < spec.code_ratio + spec.list_ratio + 0.1:
+            block = f"## {_sentence(rng, spec, links)}\n"
+        else:
+            block = "\n".join(_sentence(rng, spec, links) for _ in range(rng.randint(2, 6))) + "\n"
+        parts.append("\n" + block)
+        size += len(block) + 1
+    return "".join(parts)
+
+def make_synthetic_vault(root: Path, spec: VaultSpec) -> int:
+    """Writes the vault described by `spec` under `root`. Returns its size in bytes."""
+    total = 0
+    for folder in range(spec.folders):
+        directory = root if folder == 0 else root / f"folder_{folder:02d}"
+        directory.mkdir(parents=True, exist_ok=True)
+        (directory / "README.md").write_text("# Vault\n", encoding="utf-8")
+        total += len("# Vault\n")
+    for i in range(spec.notes):
+        data = make_note(spec, i).encode("utf-8")
+        (root / spec.note_path(i)).write_bytes(data)
+        total += len(data)
+    return total
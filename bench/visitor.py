@@ -0,0 +1,70 @@
+"""Rendering time on wide and deep trees: cached dispatch (recursive and explicit-stack) vs. per-node getattr dispatch."""
+import argparse
+import sys
+
+from ast_nodes import Bold, Document, Italic, Node, Paragraph, Text
+from md_parser import Parser
+from renderer import HTMLRenderer
+from bench.timing import best_of
+from bench.vault import NOTE
+
+class GetattrRenderer(HTMLRenderer):
+    """The previous dispatch: build 'visit_' + class name and getattr it for every node."""
+
+    def visit(self, node: Node):
+        name = node.__class__.__name__
+        visitor = getattr(self, 'visit_' + name, None)
+        if visitor is not None:
+            return visitor(node)
+        out = self._out
+        out.append(getattr(self, 'enter_' + name)(node) or "")
+        self._render_children(node)
+        leave = getattr(self, 'leave_' + name, None)
+        if leave is not None:
+            out.append(leave(node))
+
+def deep_tree(depth: int) -> Document:
+    """A paragraph with `depth` levels of alternating bold/italic nesting."""
+    doc = Document()
+    node = Paragraph()
+    doc.add(node)
+    for level in range(depth):
+        inner = Bold() if level % 2 else Italic()
+        inner.add(Text(f"l{level} "))
+        node.add(inner)
+        node = inner
+    return doc
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--repeat", type=int, default=2000, help="copies of the sample note in the wide tree")
+    ap.add_argument("--depth", type=int, default=100000, help="nesting depth of the deep tree")
+    ap.add_argument("--runs", type=int, default=5)
+    args = ap.parse_args()
+
+    trees = {
+        "wide": Parser().parse(NOTE.format(i=0, j=1) * args.repeat),
+        f"deep ({sys.getrecursionlimit() // 4})": deep_tree(sys.getrecursionlimit() // 4),
+        f"deep ({args.depth})": deep_tree(args.depth),
+    }
+    renderers = {
+        "getattr": GetattrRenderer(),
+        "cached": HTMLRenderer(),
+        "cached+stack": HTMLRenderer(iterative=True),
+    }
+
+    for tree_name, doc in trees.items():
+        expected = None
+        for name, renderer in renderers.items():
+            try:
+                html = renderer.render(doc)
+            except RecursionError:
+                print(f"{tree_name:>12}  {name:<13} RecursionError")
+                continue
+            assert expected is None or html == expected
+            expected = html
+            elapsed = best_of(lambda: renderer.render(doc), args.runs)
+            print(f"{tree_name:>12}  {name:<13} {elapsed * 1000:8.1f} ms")
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,72 @@
+"""Edit-to-HTML latency of watch mode on a large vault (inotify events vs. a polling scan), excluding the debounce."""
+import argparse
+import os
+import tempfile
+import time
+from pathlib import Path
+
+from watch import VaultWatcher, _Inotify
+from bench.vault import VaultSpec, make_synthetic_vault
+
+def timed(fn):
+    start = time.perf_counter()
+    result = fn()
+    return (time.perf_counter() - start) * 1000, result
+
+def main():
+    ap = argparse.ArgumentParser(description=__doc__)
+    ap.add_argument("--notes", type=int, default=10000)
+    ap.add_argument("--edits", type=int, default=20)
+    args = ap.parse_args()
+
+    with tempfile.TemporaryDirectory() as tmp:
+        vault = Path(tmp) / "vault"
+        spec = VaultSpec(notes=args.notes, note_bytes=2000, folders=10)
+        make_synthetic_vault(vault, spec)
+        watcher = VaultWatcher(str(vault), os.path.join(tmp, "out"))
+        start_ms, _ = timed(lambda: watcher.start(quiet=True))
+        scan_ms = min(timed(watcher.scan)[0] for _ in range(5))
+
+        notify = _Inotify.open(vault)
+
+        def apply():
+            # What the watch loop does once the burst is over
+            if notify is None:
+                return watcher.update()
+            paths = notify.read()
+            return watcher.update() if paths is None else watcher.update(paths=paths)
+
+        edit, poll = [], []
+        for n in range(args.edits):
+            for timings, fn in ((edit, apply), (poll, watcher.update)):
+                note = vault / spec.note_path(n)
+                with open(note, "a", encoding="utf-8") as f:
+                    f.write(f"\nEdit {n} with *more* text.\n")
+                timings.append(timed(fn)[0])
+                if notify is not None:
+                    notify.read()
+        # A new folder is a rescan; prepare it before timing the note itself.
+        new_note = vault / "folder_01" / "sub" / spec.note_path(0).split("/")[-1]
+        new_note.parent.mkdir()
+        (new_note.parent / "README.md").write_text("# Sub\n", encoding="utf-8")
+        apply()
+        # A note named like an existing one: every page linking that name is re-rendered.
+        new_note.write_text("# New\n", encoding="utf-8")
+        add_ms, add_written = timed(apply)
+        new_note.unlink()
+        remove_ms, _ = timed(apply)
+        if notify is not None:
+            notify.close()
+
+    edit.sort()
+    poll.sort()
+    print(f"notes={args.notes + spec.folders}, events={'inotify' if notify else 'unavailable, polling'}")
+    print(f"initial build + load:   {start_ms / 1000:.2f}s")
+    print(f"scan (stat every note): {scan_ms:6.1f} ms")
+    print(f"edit one note:          {edit[len(edit) // 2]:6.1f} ms median, {edit[-1]:.1f} ms max")
+    print(f"edit one note (--poll): {poll[len(poll) // 2]:6.1f} ms median, {poll[-1]:.1f} ms max (scan included)")
+    print(f"add a note:             {add_ms:6.1f} ms ({len(add_written)} pages rewritten)")
+    print(f"remove it again:        {remove_ms:6.1f} ms")
+
+if __name__ == "__main__":
+    main()
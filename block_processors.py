@@ -1,29 +1,48 @@
 from abc import ABC, abstractmethod
 import re
-from typing import List, Optional, Any
-from ast_nodes import Node, Heading, CodeBlock, Paragraph, Text, ListNode, ListItem, FrontMatter
+from typing import Dict, Iterable, List, Optional, Any, Sequence, Tuple
+from ast_nodes import Node, Heading, CodeBlock, Paragraph, Text, SourceText, ListNode, ListItem, FrontMatter
 
 class LineReader:
-    def __init__(self, lines: List[str]):
-        self.lines = lines
-        self.current_index = 0
+    """
+    Reads lines from a list or any iterator (e.g. an open file) with one
+    line of lookahead, so only the line being examined is held in memory.
+
+    `offset` is the position of the next line in the source, assuming lines
+    were separated by a single newline (and that the first line starts at
+    `offset`). When `source` is given, processors emit SourceText spans into
+    it instead of copying text.
+    """
+    def __init__(self, lines: Iterable[str], source: Optional[str] = None, offset: int = 0):
+        self._lines = iter(lines)
+        self._lookahead: Optional[str] = next(self._lines, None)
+        self.line_number = 0 # Number of lines consumed so far
+        self.offset = offset
+        self.source = source
 
     def peek(self) -> Optional[str]:
-        if self.has_next():
-            return self.lines[self.current_index]
-        return None
+        return self._lookahead
 
     def next(self) -> Optional[str]:
-        if self.has_next():
-            line = self.lines[self.current_index]
-            self.current_index += 1
-            return line
-        return None
+        line = self._lookahead
+        if line is not None:
+            self._lookahead = next(self._lines, None)
+            self.line_number += 1
+            self.offset += len(line) + 1
+        return line
 
     def has_next(self) -> bool:
-        return self.current_index < len(self.lines)
+        return self._lookahead is not None
 
 class BlockProcessor(ABC):
+    # Characters a line must start with for `can_start` to possibly succeed
+    # (after leading whitespace, if `allow_indent`). None means any
+    # non-blank line: the processor is a fallback.
+    start_chars: Optional[str] = None
+    allow_indent: bool = False
+    # Whether a line this processor can start on ends an open paragraph.
+    interrupts_paragraph: bool = False
+
     @abstractmethod
     def can_start(self, line: str) -> bool:
         pass
@@ -32,6 +51,86 @@ class BlockProcessor(ABC):
     def run(self, parent: Node, reader: LineReader) -> Node:
         pass
 
+class BlockRegistry:
+    """
+    Block processors indexed by the first character of the lines they can
+    start on, so the parser only calls `can_start` on real candidates.
+
+    Processors are tried in ascending `priority`; ties keep registration
+    order. A processor without `start_chars` is the fallback used for any
+    non-blank line no other processor claims.
+    """
+    def __init__(self):
+        self._entries: List[Tuple[int, int, BlockProcessor]] = []
+        self.fallback: Optional[BlockProcessor] = None
+        self._starts: Dict[str, Tuple[BlockProcessor, ...]] = {}
+        self._indented_starts: Dict[str, Tuple[BlockProcessor, ...]] = {}
+        self._interrupts: Dict[str, Tuple[BlockProcessor, ...]] = {}
+        self._indented_interrupts: Dict[str, Tuple[BlockProcessor, ...]] = {}
+
+    def register(self, processor: BlockProcessor, priority: int):
+        self._entries.append((priority, len(self._entries), processor))
+        self._entries.sort(key=lambda entry: entry[:2])
+        self._rebuild()
+
+    @property
+    def processors(self) -> List[BlockProcessor]:
+        """All registered processors, in the order they are tried."""
+        return [processor for _, _, processor in self._entries]
+
+    def _rebuild(self):
+        starts: Dict[str, List[BlockProcessor]] = {}
+        indented: Dict[str, List[BlockProcessor]] = {}
+        self.fallback = None
+        for processor in self.processors:
+            if processor.start_chars is None:
+                if self.fallback is None:
+                    self.fallback = processor
+                continue
+            for char in processor.start_chars:
+                starts.setdefault(char, []).append(processor)
+                if processor.allow_indent:
+                    indented.setdefault(char, []).append(processor)
+
+        def freeze(table: Dict[str, List[BlockProcessor]], interrupting: bool) -> Dict[str, Tuple[BlockProcessor, ...]]:
+            frozen = {}
+            for char, candidates in table.items():
+                if interrupting:
+                    candidates = [p for p in candidates if p.interrupts_paragraph]
+                if candidates:
+                    frozen[char] = tuple(candidates)
+            return frozen
+
+        self._starts = freeze(starts, False)
+        self._indented_starts = freeze(indented, False)
+        self._interrupts = freeze(starts, True)
+        self._indented_interrupts = freeze(indented, True)
+
+    @staticmethod
+    def _candidates(line: str, starts: Dict[str, Tuple[BlockProcessor, ...]],
+                    indented: Dict[str, Tuple[BlockProcessor, ...]]) -> Sequence[BlockProcessor]:
+        first = line[:1]
+        candidates = starts.get(first)
+        if candidates is not None:
+            return candidates
+        if first.isspace():
+            return indented.get(line.lstrip()[:1], ())
+        return ()
+
+    def find(self, line: str) -> Optional[BlockProcessor]:
+        """Returns the processor that should handle the non-blank `line`."""
+        for processor in self._candidates(line, self._starts, self._indented_starts):
+            if processor.can_start(line):
+                return processor
+        return self.fallback
+
+    def interrupts(self, line: str) -> bool:
+        """True if `line` starts a block that ends an open paragraph."""
+        for processor in self._candidates(line, self._interrupts, self._indented_interrupts):
+            if processor.can_start(line):
+                return True
+        return False
+
 class FrontMatterProcessor(BlockProcessor):
     def can_start(self, line: str) -> bool:
         return line.strip() == '---'
@@ -86,10 +185,14 @@ class FrontMatterProcessor(BlockProcessor):
         return value
 
 class HeadingProcessor(BlockProcessor):
+    start_chars = '#'
+    interrupts_paragraph = True
+
     def can_start(self, line: str) -> bool:
         return line.startswith('#')
 
     def run(self, parent: Node, reader: LineReader) -> Node:
+        line_start = reader.offset
         line = reader.next()
         if line is None:
             raise ValueError("Unexpected end of input in HeadingProcessor")
@@ -102,14 +205,24 @@ class HeadingProcessor(BlockProcessor):
                 break
         
         level = min(max(level, 1), 6)
-        content = line[level:].strip()
-        
+
         heading = Heading(level)
-        heading.add(Text(content))
+        if reader.source is not None:
+            rest = line[level:]
+            start = line_start + level + len(rest) - len(rest.lstrip())
+            end = line_start + level + len(rest.rstrip())
+            heading.add(SourceText(reader.source, start, max(start, end)))
+        else:
+            content = line[level:].strip()
+            heading.add(Text(content))
         parent.add(heading)
         return heading
 
 class CodeBlockProcessor(BlockProcessor):
+    start_chars = '`'
+    allow_indent = True
+    interrupts_paragraph = True
+
     def can_start(self, line: str) -> bool:
         return line.strip().startswith('```')
 
@@ -122,6 +235,7 @@ class CodeBlockProcessor(BlockProcessor):
         code_block = CodeBlock(language)
         
         code_content = []
+        content_start = content_end = reader.offset
         while reader.has_next():
             line = reader.peek()
             if line is None:
@@ -132,17 +246,23 @@ class CodeBlockProcessor(BlockProcessor):
                 break
             
             # Consume the line
+            content_end = reader.offset + len(line)
             content_line = reader.next()
-            if content_line is not None:
+            if content_line is not None and reader.source is None:
                 code_content.append(content_line)
-            
-        full_content = "\n".join(code_content)
-        code_block.add(Text(full_content))
+
+        if reader.source is not None:
+            code_block.add(SourceText(reader.source, content_start, content_end))
+        else:
+            full_content = "\n".join(code_content)
+            code_block.add(Text(full_content))
         parent.add(code_block)
         return code_block
 
 class ListProcessor(BlockProcessor):
     LIST_PATTERN = re.compile(r'^(\s*)([-*+]|\d+\.)\s+(.*)')
+    start_chars = '-*+0123456789'
+    allow_indent = True
 
     def can_start(self, line: str) -> bool:
         return bool(self.LIST_PATTERN.match(line))
@@ -183,23 +303,33 @@ class ListProcessor(BlockProcessor):
             if current_is_ordered != is_ordered:
                 break
                 
+            line_start = reader.offset
             reader.next() # Consume the line
-            content = match.group(3)
-            
+
             item = ListItem()
-            item.add(Text(content))
+            if reader.source is not None:
+                item.add(SourceText(reader.source, line_start + match.start(3), line_start + match.end(3)))
+            else:
+                content = match.group(3)
+                item.add(Text(content))
             list_node.add(item)
             
         parent.add(list_node)
         return list_node
 
 class ParagraphProcessor(BlockProcessor):
+    def __init__(self, registry: Optional[BlockRegistry] = None):
+        # Lines that start a block registered with `interrupts_paragraph`
+        # end the paragraph. Without a registry only blank lines do.
+        self.registry = registry
+
     def can_start(self, line: str) -> bool:
         return line.strip() != ""
 
     def run(self, parent: Node, reader: LineReader) -> Node:
         paragraph = Paragraph()
         lines = []
+        start = end = reader.offset
         
         while reader.has_next():
             line = reader.peek()
@@ -212,14 +342,25 @@ class ParagraphProcessor(BlockProcessor):
                 break
                 
             # Stop if we hit something that looks like another block
-            if line.startswith('#') or line.strip().startswith('```'):
+            if self.registry is not None and self.registry.interrupts(line):
                 break
                 
+            end = reader.offset + len(line)
             content_line = reader.next()
-            if content_line is not None:
+            if content_line is not None and reader.source is None:
                 lines.append(content_line)
-            
-        content = " ".join(lines).strip()
-        paragraph.add(Text(content))
+
+        if reader.source is not None:
+            # Same text as the join below: lines are separated by single
+            # newlines in the source, which the span folds into spaces.
+            source = reader.source
+            while start < end and source[start].isspace():
+                start += 1
+            while end > start and source[end - 1].isspace():
+                end -= 1
+            paragraph.add(SourceText(source, start, end, fold=True))
+        else:
+            content = " ".join(lines).strip()
+            paragraph.add(Text(content))
         parent.add(paragraph)
         return paragraph
@@ -0,0 +1,154 @@
+"""
+Thin client for the conversion server (server.py). It only imports the
+standard library, so a process that shells out to it for every preview
+pays for interpreter startup but not for importing and warming up the
+parser and renderer.
+
+    python3 client.py note.md [more.md ...] > preview.html
+    echo '# Hello' | python3 client.py
+    python3 client.py --ast note.md > note.ast    # ast_codec data
+
+Startup is most of what the client costs, so it avoids argparse, typing and
+(unless --ast) base64: it imports only os, sys, json and socket.
+
+From Python, a `Client` keeps one connection open for any number of
+(batched) requests:
+
+    with Client() as client:
+        results = client.convert([{"text": "# Hello"}, {"path": "/vault/note.md"}])
+        html = results[0]["html"]
+"""
+import json
+import os
+import socket
+import sys
+
+# Where server.py listens unless told otherwise: in the user's runtime
+# directory or, without one, in a directory of the user's own under /tmp
+# (see private_dir), never at a path another user could create first.
+if os.environ.get("XDG_RUNTIME_DIR"):
+    DEFAULT_SOCKET = os.path.join(os.environ["XDG_RUNTIME_DIR"], "obsidian-md.sock")
+else:
+    DEFAULT_SOCKET = os.path.join("/tmp", f"obsidian-md-{os.getuid()}", "server.sock")
+
+def private_dir(path: str, create: bool = False):
+    """
+    Raises OSError unless `path` is a directory (not a symlink) owned by
+    this user that nobody else can access. With `create`, it is made
+    (mode 0700) first if missing.
+    """
+    if create:
+        try:
+            os.mkdir(path, 0o700)
+        except FileExistsError:
+            pass
+    st = os.lstat(path)
+    if (st.st_mode & 0o170000) != 0o040000 or st.st_uid != os.getuid() or st.st_mode & 0o077:
+        raise OSError(f"{path} must be a directory only its owner (this user) can access")
+
+class Client:
+    """A connection to a conversion server at `path`; requests on it are answered in order."""
+    def __init__(self, path: str = DEFAULT_SOCKET):
+        self.path = path
+        if path == DEFAULT_SOCKET:
+            # Do not hand notes to a server someone else planted there
+            private_dir(os.path.dirname(path))
+        self.sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        try:
+            self.sock.connect(path)
+        except OSError:
+            self.sock.close()
+            raise
+        self._file = self.sock.makefile("rwb")
+        self._next_id = 0
+
+    def close(self):
+        self._file.close()
+        self.sock.close()
+
+    def __enter__(self) -> 'Client':
+        return self
+
+    def __exit__(self, *exc):
+        self.close()
+
+    def request(self, request: dict) -> dict:
+        """Sends one request and returns the server's response; ValueError if the server rejected it."""
+        self._next_id += 1
+        request = dict(request, id=self._next_id)
+        self._file.write(json.dumps(request, ensure_ascii=False).encode("utf-8") + b"\n")
+        self._file.flush()
+        line = self._file.readline()
+        if not line:
+            raise ConnectionError(f"The server at {self.path} closed the connection")
+        response = json.loads(line)
+        if "error" in response:
+            raise ValueError(response["error"])
+        return response
+
+    def convert(self, items: list[dict], output: str = "html") -> list[dict]:
+        """
+        Converts a batch of `items` ({"text": ...} or {"path": ...}, each
+        with an optional "page" for relative links). Returns one dict per
+        item, in order: "html" and/or "ast" (base64 of ast_codec data) as
+        `output` asks ("html", "ast" or "both"), or "error".
+        """
+        return self.request({"op": "convert", "items": items, "output": output})["results"]
+
+    def ping(self) -> dict:
+        return self.request({"op": "ping"})
+
+USAGE = f"""usage: client.py [--socket PATH] [--ast] [file ...]
+
+Convert notes (default: markdown on stdin) through a running server.py.
+
+  --socket PATH  server socket (default: {DEFAULT_SOCKET})
+  --ast          write the ast_codec data of a single note instead of HTML
+"""
+
+def main(argv: list[str] | None = None) -> int:
+    args = sys.argv[1:] if argv is None else list(argv)
+    path, ast, files = DEFAULT_SOCKET, False, []
+    while args:
+        arg = args.pop(0)
+        if arg in ("-h", "--help"):
+            sys.stdout.write(USAGE)
+            return 0
+        if arg == "--ast":
+            ast = True
+        elif arg == "--socket" and args:
+            path = args.pop(0)
+        elif arg.startswith("--socket="):
+            path = arg.split("=", 1)[1]
+        elif arg.startswith("-"):
+            sys.stderr.write(USAGE + f"client.py: error: unrecognized argument {arg}\n")
+            return 2
+        else:
+            files.append(arg)
+    if ast and len(files) > 1:
+        sys.stderr.write(USAGE + "client.py: error: --ast takes a single note\n")
+        return 2
+
+    if files:
+        # The server may run in another directory
+        items = [{"path": os.path.abspath(file)} for file in files]
+    else:
+        items = [{"text": sys.stdin.read()}]
+    with Client(path) as client:
+        results = client.convert(items, "ast" if ast else "html")
+
+    status = 0
+    for item, result in zip(items, results):
+        if "error" in result:
+            print(f"{item.get('path', '<stdin>')}: {result['error']}", file=sys.stderr)
+            status = 1
+        elif ast:
+            import base64
+            sys.stdout.buffer.write(base64.b64decode(result["ast"]))
+        else:
+            sys.stdout.write(result["html"])
+    sys.stdout.flush()
+    return status
+
+if __name__ == "__main__":
+    sys.exit(main())
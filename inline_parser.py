@@ -1,82 +1,191 @@
 import re
-from typing import List
-from ast_nodes import Node, Text, WikiLink, Italic, Bold, InlineCode
+from typing import Callable, Dict, List, Optional, Pattern, Union
+from ast_nodes import Node, Text, SourceText, WikiLink, Italic, Bold, InlineCode
 
-class InlineParser:
-    # --- Regex Construction ---
+class _Delimiter:
+    """A run of `*` or `_` that may still open or close emphasis."""
+    __slots__ = ('char', 'start', 'end', 'index')
+
+    def __init__(self, char: str, start: int, end: int, index: int):
+        self.char = char
+        self.start = start
+        self.end = end
+        self.index = index # Position in the parser's item list
 
-    # 0. Inline Code: `text`
-    # Group 10: Full match
-    # Group 11: Content
-    inline_code_pattern = r'(`([^`]+)`)'
+def _find(text: str, sub: str, start: int, end: int) -> int:
+    """`text.find`, but returns `end` rather than -1 when `sub` is absent."""
+    found = text.find(sub, start, end)
+    return end if found == -1 else found
 
-    # 1. WikiLink: [[Target]] or [[Target|Alias]]
-    # Group 1: Full match
-    # Group 2: Target
-    # Group 3: Alias (optional)
-    wikilink_pattern = r'(\[\[(.*?)(?:\|(.*?))?\]\])'
+# Items of one parse: plain-text ranges (start, end), open delimiters, or finished nodes.
+_Item = Union[tuple, _Delimiter, Node]
 
-    # 2. Bold: __text__
-    # Group 4: Full match
-    # Group 5: Content
-    bold_pattern = r'(__(\S.+?)__)'
+class InlineParser:
+    """
+    Single-pass inline tokenizer. Runs in time linear in the text, however
+    many unmatched delimiters it contains.
 
-    # 3. Italic: *text*
-    # Group 6: Full match
-    # Group 7: Content
-    italic_star_pattern = r'(\*(.+?)\*)'
+    Elements, in precedence order:
+    - Inline code: `text` (content is not parsed further)
+    - WikiLink: [[Target]] or [[Target|Alias]]
+    - Bold: __text__ or **text**
+    - Italic: *text* or _text_
 
-    # 4. Italic: _text_
-    # Group 8: Full match
-    # Group 9: Content
-    italic_underscore_pattern = r'(_(.+?)_)'
+    Code spans and WikiLinks are atomic and are matched as soon as they are
+    seen. Emphasis uses a delimiter stack: runs of `*`/`_` are pushed as
+    potential openers and matched by later closing runs of the same
+    character, so emphasis can nest (bold inside italic and vice versa).
+    A run can open if the next character is not whitespace and close if the
+    previous one is not; `_` additionally cannot open or close inside a
+    word. Unmatched delimiters stay plain text.
 
-    # Combine and compile
-    TOKEN_RE = re.compile(f'{inline_code_pattern}|{wikilink_pattern}|{bold_pattern}|{italic_star_pattern}|{italic_underscore_pattern}')
+    Outside folded spans nothing but a code span crosses a line break.
+    """
+    # Characters the scanner stops at; everything else is copied as text.
+    SPECIAL_RE = re.compile(r'[`*_\n]|\[\[')
+    # In folded spans (paragraphs in the source buffer) a newline stands for
+    # the space it is rendered as.
+    SPECIAL_RE_FOLDED = re.compile(r'[`*_]|\[\[')
 
     def parse(self, text: str) -> List[Node]:
-        nodes = []
-        last_pos = 0
-        
-        # Iterate through all regex matches in the string
-        for match in self.TOKEN_RE.finditer(text):
-            start, end = match.span()
-            
-            # 1. Plain text before the match
-            if start > last_pos:
-                text_chunk = text[last_pos:start]
-                nodes.append(Text(text_chunk))
-            
-            # 2. Handle the match
-            if match.group(1): # Inline Code
-                content = match.group(2)
-                code = InlineCode()
-                code.add(Text(content))
-                nodes.append(code)
-            elif match.group(3): # WikiLink
-                target = match.group(4)
-                alias = match.group(5)
-                nodes.append(WikiLink(target, alias))
-            elif match.group(6): # Bold
-                content = match.group(7)
-                bold = Bold()
-                bold.add(Text(content))
-                nodes.append(bold)
-            elif match.group(8): # Italic (star)
-                content = match.group(9)
-                italic = Italic()
-                italic.add(Text(content))
-                nodes.append(italic)
-            elif match.group(10): # Italic (underscore)
-                content = match.group(11)
-                italic = Italic()
-                italic.add(Text(content))
-                nodes.append(italic)
-            
-            last_pos = end
-            
-        # 3. Remaining plain text after the last match
-        if last_pos < len(text):
-            nodes.append(Text(text[last_pos:]))
-            
+        return self._parse_range(text, 0, len(text), False, lambda start, end: Text(text[start:end]), str)
+
+    def parse_span(self, source: str, start: int, end: int, fold: bool = False) -> List[Node]:
+        """
+        Like `parse`, but for `source[start:end]` without slicing it: plain
+        text comes back as SourceText spans into `source`.
+        """
+        clean = (lambda s: s.replace('\n', ' ')) if fold else str
+        return self._parse_range(source, start, end, fold, lambda a, b: SourceText(source, a, b, fold), clean)
+
+    def _parse_range(self, text: str, pos: int, endpos: int, fold: bool,
+                     make_text: Callable[[int, int], Node], clean: Callable[[str], str]) -> List[Node]:
+        special: Pattern = self.SPECIAL_RE_FOLDED if fold else self.SPECIAL_RE
+        items: List[_Item] = []
+        openers: Dict[str, List[_Delimiter]] = {'*': [], '_': []}
+        # Cached positions of the next closing backtick / `]]` / newline, so
+        # unmatched openers never cause a rescan (endpos: there are no more).
+        next_tick = next_link_end = next_newline = pos - 1
+        last = pos
+
+        match = special.search(text, pos, endpos)
+        while match is not None:
+            i = match.start()
+            char = text[i]
+            end = i + 1
+
+            if char == '`':
+                if next_tick <= i:
+                    next_tick = _find(text, '`', i + 1, endpos)
+                if i + 1 < next_tick < endpos:
+                    if i > last:
+                        items.append((last, i))
+                    code = InlineCode()
+                    code.add(make_text(i + 1, next_tick))
+                    items.append(code)
+                    end = last = next_tick + 1
+
+            elif char == '[':
+                end = i + 2
+                if next_link_end < i + 2:
+                    next_link_end = _find(text, ']]', i + 2, endpos)
+                if next_link_end < endpos and not fold:
+                    if next_newline < i:
+                        next_newline = _find(text, '\n', i, endpos)
+                    if next_newline < next_link_end:
+                        # The link would cross a line break; only plain text.
+                        match = special.search(text, end, endpos)
+                        continue
+                if next_link_end < endpos:
+                    if i > last:
+                        items.append((last, i))
+                    inner = text[i + 2:next_link_end]
+                    bar = inner.find('|')
+                    if bar == -1:
+                        items.append(WikiLink(clean(inner)))
+                    else:
+                        items.append(WikiLink(clean(inner[:bar]), clean(inner[bar + 1:])))
+                    end = last = next_link_end + 2
+
+            elif char == '\n':
+                # Emphasis does not span lines: pending openers stay literal.
+                openers['*'].clear()
+                openers['_'].clear()
+
+            else:
+                while end < endpos and text[end] == char:
+                    end += 1
+                before = text[i - 1] if i > pos else ' '
+                after = text[end] if end < endpos else ' '
+                can_open = not after.isspace()
+                can_close = not before.isspace()
+                if char == '_':
+                    can_open = can_open and not before.isalnum()
+                    can_close = can_close and not after.isalnum()
+                if can_open or can_close:
+                    if i > last:
+                        items.append((last, i))
+                    last = end
+                    run = _Delimiter(char, i, end, len(items))
+                    if can_close:
+                        self._close_emphasis(run, items, openers, make_text)
+                    if run.end > run.start:
+                        if can_open:
+                            run.index = len(items)
+                            items.append(run)
+                            openers[char].append(run)
+                        else:
+                            items.append((run.start, run.end))
+
+            match = special.search(text, end, endpos)
+
+        if last < endpos:
+            items.append((last, endpos))
+        return self._finish(items, make_text)
+
+    def _close_emphasis(self, closer: _Delimiter, items: List[_Item],
+                        openers: Dict[str, List[_Delimiter]], make_text: Callable[[int, int], Node]):
+        """Matches `closer` against the open runs of its character, wrapping what lies between."""
+        stack = openers[closer.char]
+        other = openers['_' if closer.char == '*' else '*']
+        while stack and closer.end > closer.start:
+            opener = stack[-1]
+            use = 2 if opener.end - opener.start >= 2 and closer.end - closer.start >= 2 else 1
+            # Runs of the other character inside the new element can no longer match.
+            while other and other[-1].index > opener.index:
+                other.pop()
+            node = Bold() if use == 2 else Italic()
+            node.children = self._finish(items[opener.index + 1:], make_text)
+            del items[opener.index + 1:]
+            opener.end -= use
+            closer.start += use
+            if opener.end == opener.start:
+                stack.pop()
+                items.pop()
+            items.append(node)
+
+    def _finish(self, items: List[_Item], make_text: Callable[[int, int], Node]) -> List[Node]:
+        """Turns items into nodes, merging adjacent text ranges and leftover delimiters."""
+        nodes: List[Node] = []
+        start: Optional[int] = None
+        end = 0
+        for item in items:
+            if item.__class__ is tuple:
+                a, b = item
+            elif item.__class__ is _Delimiter:
+                a, b = item.start, item.end
+            else:
+                if start is not None:
+                    nodes.append(make_text(start, end))
+                    start = None
+                nodes.append(item)
+                continue
+            if start is None:
+                start = a
+            elif a != end:
+                nodes.append(make_text(start, end))
+                start = a
+            end = b
+        if start is not None:
+            nodes.append(make_text(start, end))
         return nodes
@@ -0,0 +1,179 @@
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+from urllib.parse import quote
+import os
+import posixpath
+import sqlite3
+from ast_nodes import Node, WikiLink
+
+LINKS_NAME = ".links.sqlite"
+
+# Link targets with these extensions point at attachments, not notes.
+ATTACHMENT_EXTENSIONS = {
+    '.png', '.jpg', '.jpeg', '.gif', '.svg', '.webp', '.bmp',
+    '.pdf', '.mp3', '.mp4', '.webm', '.mov', '.wav', '.ogg',
+}
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS notes (
+    path TEXT PRIMARY KEY
+);
+CREATE TABLE IF NOT EXISTS links (
+    source TEXT NOT NULL,   -- note containing the link (relative .md path)
+    target TEXT NOT NULL,   -- link text as written, e.g. 'Note#Heading'
+    key TEXT,               -- normalised target, NULL for attachments/anchors
+    resolved TEXT           -- note the link points to, NULL if dead
+);
+CREATE INDEX IF NOT EXISTS links_source ON links(source);
+CREATE INDEX IF NOT EXISTS links_key ON links(key);
+CREATE INDEX IF NOT EXISTS links_resolved ON links(resolved);
+"""
+
+def link_key(target: str) -> Optional[str]:
+    """
+    Normalises a WikiLink target ('Folder/Note.md#Heading') to the key notes
+    are looked up by ('folder/note'). Returns None for targets that are not
+    notes: same-page anchors and attachments.
+    """
+    name = target.split('#', 1)[0].strip().replace('\\', '/')
+    if not name:
+        return None
+    base, ext = posixpath.splitext(name)
+    ext = ext.lower()
+    if ext == '.md':
+        name = base
+    elif ext in ATTACHMENT_EXTENSIONS:
+        return None
+    return name.lower()
+
+def note_keys(rel: str) -> Tuple[str, str]:
+    """The (path, name) keys a note at `rel` can be linked by."""
+    path_key = rel[:-len('.md')].lower()
+    return path_key, posixpath.basename(path_key)
+
+def collect_links(node: Node) -> List[str]:
+    """Returns the target of every WikiLink under `node`, in document order."""
+    targets = []
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        if isinstance(current, WikiLink):
+            targets.append(current.target)
+        elif current.children:
+            stack.extend(reversed(current.children))
+    return targets
+
+class LinkResolver:
+    """
+    Maps WikiLink targets to notes in O(1), the way Obsidian does: by path
+    ('Folder/Note') or by bare name ('Note'), case-insensitively. When two
+    notes share a name, the one closest to the vault root wins.
+    """
+    def __init__(self, notes: Iterable[str]):
+        self._by_key: Dict[str, str] = {}
+        self._hrefs: Dict[Tuple[str, str], str] = {}
+        for rel in sorted(notes, key=lambda r: (r.count('/'), r)):
+            for key in note_keys(rel):
+                self._by_key.setdefault(key, rel)
+
+    def resolve(self, target: str) -> Optional[str]:
+        """Returns the relative path of the note `target` points at, or None."""
+        key = link_key(target)
+        return self._by_key.get(key) if key is not None else None
+
+    def href(self, target: str, from_page: str) -> Optional[str]:
+        """
+        Returns the href for `target` as seen from the page of note `from_page`,
+        `target` unchanged for attachments and anchors, or None for dead links.
+        """
+        key = link_key(target)
+        if key is None:
+            return target
+        rel = self._by_key.get(key)
+        if rel is None:
+            return None
+
+        from_dir = posixpath.dirname(from_page)
+        cached = self._hrefs.get((rel, from_dir))
+        if cached is None:
+            cached = quote(posixpath.relpath(rel[:-len('.md')] + '.html', from_dir or '.'))
+            self._hrefs[(rel, from_dir)] = cached
+        _, _, anchor = target.partition('#')
+        return f"{cached}#{quote(anchor.strip())}" if anchor else cached
+
+class LinkIndex:
+    """
+    Persisted WikiLink graph of a vault (SQLite, in the output directory):
+    the outgoing links of every note, with the note each one resolves to,
+    so backlinks and dead links are index lookups.
+    """
+    def __init__(self, path: str):
+        self.created = not os.path.exists(path)
+        self.db = sqlite3.connect(path)
+        self.db.executescript(SCHEMA)
+
+    def close(self):
+        self.db.commit()
+        self.db.close()
+
+    def notes(self) -> Set[str]:
+        return {row[0] for row in self.db.execute("SELECT path FROM notes")}
+
+    def set_notes(self, notes: Iterable[str]):
+        """Replaces the set of known notes, dropping the links of notes that are gone."""
+        notes = set(notes)
+        old = self.notes()
+        gone = [(rel,) for rel in old - notes]
+        self.db.executemany("DELETE FROM notes WHERE path = ?", gone)
+        self.db.executemany("DELETE FROM links WHERE source = ?", gone)
+        self.db.executemany("INSERT INTO notes (path) VALUES (?)", [(rel,) for rel in notes - old])
+
+    def set_links(self, source: str, targets: Iterable[str], resolver: LinkResolver):
+        """Replaces the outgoing links of `source`."""
+        self.db.execute("DELETE FROM links WHERE source = ?", (source,))
+        self.db.executemany(
+            "INSERT INTO links (source, target, key, resolved) VALUES (?, ?, ?, ?)",
+            [(source, target, link_key(target), resolver.resolve(target)) for target in targets],
+        )
+
+    def add_index(self, path: str):
+        """
+        Adds the notes and links of the index at `path`, e.g. to combine the
+        indexes of a sharded build. Links keep their order per source.
+        """
+        self.db.commit()
+        self.db.execute("ATTACH DATABASE ? AS other", (path,))
+        try:
+            self.db.execute("INSERT OR IGNORE INTO notes (path) SELECT path FROM other.notes")
+            self.db.execute("INSERT INTO links (source, target, key, resolved) "
+                            "SELECT source, target, key, resolved FROM other.links ORDER BY rowid")
+            self.db.commit()
+        finally:
+            self.db.execute("DETACH DATABASE other")
+
+    def sources_linking_to(self, notes: Iterable[str]) -> Set[str]:
+        """Notes with a link whose key matches any of `notes` (resolved or not)."""
+        keys = {key for rel in notes for key in note_keys(rel)}
+        sources: Set[str] = set()
+        keys = list(keys)
+        # Stay under SQLite's bound-parameter limit
+        for i in range(0, len(keys), 500):
+            chunk = keys[i:i + 500]
+            marks = ",".join("?" * len(chunk))
+            sources.update(row[0] for row in self.db.execute(
+                f"SELECT DISTINCT source FROM links WHERE key IN ({marks})", chunk))
+        return sources
+
+    def outgoing(self, source: str) -> List[Tuple[str, Optional[str]]]:
+        """(target, resolved note) for each link in `source`, in document order."""
+        return list(self.db.execute(
+            "SELECT target, resolved FROM links WHERE source = ? ORDER BY rowid", (source,)))
+
+    def backlinks(self, rel: str) -> List[str]:
+        """Notes that link to `rel`."""
+        return [row[0] for row in self.db.execute(
+            "SELECT DISTINCT source FROM links WHERE resolved = ? ORDER BY source", (rel,))]
+
+    def dead_links(self) -> List[Tuple[str, str]]:
+        """(source, target) for every link to a note that does not exist."""
+        return list(self.db.execute(
+            "SELECT source, target FROM links WHERE key IS NOT NULL AND resolved IS NULL ORDER BY source, rowid"))
@@ -0,0 +1,111 @@
+import hashlib
+import json
+import os
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional
+
+MANIFEST_NAME = ".build-manifest.json"
+MANIFEST_FORMAT = 1
+
+def content_digest(data: bytes) -> str:
+    return hashlib.blake2b(data, digest_size=16).hexdigest()
+
+def file_digest(path: os.PathLike, chunk_size: int = 1 << 20) -> str:
+    """`content_digest` of a file's bytes, read `chunk_size` bytes at a time."""
+    h = hashlib.blake2b(digest_size=16)
+    with open(path, 'rb') as f:
+        while True:
+            chunk = f.read(chunk_size)
+            if not chunk:
+                break
+            h.update(chunk)
+    return h.hexdigest()
+
+class BuildManifest:
+    """
+    Persisted record of the last build, stored in the output directory.
+
+    Maps each source (relative path, posix style) to the content hash, mtime
+    and size it had when its HTML was written. `build_key` captures everything
+    else that affects the output (renderer version, stylesheet); if it changes
+    the old entries are discarded and every note is rebuilt.
+    """
+    def __init__(self, path: Path, build_key: str, entries: Optional[Dict[str, dict]] = None, stale: bool = False):
+        self.path = path
+        self.build_key = build_key
+        self.entries: Dict[str, dict] = entries if entries is not None else {}
+        # A stale manifest still knows which outputs it wrote (so they can be
+        # pruned) but none of its entries count as up to date.
+        self.stale = stale
+        self.dirty = stale
+
+    @classmethod
+    def load(cls, output_path: Path, build_key: str) -> 'BuildManifest':
+        path = output_path / MANIFEST_NAME
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            manifest = cls(path, build_key)
+            # Saved even if nothing gets recorded, e.g. by a shard without notes
+            manifest.dirty = True
+            return manifest
+
+        if data.get('format') != MANIFEST_FORMAT:
+            return cls(path, build_key, stale=True)
+        return cls(path, build_key, data.get('entries', {}), stale=data.get('build_key') != build_key)
+
+    @classmethod
+    def read(cls, output_path: Path) -> 'BuildManifest':
+        """
+        Loads the manifest in `output_path` under the build key it was saved
+        with, e.g. to combine shards. Raises ValueError if it is missing or
+        in another format.
+        """
+        path = output_path / MANIFEST_NAME
+        try:
+            with open(path, 'r', encoding='utf-8') as f:
+                data = json.load(f)
+        except (OSError, ValueError):
+            raise ValueError(f"No readable build manifest in {output_path}")
+        if data.get('format') != MANIFEST_FORMAT:
+            raise ValueError(f"Unsupported build manifest format in {output_path}")
+        return cls(path, data['build_key'], data.get('entries', {}))
+
+    def is_fresh(self, rel: str, st: os.stat_result) -> bool:
+        """True if `rel` is unchanged since the last build, judged by stat alone."""
+        if self.stale:
+            return False
+        entry = self.entries.get(rel)
+        return entry is not None and entry['mtime'] == st.st_mtime_ns and entry['size'] == st.st_size
+
+    def known_digest(self, rel: str) -> Optional[str]:
+        if self.stale:
+            return None
+        entry = self.entries.get(rel)
+        return entry['hash'] if entry else None
+
+    def record(self, rel: str, digest: str, st: os.stat_result):
+        self.entries[rel] = {'hash': digest, 'mtime': st.st_mtime_ns, 'size': st.st_size}
+        self.dirty = True
+
+    def prune(self, live: Iterable[str]) -> List[str]:
+        """Drops entries whose source no longer exists and returns their relative paths."""
+        live = set(live)
+        removed = [rel for rel in self.entries if rel not in live]
+        for rel in removed:
+            del self.entries[rel]
+        if removed:
+            self.dirty = True
+        return removed
+
+    def save(self):
+        if not self.dirty:
+            return
+        data = {'format': MANIFEST_FORMAT, 'build_key': self.build_key, 'entries': self.entries}
+        tmp = self.path.with_suffix('.tmp')
+        with open(tmp, 'w', encoding='utf-8') as f:
+            json.dump(data, f, separators=(',', ':'), sort_keys=True)
+        os.replace(tmp, self.path)
+        self.dirty = False
+        self.stale = False
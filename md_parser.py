@@ -1,71 +1,281 @@
-from typing import List
-from ast_nodes import Document, Node, Text
+import os
+from bisect import bisect_left, bisect_right
+from typing import Callable, Iterable, Iterator, List, Optional, Tuple, Union
+from ast_nodes import BlockEdit, CodeBlock, Document, FrontMatter, Node, Text, SourceText, InlineContainer
 from inline_parser import InlineParser
-from block_processors import LineReader, HeadingProcessor, CodeBlockProcessor, ParagraphProcessor, BlockProcessor, ListProcessor, FrontMatterProcessor
+from block_processors import LineReader, BlockRegistry, HeadingProcessor, CodeBlockProcessor, ParagraphProcessor, BlockProcessor, ListProcessor, FrontMatterProcessor
+
+def _strip_newlines(lines: Iterable[str]) -> Iterator[str]:
+    """
+    Turns file-style lines ("text\\n") into `str.split('\\n')`-style lines,
+    including the trailing empty line after a final newline.
+    """
+    ended_with_newline = True # An empty file still splits into ['']
+    for line in lines:
+        if line.endswith('\n'):
+            yield line[:-1]
+            ended_with_newline = True
+        else:
+            yield line
+            ended_with_newline = False
+    if ended_with_newline:
+        yield ""
+
+def _iter_lines(text: str, start: int = 0) -> Iterator[str]:
+    """Yields the same lines as `text[start:].split('\\n')` without building the list."""
+    while True:
+        end = text.find('\n', start)
+        if end == -1:
+            yield text[start:]
+            return
+        yield text[start:end]
+        start = end + 1
+
+# Texts are compared in slices of this many characters when looking for the
+# edited region, so unchanged text costs a memcmp rather than a Python loop.
+_COMPARE_CHUNK = 4096
+
+def _common_prefix(a: str, b: str, limit: int) -> int:
+    n = 0
+    while n + _COMPARE_CHUNK <= limit and a[n:n + _COMPARE_CHUNK] == b[n:n + _COMPARE_CHUNK]:
+        n += _COMPARE_CHUNK
+    size = _COMPARE_CHUNK
+    while size > 1:
+        size //= 2
+        if n + size <= limit and a[n:n + size] == b[n:n + size]:
+            n += size
+    return n
+
+def _common_suffix(a: str, b: str, limit: int) -> int:
+    n = 0
+    la, lb = len(a), len(b)
+    while n + _COMPARE_CHUNK <= limit and a[la - n - _COMPARE_CHUNK:la - n] == b[lb - n - _COMPARE_CHUNK:lb - n]:
+        n += _COMPARE_CHUNK
+    size = _COMPARE_CHUNK
+    while size > 1:
+        size //= 2
+        if n + size <= limit and a[la - n - size:la - n] == b[lb - n - size:lb - n]:
+            n += size
+    return n
+
+def edit_range(old_text: str, new_text: str) -> Tuple[int, int, int]:
+    """
+    Returns `(start, old_end, new_end)` such that replacing
+    `old_text[start:old_end]` with `new_text[start:new_end]` turns one text
+    into the other, with the unchanged prefix and suffix as long as possible.
+    """
+    limit = min(len(old_text), len(new_text))
+    start = _common_prefix(old_text, new_text, limit)
+    suffix = _common_suffix(old_text, new_text, limit - start)
+    return start, len(old_text) - suffix, len(new_text) - suffix
 
 class Parser:
     def __init__(self):
         self.inline_parser = InlineParser()
         self.front_matter_processor = FrontMatterProcessor()
-        self.processors: List[BlockProcessor] = [
-            HeadingProcessor(),
-            CodeBlockProcessor(),
-            ListProcessor(),
-            ParagraphProcessor()
-        ]
-
-    def parse(self, text: str) -> Document:
+        self.blocks = BlockRegistry()
+        self.blocks.register(HeadingProcessor(), priority=10)
+        self.blocks.register(CodeBlockProcessor(), priority=20)
+        self.blocks.register(ListProcessor(), priority=30)
+        self.blocks.register(ParagraphProcessor(self.blocks), priority=100)
+
+    @property
+    def processors(self) -> List[BlockProcessor]:
+        return self.blocks.processors
+
+    def register(self, processor: BlockProcessor, priority: int):
+        """Adds a block processor. Lower priorities are tried first."""
+        self.blocks.register(processor, priority)
+
+    def parse(self, text: str, spans: bool = False, lazy: bool = False) -> Document:
+        """
+        Parses a whole document.
+
+        With `spans`, text leaves are SourceText offsets into `text` rather
+        than copied substrings, and lines are read one at a time.
+
+        With `lazy`, only the block pass runs here; each block is
+        inline-parsed the first time its children are read or rendered.
+        """
         doc = Document()
-        lines = text.split('\n')
+        if spans:
+            reader = LineReader(_iter_lines(text), source=text)
+        else:
+            lines = text.split('\n')
+            reader = LineReader(lines)
+
+        # --- PASS 1: Block Parsing ---
+        starts: List[int] = []
+        for block in self._iter_blocks(reader, starts=starts):
+            doc.add(block)
+        doc._block_starts = tuple(starts)
+
+        # --- PASS 2: Inline Parsing ---
+        if lazy:
+            self._defer_inline_elements(doc)
+        else:
+            self._process_inline_elements(doc)
+
+        return doc
+
+    def parse_stream(self, lines: Iterable[str], lazy: bool = False) -> Iterator[Node]:
+        """
+        Parses lines (without trailing newlines) from any iterable and yields
+        each top-level block, already inline-parsed (unless `lazy`), as soon
+        as it closes. Only the current block is held in memory.
+        """
         reader = LineReader(lines)
-        
+        for block in self._iter_blocks(reader):
+            if lazy:
+                self._defer_inline_elements(block)
+            elif block.children:
+                self._process_inline_elements(block)
+            yield block
+
+    def parse_file(self, path: Union[str, os.PathLike], encoding: str = 'utf-8', lazy: bool = False) -> Iterator[Node]:
+        """Streams the top-level blocks of a markdown file. See `parse_stream`."""
+        with open(path, 'r', encoding=encoding) as f:
+            yield from self.parse_stream(_strip_newlines(f), lazy=lazy)
+
+    def reparse(self, doc: Document, old_text: str, new_text: str, spans: bool = False,
+                lazy: bool = False) -> BlockEdit:
+        """
+        Brings `doc`, parsed from `old_text`, up to date with `new_text`,
+        re-running the block and inline passes only for the top-level blocks
+        the edit touched. Returns a BlockEdit whose new document shares every
+        other block with `doc` (which is left as it was).
+
+        The block pass restarts at the block before the edit (an edit can
+        join lines onto it) and stops at the first block boundary past the
+        edit that lines up with an old one; from there on the text, and so
+        the parse, is unchanged. Cost grows with the edited blocks, plus a
+        C-speed comparison of the texts and a shift of the later block
+        offsets. Documents not made by `parse` are parsed in full.
+        """
+        starts = doc._block_starts
+        if starts is None or len(starts) != len(doc.children):
+            new_doc = self.parse(new_text, spans, lazy)
+            return BlockEdit(new_doc, 0, len(new_doc.children), len(doc.children))
+
+        edit_start, old_end, new_end = edit_range(old_text, new_text)
+        delta = new_end - old_end
+        first = max(bisect_right(starts, edit_start) - 2, 0)
+        while first and starts[first - 1] == starts[first]:
+            first -= 1 # Blocks from one processor run start together
+        restart = starts[first] if first else 0
+
+        count = len(starts)
+        tail = bisect_left(starts, old_end)
+        old_blocks = doc.children
+
+        def resync(offset: int) -> bool:
+            nonlocal tail
+            if offset < new_end:
+                return False
+            while tail < count and starts[tail] + delta < offset:
+                tail += 1
+            # Front matter only counts at the very start of a note: text
+            # inserted before it turns it into ordinary blocks.
+            return (tail < count and starts[tail] + delta == offset
+                    and (offset == 0 or not isinstance(old_blocks[tail], FrontMatter)))
+
+        reader = LineReader(_iter_lines(new_text, restart), source=new_text if spans else None, offset=restart)
+        new_starts: List[int] = []
+        blocks = list(self._iter_blocks(reader, front_matter=not first, starts=new_starts, stop=resync))
+        if not reader.has_next():
+            tail = count # Parsed to the end without lining up
+        for block in blocks:
+            if lazy:
+                self._defer_inline_elements(block)
+            elif block.children:
+                self._process_inline_elements(block)
+
+        new_doc = Document()
+        new_doc.children = doc.children[:first] + blocks + doc.children[tail:]
+        new_doc._block_starts = starts[:first] + tuple(new_starts) + tuple(map(delta.__add__, starts[tail:]))
+        return BlockEdit(new_doc, first, first + len(blocks), tail)
+
+    def _iter_blocks(self, reader: LineReader, front_matter: bool = True, starts: Optional[List[int]] = None,
+                     stop: Optional[Callable[[int], bool]] = None) -> Iterator[Node]:
+        """
+        Runs the block processors over `reader`, yielding each top-level
+        block. The source offset each block starts at is appended to
+        `starts`; `stop(offset)` is asked before each block whether to end
+        there instead.
+        """
+        # Processors attach what they build to a parent; collect from a scratch one.
+        scratch = Document()
+
         # Check for Front Matter at the very beginning
-        if reader.has_next() and self.front_matter_processor.can_start(reader.peek()):
-            self.front_matter_processor.run(doc, reader)
-        
+        if front_matter and reader.has_next() and self.front_matter_processor.can_start(reader.peek()):
+            if starts is not None:
+                starts.append(reader.offset)
+            self.front_matter_processor.run(scratch, reader)
+            yield from scratch.children
+            scratch.children = []
+
         while reader.has_next():
             line = reader.peek()
             if line is None:
                 break
-                
+
             # Skip empty lines at the top level
-            if not line.strip():
+            if not line or line.isspace():
                 reader.next()
                 continue
-            
-            matched = False
-            for processor in self.processors:
-                if processor.can_start(line):
-                    processor.run(doc, reader)
-                    matched = True
-                    break
-            
-            if not matched:
+
+            start = reader.offset
+            if stop is not None and stop(start):
+                return
+            processor = self.blocks.find(line)
+            if processor is not None:
+                processor.run(scratch, reader)
+            else:
                 # Should not happen if ParagraphProcessor is configured correctly as fallback
                 # for non-empty lines. But to be safe and avoid infinite loops:
                 reader.next()
-        
-        # --- PASS 2: Inline Parsing ---
-        self._process_inline_elements(doc)
-                
-        return doc
+
+            if scratch.children:
+                blocks, scratch.children = scratch.children, []
+                if starts is not None:
+                    starts.extend([start] * len(blocks))
+                yield from blocks
+
+    def _defer_inline_elements(self, node: Node):
+        """Marks every inline-bearing block under `node` (or `node` itself) for lazy parsing."""
+        stack = [node]
+        while stack:
+            current = stack.pop()
+            if isinstance(current, InlineContainer):
+                current._pending = self
+            else:
+                stack.extend(current.children)
 
     def _process_inline_elements(self, node: Node):
         """
-        Recursively walks the tree. 
-        If it finds a Text node, it runs the inline parser and expands it.
+        Walks the tree under `node` with an explicit stack (so nesting depth
+        is not limited by the recursion limit). Every Text leaf outside code
+        blocks is run through the inline parser and replaced by the nodes it
+        produces.
         """
-        new_children = []
-        
-        for child in node.children:
-            # If we hit a leaf Text node, explode it!
-            if isinstance(child, Text):
-                content = child.content if child.content is not None else ""
-                parsed_nodes = self.inline_parser.parse(content)
-                new_children.extend(parsed_nodes)
-            else:
-                # If it's a block (Heading/Paragraph), recurse deeper
-                self._process_inline_elements(child)
-                new_children.append(child)
-        
-        node.children = new_children
+        inline_parser = self.inline_parser
+        # Code is text as written: code blocks are never inline-parsed
+        stack = [] if isinstance(node, CodeBlock) else [node]
+        while stack:
+            current = stack.pop()
+            new_children = []
+
+            for child in current.children:
+                # If we hit a leaf Text node, explode it!
+                if isinstance(child, SourceText):
+                    new_children.extend(inline_parser.parse_span(child.source, child.start, child.end, child.fold))
+                elif isinstance(child, Text):
+                    content = child.content if child.content is not None else ""
+                    new_children.extend(inline_parser.parse(content))
+                else:
+                    # A block (Heading/Paragraph/List): walk it too
+                    if child.children and not isinstance(child, CodeBlock):
+                        stack.append(child)
+                    new_children.append(child)
+
+            current.children = new_children
@@ -0,0 +1,162 @@
+"""
+Low-memory batch mode: `convert_all(..., memory_budget=bytes)` (or
+`batch_converter.py --memory-budget MB`) converts one note at a time and
+keeps the resident set within the budget as far as the notes allow.
+
+- Each note goes through parse, render and write on its own, and nothing
+  of it outlives its conversion: the AST is dropped as soon as the page is
+  written.
+- Notes too large to hold whole (NOTE_OVERHEAD times their size would not
+  fit in what the budget leaves) are streamed: hashed in one pass, then
+  parsed, rendered and written one top-level block at a time.
+- The run's long-lived state is frozen out of the garbage collector
+  (`gc.freeze`), and collection is paused while a note is converted. AST
+  nodes hold no reference cycles, so refcounting frees them as soon as the
+  note is done, and the node-heavy parse no longer triggers collections
+  that scan objects which are all still alive.
+- Whenever the resident set ends up over the budget after a note, freed
+  heap is handed back to the OS (`gc.collect`, then glibc's
+  `malloc_trim`).
+
+The peak resident set of every note is recorded (on Linux the kernel's
+high-water mark is reset before each note; elsewhere the process-wide
+peak is the best available) and reported by `convert_all`.
+"""
+import contextlib
+import ctypes
+import ctypes.util
+import gc
+import os
+import re
+import sys
+from typing import Dict, Iterator, Optional, Set
+
+# Resident bytes per source byte while a note is converted whole: its raw
+# bytes, the decoded text, the AST and allocator slack. bench.memory
+# measures 27-28x on long notes.
+NOTE_OVERHEAD = 30
+
+_HWM_RE = re.compile(r"VmHWM:\s+(\d+) kB")
+_malloc_trim = None
+
+def current_rss() -> Optional[int]:
+    """The resident set of this process in bytes, or None where it cannot be read."""
+    try:
+        with open("/proc/self/statm", "rb") as f:
+            return int(f.read().split()[1]) * os.sysconf("SC_PAGE_SIZE")
+    except (OSError, ValueError):
+        return None
+
+def peak_rss() -> int:
+    """The peak resident set in bytes since the last `reset_peak`, or since the process started."""
+    try:
+        with open("/proc/self/status", "r") as f:
+            match = _HWM_RE.search(f.read())
+        if match:
+            return int(match.group(1)) * 1024
+    except OSError:
+        pass
+    import resource
+    peak = resource.getrusage(resource.RUSAGE_SELF).ru_maxrss
+    # Kilobytes on Linux, bytes on macOS
+    return peak if sys.platform == "darwin" else peak * 1024
+
+def reset_peak() -> bool:
+    """Resets the kernel's record of the peak resident set (Linux); False where that is not possible."""
+    try:
+        with open("/proc/self/clear_refs", "w") as f:
+            f.write("5")
+        return True
+    except OSError:
+        return False
+
+def release_memory():
+    """Collects garbage and returns free heap memory to the OS where the allocator allows it."""
+    global _malloc_trim
+    gc.collect()
+    if _malloc_trim is None:
+        _malloc_trim = False
+        libc_name = ctypes.util.find_library("c")
+        if libc_name:
+            try:
+                _malloc_trim = ctypes.CDLL(libc_name).malloc_trim
+            except (OSError, AttributeError):
+                pass
+    if _malloc_trim:
+        _malloc_trim(0)
+
+class MemoryBudget:
+    """
+    The memory budget of a low-memory run: decides which notes are streamed,
+    tunes the garbage collector around each note and records its peak
+    resident set in `peaks`.
+
+        budget = MemoryBudget(256 * 2**20)
+        budget.start()
+        for rel, size in notes:
+            stream = budget.should_stream(size)
+            with budget.note(rel, stream):
+                convert(rel, stream)
+        budget.finish()
+    """
+    def __init__(self, limit: int):
+        if limit <= 0:
+            raise ValueError("The memory budget must be positive")
+        self.limit = limit
+        # Resident set once the run's state is loaded; notes get the rest.
+        self.baseline = 0
+        # Peak resident set in bytes while each note was converted
+        self.peaks: Dict[str, int] = {}
+        self.streamed: Set[str] = set()
+        self._frozen = False
+
+    def start(self):
+        """Call once the run's long-lived state is loaded, before the first note."""
+        gc.collect()
+        gc.freeze()
+        self._frozen = True
+        self.baseline = current_rss() or 0
+
+    def finish(self):
+        if self._frozen:
+            gc.unfreeze()
+            self._frozen = False
+
+    def should_stream(self, size: int) -> bool:
+        """True if a note of `size` bytes would not fit in the budget converted whole."""
+        return size * NOTE_OVERHEAD > self.limit - self.baseline
+
+    @contextlib.contextmanager
+    def note(self, rel: str, streamed: bool = False) -> Iterator[None]:
+        """Converts a note (the body of the `with`) with collection paused, recording its peak."""
+        if streamed:
+            self.streamed.add(rel)
+        reset_peak()
+        enabled = gc.isenabled()
+        gc.disable()
+        try:
+            yield
+        finally:
+            if enabled:
+                gc.enable()
+        self.peaks[rel] = peak_rss()
+        rss = current_rss()
+        if rss is not None and rss > self.limit:
+            release_memory()
+
+    def describe(self, rel: str) -> str:
+        """What the progress line of a converted note adds: its peak RSS, and whether it was streamed."""
+        text = f" peak RSS {self.peaks[rel] / (1024 * 1024):.1f} MB"
+        return text + " (streamed)" if rel in self.streamed else text
+
+    def report(self) -> str:
+        """One line: the highest peak against the budget, and how many notes were streamed."""
+        mb = 1024 * 1024
+        line = f"Memory budget {self.limit / mb:.1f} MB"
+        if self.peaks:
+            worst = max(self.peaks, key=self.peaks.get)
+            peak = self.peaks[worst]
+            line += f", peak RSS {peak / mb:.1f} MB ({worst})"
+            if peak > self.limit:
+                line += ", over budget"
+        return line + f"; {len(self.streamed)} notes streamed."
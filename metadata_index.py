@@ -0,0 +1,138 @@
+from pathlib import Path
+from typing import Dict, Iterable, Optional, Tuple, Union
+from concurrent.futures import ProcessPoolExecutor
+import argparse
+import json
+import os
+from ast_nodes import Document
+from block_processors import LineReader, FrontMatterProcessor
+from batch_converter import collect_sources, shard_arg, shard_of
+
+INDEX_FORMAT = 1
+METADATA_NAME = ".metadata.json"
+
+_front_matter_processor = FrontMatterProcessor()
+
+def _closing_aware(lines: Iterable[str]) -> Iterable[str]:
+    """
+    Yields lines without their newline and stops right after the closing
+    `---`, so LineReader's lookahead never pulls in the note body.
+    """
+    seen_opening = False
+    for line in lines:
+        line = line.rstrip('\n')
+        yield line
+        if line.strip() == '---':
+            if seen_opening:
+                return
+            seen_opening = True
+
+def scan_front_matter(lines: Iterable[str]) -> dict:
+    """Parses only the front matter at the top of `lines`; returns {} if there is none."""
+    reader = LineReader(_closing_aware(lines))
+    if not reader.has_next() or not _front_matter_processor.can_start(reader.peek()):
+        return {}
+    scratch = Document()
+    return _front_matter_processor.run(scratch, reader).meta
+
+# Front matter is almost always within the first block of a note.
+_READ_SIZE = 4096
+
+def _front_matter_end(data: bytes, at_eof: bool) -> int:
+    """
+    Returns the offset just past the closing `---` line in `data`, -1 if more
+    input is needed, or len(data) at EOF without a closing line.
+    """
+    start = data.find(b'\n') + 1 # Skip the opening line
+    while start:
+        end = data.find(b'\n', start)
+        if end == -1:
+            if at_eof and data[start:].strip() == b'---':
+                return len(data)
+            break
+        if data[start:end].strip() == b'---':
+            return end + 1
+        start = end + 1
+    return len(data) if at_eof else -1
+
+def read_front_matter(path: Union[str, os.PathLike], encoding: str = 'utf-8') -> dict:
+    """Reads a note only as far as the end of its front matter and returns the parsed `meta`."""
+    # Raw reads: a buffered text-mode open costs more than the parse itself.
+    fd = os.open(path, os.O_RDONLY)
+    try:
+        data = os.read(fd, _READ_SIZE)
+        at_eof = len(data) < _READ_SIZE
+        first_line = data.split(b'\n', 1)[0]
+        if not _front_matter_processor.can_start(first_line.decode(encoding, 'replace')):
+            return {}
+        while True:
+            end = _front_matter_end(data, at_eof)
+            if end != -1:
+                break
+            chunk = os.read(fd, _READ_SIZE)
+            at_eof = not chunk
+            data += chunk
+    finally:
+        os.close(fd)
+    return scan_front_matter(data[:end].decode(encoding).split('\n'))
+
+def _scan_chunk(job) -> list:
+    input_path, rels = job
+    return [read_front_matter(os.path.join(input_path, rel)) for rel in rels]
+
+def build_metadata_index(input_dir: str, workers: Optional[int] = 1,
+                         shard: Optional[Tuple[int, int]] = None) -> Dict[str, dict]:
+    """
+    Returns {relative note path: front matter} for every note `convert_all`
+    would convert. `workers` > 1 scans on a process pool (None uses every core).
+    With `shard` = (i, N), only the notes of shard i are scanned, as in
+    `convert_all`.
+    """
+    input_path = Path(input_dir).expanduser()
+    sources = collect_sources(input_path)
+    if shard is not None:
+        index, count = shard
+        sources = [rel for rel in sources if shard_of(rel, count) == index]
+    if workers is None:
+        workers = os.cpu_count() or 1
+
+    if workers <= 1 or len(sources) <= 1:
+        metas = [read_front_matter(os.path.join(input_path, rel)) for rel in sources]
+    else:
+        # One chunk per task keeps IPC to a few large messages.
+        size = max(1, len(sources) // (workers * 4))
+        chunks = [(str(input_path), sources[i:i + size]) for i in range(0, len(sources), size)]
+        metas = []
+        with ProcessPoolExecutor(max_workers=workers) as pool:
+            for result in pool.map(_scan_chunk, chunks):
+                metas.extend(result)
+
+    return {rel: meta for rel, meta in zip(sources, metas) if meta}
+
+def save_metadata_index(index: Dict[str, dict], path: Union[str, os.PathLike]):
+    data = {'format': INDEX_FORMAT, 'notes': index}
+    tmp = f"{path}.tmp"
+    with open(tmp, 'w', encoding='utf-8') as f:
+        json.dump(data, f, separators=(',', ':'), ensure_ascii=False)
+    os.replace(tmp, path)
+
+def load_metadata_index(path: Union[str, os.PathLike]) -> Dict[str, dict]:
+    with open(path, 'r', encoding='utf-8') as f:
+        data = json.load(f)
+    if data.get('format') != INDEX_FORMAT:
+        raise ValueError(f"Unsupported metadata index format in {path}")
+    return data['notes']
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Index the front matter of every note in a vault.")
+    ap.add_argument("input_dir", nargs="?", default="~/Obsidian_Vault")
+    ap.add_argument("output", nargs="?", default=f"output_html/{METADATA_NAME}")
+    ap.add_argument("-j", "--workers", type=int, default=1,
+                    help="number of worker processes (0 = one per CPU core)")
+    ap.add_argument("--shard", metavar="I/N", type=shard_arg,
+                    help="index only shard I of N (0-based) of the notes, as batch_converter.py --shard does")
+    args = ap.parse_args()
+
+    index = build_metadata_index(args.input_dir, workers=args.workers or None, shard=args.shard)
+    save_metadata_index(index, args.output)
+    print(f"Indexed front matter of {len(index)} notes into {args.output}")
@@ -0,0 +1,109 @@
+import os
+import re
+from typing import Dict, List, Sequence
+from manifest import content_digest
+from renderer import escape_html
+
+# Shared assets live in this directory of the output tree.
+ASSETS_DIR = "_assets"
+
+class Asset:
+    """
+    A file shared by every page (stylesheet, script). It is written once per
+    build under a content-hashed name, e.g. `_assets/style.3f2a9c81d0e4.css`,
+    so browsers can cache it indefinitely and an edit produces a new URL.
+    """
+    def __init__(self, name: str, data: bytes):
+        self.name = name
+        self.data = data
+        stem, ext = os.path.splitext(name)
+        self.ext = ext.lower()
+        self.path = f"{ASSETS_DIR}/{stem}.{content_digest(data)[:12]}{ext}"
+
+    @classmethod
+    def from_file(cls, path: str) -> 'Asset':
+        with open(path, 'rb') as f:
+            return cls(os.path.basename(path), f.read())
+
+class PageTemplate:
+    """
+    The HTML wrapped around each rendered note, compiled once per run.
+
+    Every page links the shared assets (relative to its own directory)
+    instead of inlining them. With `inline_css`, stylesheets are embedded in
+    each page instead, which makes pages self-contained.
+    """
+    # Bump whenever the page layout changes (see batch_converter.build_key).
+    VERSION = 2
+
+    FOOTER = "\n</body>\n</html>"
+
+    def __init__(self, assets: Sequence[Asset] = (), inline_css: bool = False):
+        self.assets = list(assets)
+        self.inline_css = inline_css
+        self._head = "<!DOCTYPE html>\n<html>\n<head>\n    <title>"
+        # The rest of <head> for each directory depth; only the asset hrefs differ.
+        self._head_end: Dict[int, str] = {}
+
+        inline = [a for a in self.assets if inline_css and a.ext == '.css']
+        self._linked = [a for a in self.assets if a not in inline]
+        self._inline_style = "".join(
+            f"    <style>\n        {a.data.decode('utf-8')}\n    </style>\n" for a in inline
+        )
+
+    @property
+    def key(self) -> str:
+        """Identifies the layout and asset contents, for the build manifest."""
+        assets = ",".join(a.path for a in self.assets)
+        return f"template={self.VERSION};inline_css={int(self.inline_css)};assets={assets}"
+
+    def header(self, rel: str, title: str) -> str:
+        """Everything before the body of the page for note `rel` (relative posix path)."""
+        depth = rel.count('/')
+        head_end = self._head_end.get(depth)
+        if head_end is None:
+            head_end = self._head_end[depth] = self._compile_head_end("../" * depth)
+        return self._head + escape_html(title) + head_end
+
+    def _compile_head_end(self, prefix: str) -> str:
+        parts = ["</title>\n", self._inline_style]
+        for asset in self._linked:
+            if asset.ext == '.css':
+                parts.append(f'    <link rel="stylesheet" href="{prefix}{asset.path}">\n')
+            elif asset.ext == '.js':
+                parts.append(f'    <script src="{prefix}{asset.path}" defer></script>\n')
+        parts.append("</head>\n<body>\n    ")
+        return "".join(parts)
+
+    def write_assets(self, output_path: str) -> List[str]:
+        """
+        Writes the linked assets under `output_path` unless an identical file
+        (same hashed name) is already there, and deletes earlier versions of
+        them. Returns the paths written.
+        """
+        written = []
+        for asset in self._linked:
+            target = os.path.join(output_path, asset.path)
+            if os.path.exists(target):
+                continue
+            os.makedirs(os.path.dirname(target), exist_ok=True)
+            tmp = target + ".tmp"
+            with open(tmp, 'wb') as f:
+                f.write(asset.data)
+            os.replace(tmp, target)
+            written.append(asset.path)
+
+        # Only files named like one of our assets are touched; anything else
+        # in the directory (say, a vault folder of the same name) is left alone.
+        current = {os.path.basename(a.path) for a in self._linked}
+        versions = [re.compile(re.escape(stem) + r"\.[0-9a-f]{12}" + re.escape(ext) + "$")
+                    for stem, ext in (os.path.splitext(a.name) for a in self.assets)]
+        directory = os.path.join(output_path, ASSETS_DIR)
+        try:
+            existing = os.listdir(directory)
+        except FileNotFoundError:
+            return written
+        for name in existing:
+            if name not in current and any(v.match(name) for v in versions):
+                os.unlink(os.path.join(directory, name))
+        return written
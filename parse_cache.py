@@ -0,0 +1,187 @@
+"""
+Memoized parsing for text that repeats: template boilerplate, identical list
+items and headings across daily notes, or a whole file parsed twice by a
+multi-step pipeline.
+
+    parser = CachingParser()
+    doc = parser.parse(text)   # a miss: parsed, and its blocks cached
+    doc = parser.parse(text)   # a hit: a new Document sharing those blocks
+    print(parser.stats())
+
+Parsed blocks are shared, not copied, the way `Parser.reparse` shares
+unchanged blocks between documents, and are made read-only when they are
+cached (`ast_nodes.freeze_nodes`). Every call returns its own Document
+with its own list of top-level blocks, so blocks can be added, removed or
+replaced freely; changing anything inside a block raises instead of
+changing the cache. Replace the block with a `copy()` to edit it.
+
+A hit then costs a hash of the text and a list copy. A miss costs a hash
+and the freeze on top of the parse, plus the garbage collector's work on
+the cached trees it keeps alive: about 40% of a parse on notes that never
+repeat (bench.cache), which is why only repeated text is worth caching.
+"""
+import gc
+from collections import OrderedDict
+from typing import Any, Dict, Hashable, List, Optional, Tuple
+
+from ast_nodes import Document, Node, freeze_nodes
+from inline_parser import InlineParser
+from manifest import content_digest
+from md_parser import Parser
+
+class LRUCache:
+    """
+    A mapping bounded by entry count and by total size (as reported by the
+    caller on `put`). The least recently used entries are evicted first.
+
+    With `admit_on_repeat`, a key is only stored the second time it is put
+    within the last `max_entries` first sightings, so one-off keys never
+    displace entries that are being reused (and cost no copy to store).
+    """
+    def __init__(self, max_entries: int, max_bytes: int, admit_on_repeat: bool = False):
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.admit_on_repeat = admit_on_repeat
+        self._entries: 'OrderedDict[Hashable, Tuple[Any, int]]' = OrderedDict()
+        self._seen: Dict[Hashable, None] = {}
+        self.bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+
+    def __len__(self) -> int:
+        return len(self._entries)
+
+    def get(self, key: Hashable) -> Optional[Any]:
+        entry = self._entries.get(key)
+        if entry is None:
+            self.misses += 1
+            return None
+        self.hits += 1
+        self._entries.move_to_end(key)
+        return entry[0]
+
+    def put(self, key: Hashable, value: Any, size: int) -> bool:
+        """
+        Stores `value` and returns True, unless it is larger than the whole
+        cache or not admitted (see `admit_on_repeat`).
+        """
+        if size > self.max_bytes or self.max_entries <= 0:
+            return False
+        if self.admit_on_repeat and self._seen.pop(key, True):
+            if len(self._seen) >= self.max_entries:
+                self._seen.clear()
+            self._seen[key] = None
+            return False
+        old = self._entries.pop(key, None)
+        if old is not None:
+            self.bytes -= old[1]
+        self._entries[key] = (value, size)
+        self.bytes += size
+        while len(self._entries) > self.max_entries or self.bytes > self.max_bytes:
+            _, (_, evicted) = self._entries.popitem(last=False)
+            self.bytes -= evicted
+            self.evictions += 1
+        return True
+
+    def clear(self):
+        self._entries.clear()
+        self._seen.clear()
+        self.bytes = 0
+
+    def stats(self) -> Dict[str, float]:
+        lookups = self.hits + self.misses
+        return {
+            'entries': len(self._entries),
+            'bytes': self.bytes,
+            'hits': self.hits,
+            'misses': self.misses,
+            'evictions': self.evictions,
+            'hit_rate': self.hits / lookups if lookups else 0.0,
+        }
+
+class CachingInlineParser(InlineParser):
+    """
+    An InlineParser that memoizes `parse` for fragments of up to
+    `max_fragment` characters, keyed by the text itself. Longer fragments
+    rarely repeat and are parsed directly. `parse_span` is not cached: its
+    SourceText leaves point into one particular source string.
+
+    Hits hand out the cached nodes in a new list; like CachingParser's
+    blocks, the nodes are read-only. Give it a cache with `admit_on_repeat`:
+    most fragments of a vault are seen once.
+    """
+    def __init__(self, cache: LRUCache, max_fragment: int = 256):
+        super().__init__()
+        self.cache = cache
+        self.max_fragment = max_fragment
+
+    def parse(self, text: str) -> List[Node]:
+        if len(text) > self.max_fragment:
+            return super().parse(text)
+        nodes = self.cache.get(text)
+        if nodes is None:
+            nodes = super().parse(text)
+            cached = tuple(nodes)
+            if self.cache.put(text, cached, len(text)):
+                freeze_nodes(cached)
+            return nodes
+        return list(nodes)
+
+class CachingParser(Parser):
+    """
+    A Parser that memoizes whole documents by the content digest of their
+    text and, if `max_fragments` > 0, inline fragments by the text itself.
+
+    Entry limits count cached documents and fragments; byte limits count the
+    UTF-8 size of the source text they were parsed from, which is several
+    times smaller than the ASTs themselves. Lazy parses are not cached, since
+    their blocks hold on to the parser until they are read.
+
+    The fragment cache is off by default: inline-parsing a short fragment
+    costs little more than looking it up. In bench.cache it only pays off
+    on templated daily notes parsed once (about 15% faster) and makes
+    unique notes 10-20% slower.
+    """
+    def __init__(self, max_documents: int = 1024, max_document_bytes: int = 32 * 2**20,
+                 max_fragments: int = 0, max_fragment_bytes: int = 4 * 2**20):
+        super().__init__()
+        self.cache = LRUCache(max_documents, max_document_bytes)
+        self.fragments = LRUCache(max_fragments, max_fragment_bytes, admit_on_repeat=True)
+        if max_fragments > 0:
+            self.inline_parser = CachingInlineParser(self.fragments)
+
+    def parse(self, text: str, spans: bool = False, lazy: bool = False) -> Document:
+        if lazy:
+            return super().parse(text, spans, lazy)
+        data = text.encode('utf-8')
+        key = (content_digest(data), spans)
+        entry = self.cache.get(key)
+        if entry is None:
+            # The blocks will be kept alive by the cache anyway, so collections
+            # triggered by the node-heavy parse would only scan live objects
+            # (AST nodes hold no cycles; see memory_budget.py).
+            enabled = gc.isenabled()
+            gc.disable()
+            try:
+                doc = super().parse(text, spans)
+                # The blocks are shared with every later hit, so nobody may change them
+                freeze_nodes(doc.children)
+            finally:
+                if enabled:
+                    gc.enable()
+            self.cache.put(key, (tuple(doc.children), doc._block_starts), len(data))
+            return doc
+        blocks, starts = entry
+        doc = Document()
+        doc.children = list(blocks)
+        doc._block_starts = starts
+        return doc
+
+    def stats(self) -> Dict[str, Dict[str, float]]:
+        """Hit/miss statistics of the document and fragment caches."""
+        return {'documents': self.cache.stats(), 'fragments': self.fragments.stats()}
+
+    def clear(self):
+        self.cache.clear()
+        self.fragments.clear()
@@ -0,0 +1,260 @@
+"""
+Opt-in instrumentation of a conversion.
+
+    profiler = Profiler()
+    convert_all(input_dir, output_dir, profiler=profiler)
+    print(profiler.report())
+    profiler.write_trace("trace.json") # open in chrome://tracing or Perfetto
+
+Per note it records the time spent reading, in the block pass, in the
+inline pass, rendering and writing, plus bytes read and AST node count.
+Per block processor it records calls and time. Everything is also kept as
+a timeline that can be exported in Chrome's trace-event format.
+
+Code paths that take a profiler default to NULL_PROFILER, whose hooks do
+nothing; per-processor timing wraps the processors of an instrumented
+parser only, so a conversion without a profiler runs the same code as before.
+"""
+import contextlib
+import json
+import os
+import time
+from typing import Dict, Iterable, Iterator, List, Optional, Tuple, TypeVar
+
+from ast_nodes import Node
+
+# The phases of a note, in pipeline order. A phase nested in another (the
+# inline pass inside the parse, or a streamed note's parsing inside its
+# rendering) counts towards itself only, so the phases add up to the time
+# spent. `parse_blocks` is what remains of the parse.
+PHASES = ("read", "parse_blocks", "parse_inline", "render", "write")
+
+# (name, category, start, end, pid, args) with times in perf_counter seconds
+Event = Tuple[str, str, float, float, int, Optional[dict]]
+
+T = TypeVar('T')
+_END = object()
+
+def count_nodes(node: Node) -> int:
+    """Number of nodes in the tree under `node`, including itself."""
+    count = 0
+    stack = [node]
+    while stack:
+        current = stack.pop()
+        count += 1
+        stack.extend(current.children)
+    return count
+
+class NoteProfile:
+    """What one note cost."""
+    __slots__ = ('rel', 'bytes', 'nodes', 'converted', 'phases', 'total')
+
+    def __init__(self, rel: str):
+        self.rel = rel
+        self.bytes = 0
+        self.nodes = 0
+        self.converted = False
+        self.phases: Dict[str, float] = {}
+        self.total = 0.0
+
+class Profiler:
+    """Collects timings; see the module docstring."""
+    enabled = True
+
+    def __init__(self):
+        self.notes: List[NoteProfile] = []
+        # Processor class name -> [calls, seconds]
+        self.processors: Dict[str, List[float]] = {}
+        self.events: List[Event] = []
+        self._note: Optional[NoteProfile] = None
+        # Per open phase, the time spent in the phases nested in it so far
+        self._nested: List[float] = []
+        self._pid = os.getpid()
+
+    def instrument(self, parser):
+        """
+        Wraps the block processors and the inline pass of `parser` (an
+        md_parser.Parser) so each call is timed. Only this instance changes.
+        """
+        for processor in [parser.front_matter_processor, *parser.processors]:
+            processor.run = self._timed_processor(type(processor).__name__, processor.run)
+        inline = parser._process_inline_elements
+
+        def process_inline_elements(node):
+            with self.phase("parse_inline"):
+                inline(node)
+        parser._process_inline_elements = process_inline_elements
+
+    def _timed_processor(self, name: str, run):
+        stat = self.processors.setdefault(name, [0, 0.0])
+        events = self.events
+        pid = self._pid
+        clock = time.perf_counter
+
+        def timed_run(parent, reader):
+            start = clock()
+            try:
+                return run(parent, reader)
+            finally:
+                end = clock()
+                stat[0] += 1
+                stat[1] += end - start
+                events.append((name, "processor", start, end, pid, None))
+        return timed_run
+
+    @contextlib.contextmanager
+    def note(self, rel: str):
+        """Everything recorded inside belongs to note `rel`."""
+        note = self._note = NoteProfile(rel)
+        start = time.perf_counter()
+        try:
+            yield note
+        finally:
+            end = time.perf_counter()
+            note.total = end - start
+            phases = note.phases
+            if "parse" in phases:
+                phases["parse_blocks"] = phases.pop("parse")
+            self.notes.append(note)
+            self.events.append((rel, "note", start, end, self._pid, {"bytes": note.bytes, "nodes": note.nodes}))
+            self._note = None
+
+    @contextlib.contextmanager
+    def phase(self, name: str):
+        """
+        Times a step of the current note (one of PHASES, or "parse"), minus
+        the phases nested in it. The trace keeps the whole span.
+        """
+        nested = self._nested
+        nested.append(0.0)
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            end = time.perf_counter()
+            inner = nested.pop()
+            if nested:
+                nested[-1] += end - start
+            if self._note is not None:
+                phases = self._note.phases
+                phases[name] = phases.get(name, 0.0) + end - start - inner
+            self.events.append((name, "phase", start, end, self._pid, None))
+
+    def phase_iter(self, name: str, items: Iterable[T]) -> Iterator[T]:
+        """Yields from `items`, timing the work of producing each one as phase `name`."""
+        iterator = iter(items)
+        while True:
+            with self.phase(name):
+                item = next(iterator, _END)
+            if item is _END:
+                return
+            yield item
+
+    @contextlib.contextmanager
+    def run_phase(self, name: str):
+        """Times a step of the whole run (scanning, the manifest) that belongs to no note."""
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.events.append((name, "run", start, time.perf_counter(), self._pid, None))
+
+    def parsed(self, nbytes: int, doc: Optional[Node]):
+        """Records the size and AST of the current note (None: streamed, its nodes are not counted)."""
+        note = self._note
+        if note is not None:
+            note.bytes = nbytes
+            note.nodes = count_nodes(doc) if doc is not None else 0
+            note.converted = True
+
+    def drain(self) -> tuple:
+        """Hands over (and forgets) what was recorded, e.g. to ship it out of a worker process."""
+        processors = {name: tuple(stat) for name, stat in self.processors.items()}
+        # Reset in place: the instrumented processors hold on to these lists.
+        for stat in self.processors.values():
+            stat[:] = [0, 0.0]
+        recorded = (self.notes, processors, self.events[:])
+        self.notes = []
+        self.events.clear()
+        return recorded
+
+    def merge(self, recorded: tuple):
+        """Adds what another profiler drained."""
+        notes, processors, events = recorded
+        self.notes.extend(notes)
+        self.events.extend(events)
+        for name, (calls, seconds) in processors.items():
+            stat = self.processors.setdefault(name, [0, 0.0])
+            stat[0] += calls
+            stat[1] += seconds
+
+    def report(self, top: int = 10) -> str:
+        """A plain-text summary: time per phase and processor, and the slowest notes."""
+        notes = self.notes
+        total = sum(note.total for note in notes)
+        nbytes = sum(note.bytes for note in notes)
+        converted = sum(note.converted for note in notes)
+        lines = [f"{len(notes)} notes ({converted} converted), {nbytes / 1e6:.2f} MB, "
+                 f"{sum(note.nodes for note in notes):,} nodes, {total:.3f}s in notes"]
+
+        lines.append(f"\n{'phase':<16}{'seconds':>10}{'share':>8}")
+        for phase in PHASES:
+            seconds = sum(note.phases.get(phase, 0.0) for note in notes)
+            share = seconds / total if total else 0.0
+            lines.append(f"{phase:<16}{seconds:>10.3f}{share:>8.1%}")
+        run_phases: Dict[str, float] = {}
+        for name, cat, start, end, _, _ in self.events:
+            if cat == "run":
+                run_phases[name] = run_phases.get(name, 0.0) + end - start
+        for name, seconds in run_phases.items():
+            lines.append(f"{name + ' (run)':<16}{seconds:>10.3f}")
+
+        if self.processors:
+            lines.append(f"\n{'processor':<24}{'calls':>9}{'seconds':>10}{'us/call':>9}")
+            for name, (calls, seconds) in sorted(self.processors.items(), key=lambda item: -item[1][1]):
+                per_call = seconds / calls * 1e6 if calls else 0.0
+                lines.append(f"{name:<24}{calls:>9}{seconds:>10.3f}{per_call:>9.1f}")
+
+        lines.append(f"\nslowest notes{'ms':>45}{'bytes':>10}{'nodes':>8}  slowest phase")
+        for note in sorted(notes, key=lambda note: -note.total)[:top]:
+            phase = max(note.phases, key=note.phases.get) if note.phases else "-"
+            lines.append(f"{note.rel:<50.50}{note.total * 1000:>8.2f}{note.bytes:>10}{note.nodes:>8}  {phase}")
+        return "\n".join(lines)
+
+    def trace(self) -> dict:
+        """The timeline in Chrome's trace-event format (complete events, microseconds)."""
+        origin = min((start for _, _, start, _, _, _ in self.events), default=0.0)
+        trace_events = []
+        for name, cat, start, end, pid, args in self.events:
+            event = {"name": name, "cat": cat, "ph": "X", "pid": pid, "tid": pid,
+                     "ts": round((start - origin) * 1e6, 3), "dur": round((end - start) * 1e6, 3)}
+            if args:
+                event["args"] = args
+            trace_events.append(event)
+        return {"traceEvents": trace_events, "displayTimeUnit": "ms"}
+
+    def write_trace(self, path: str):
+        with open(path, 'w', encoding='utf-8') as f:
+            json.dump(self.trace(), f)
+
+class NullProfiler:
+    """Stands in for a Profiler when profiling is off: every hook does nothing."""
+    enabled = False
+    _nothing = contextlib.nullcontext()
+
+    def note(self, rel: str):
+        return self._nothing
+
+    def phase(self, name: str):
+        return self._nothing
+
+    def run_phase(self, name: str):
+        return self._nothing
+
+    def parsed(self, nbytes: int, doc: Optional[Node]):
+        pass
+
+    def phase_iter(self, name: str, items: Iterable[T]) -> Iterable[T]:
+        return items
+
+NULL_PROFILER = NullProfiler()
@@ -1,73 +1,455 @@
-from ast_nodes import Node, Document, Heading, Paragraph, Text, WikiLink, Italic, Bold, CodeBlock, ListNode, ListItem, InlineCode, FrontMatter
+from collections import OrderedDict
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, TextIO, Tuple, Union
+from ast_nodes import BlockEdit, Node, Document, Heading, Paragraph, Text, WikiLink, Italic, Bold, CodeBlock, ListNode, ListItem, InlineCode, FrontMatter
 from visitor import NodeVisitor
+from link_index import LinkResolver
+from search_index import BOLD_WEIGHT, HEADING_WEIGHT, count_terms
 import os
 
+def escape_html(text: str) -> str:
+    """
+    Escapes `&`, `<` and `>` for element content. Text without any of them
+    (most prose) is returned as is after three substring scans, which is
+    cheaper than building a copy.
+    """
+    if '&' in text or '<' in text or '>' in text:
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+    return text
+
+def escape_attr(text: str) -> str:
+    """Like `escape_html`, for double-quoted attribute values: also escapes `"`."""
+    if '&' in text or '<' in text or '>' in text or '"' in text:
+        return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;').replace('"', '&quot;')
+    return text
+
 class HTMLRenderer(NodeVisitor):
+    """
+    Renders the AST to HTML.
+
+    HTML fragments are appended to `self._out`, a list of fragments, so
+    nothing is re-joined per nesting level and the page can be streamed out
+    block by block.
+
+    With `iterative`, trees are walked with an explicit stack instead of
+    recursion, so arbitrarily deep nesting cannot hit the recursion limit.
+    """
+    # Bump whenever the generated HTML changes so incremental builds
+    # (see manifest.py) know to regenerate every page.
+    VERSION = 5
+
+    # render_to() flushes to the writer once this many characters are pending.
+    BUFFER_SIZE = 64 * 1024
+
+    # Escaped copies of texts at least this long (in practice: code blocks)
+    # are kept, so re-rendering a page (watch mode, several output formats)
+    # does not escape them again. At most ESCAPE_CACHE_SIZE texts, of
+    # ESCAPE_CACHE_CHARS characters in all (texts plus escaped copies), are
+    # kept; the least recently used go first, and larger texts never stay.
+    ESCAPE_CACHE_MIN = 1024
+    ESCAPE_CACHE_SIZE = 256
+    ESCAPE_CACHE_CHARS = 4 * 2**20
+
+    def __init__(self, link_resolver: Optional[LinkResolver] = None, iterative: bool = False):
+        self._out: List[str] = []
+        # NodeVisitor hands every fragment to `emit`; see _set_out.
+        self.emit = self._out.append
+        self.iterative = iterative
+        # Resolves WikiLink targets to page hrefs (see link_index.py).
+        # Without one, links point at their target text verbatim.
+        self.link_resolver = link_resolver
+        # Relative path of the note being rendered; hrefs are relative to it.
+        self.page = ""
+        self._css: Optional[str] = None
+        self._escaped: 'OrderedDict[str, str]' = OrderedDict()
+        self._escaped_chars = 0
+
     def render(self, node: Node) -> str:
         """Entry point for the renderer."""
-        return self.visit(node)
+        saved = self._set_out([])
+        try:
+            self._emit(node)
+            return "".join(self._out)
+        finally:
+            self._set_out(saved)
+
+    def render_iter(self, node: Union[Node, Iterable[Node]]) -> Iterator[str]:
+        """
+        Yields the HTML for `node` in chunks. A Document is rendered and
+        yielded one top-level block at a time, so only one block's HTML is
+        held in memory. `node` can also be an iterable of top-level blocks,
+        such as `Parser.parse_file`, rendered as the document they form.
+        """
+        out: List[str] = []
+        saved = self._set_out(out)
+        try:
+            for block in _blocks(node):
+                self._emit(block)
+                if out:
+                    yield "".join(out)
+                    out.clear()
+        finally:
+            self._set_out(saved)
+
+    def render_blocks(self, doc: Document) -> List[str]:
+        """The HTML of each top-level block of `doc`; joined, they equal `render(doc)`."""
+        return [self.render(block) for block in doc.children]
+
+    def update_blocks(self, blocks: List[str], edit: BlockEdit):
+        """
+        Updates `blocks` (from `render_blocks` of the previous document) after
+        `Parser.reparse`, re-rendering only the blocks the edit replaced.
+        """
+        blocks[edit.start:edit.old_end] = [self.render(block) for block in edit.doc.children[edit.start:edit.end]]
+
+    def render_to(self, node: Union[Node, Iterable[Node]], writable: TextIO) -> int:
+        """
+        Streams the HTML for `node` into `writable` in buffered chunks.
+        Returns the number of characters written.
+        """
+        pending = []
+        pending_size = 0
+        total = 0
+        for fragment in self.render_iter(node):
+            pending.append(fragment)
+            pending_size += len(fragment)
+            if pending_size >= self.BUFFER_SIZE:
+                writable.write("".join(pending))
+                total += pending_size
+                pending.clear()
+                pending_size = 0
+        if pending:
+            writable.write("".join(pending))
+            total += pending_size
+        return total
+
+    def _set_out(self, out: List[str]) -> List[str]:
+        """Points the output buffer (and `emit`) at `out`; returns the previous buffer."""
+        saved = self._out
+        self._out = out
+        self.emit = out.append
+        return saved
 
     def get_css(self) -> str:
-        css_path = os.path.join(os.path.dirname(__file__), 'style.css')
-        if os.path.exists(css_path):
-            with open(css_path, 'r', encoding='utf-8') as f:
-                return f.read()
-        return ""
+        """The stylesheet shipped next to this module, read once per renderer."""
+        if self._css is None:
+            css_path = os.path.join(os.path.dirname(__file__), 'style.css')
+            self._css = ""
+            if os.path.exists(css_path):
+                with open(css_path, 'r', encoding='utf-8') as f:
+                    self._css = f.read()
+        return self._css
 
-    def visit_Document(self, node: Document) -> str:
-        return "".join(self.visit(child) for child in node.children)
+    # Leaves return their HTML from `visit_*`. Containers return their
+    # opening and closing tags from `enter_*` / `leave_*`; NodeVisitor emits
+    # the children in between, recursively or with an explicit stack.
+
+    def enter_Document(self, node: Document) -> None:
+        return None
 
     def visit_FrontMatter(self, node: FrontMatter) -> str:
         # Front matter is metadata and usually not rendered to HTML body.
         # We can return an empty string or a comment.
         return ""
 
-    def visit_Heading(self, node: Heading) -> str:
-        content = self._render_children(node)
-        return f"<h{node.level}>{content}</h{node.level}>"
+    def enter_Heading(self, node: Heading) -> str:
+        return f"<h{node.level}>"
+
+    def leave_Heading(self, node: Heading) -> str:
+        return f"</h{node.level}>"
 
-    def visit_Paragraph(self, node: Paragraph) -> str:
-        content = self._render_children(node)
-        return f"<p>{content}</p>"
+    def enter_Paragraph(self, node: Paragraph) -> str:
+        return "<p>"
+
+    def leave_Paragraph(self, node: Paragraph) -> str:
+        return "</p>"
 
     def visit_Text(self, node: Text) -> str:
-        return node.content or ""
+        # SourceText lands here too: spans only become strings when the page is written.
+        return self._escape_text(node.content or "")
+
+    def _escape_text(self, text: str) -> str:
+        """`escape_html` for text content, through the cache of long escaped texts."""
+        if '&' not in text and '<' not in text and '>' not in text:
+            return text
+        if len(text) < self.ESCAPE_CACHE_MIN:
+            return text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        cache = self._escaped
+        escaped = cache.get(text)
+        if escaped is not None:
+            cache.move_to_end(text)
+            return escaped
+        escaped = text.replace('&', '&amp;').replace('<', '&lt;').replace('>', '&gt;')
+        size = len(text) + len(escaped)
+        if size <= self.ESCAPE_CACHE_CHARS:
+            cache[text] = escaped
+            self._escaped_chars += size
+            while len(cache) > self.ESCAPE_CACHE_SIZE or self._escaped_chars > self.ESCAPE_CACHE_CHARS:
+                old, old_escaped = cache.popitem(last=False)
+                self._escaped_chars -= len(old) + len(old_escaped)
+        return escaped
 
     def visit_WikiLink(self, node: WikiLink) -> str:
-        display_text = node.alias if node.alias else node.target
-        return f'<a href="{node.target}">{display_text}</a>'
-
-    def visit_Italic(self, node: Italic) -> str:
-        content = self._render_children(node)
-        return f"<em>{content}</em>"
-
-    def visit_Bold(self, node: Bold) -> str:
-        content = self._render_children(node)
-        return f"<strong>{content}</strong>"
-
-    def visit_CodeBlock(self, node: CodeBlock) -> str:
-        content = self._render_children(node)
-        # Escape HTML entities if needed, but for now just wrap
-        class_attr = f' class="language-{node.language}"' if node.language else ""
-        return f'<pre><code{class_attr}>{content}</code></pre>'
-
-    def visit_ListNode(self, node: ListNode) -> str:
-        content = self._render_children(node)
-        tag = "ol" if node.ordered else "ul"
-        return f"<{tag}>{content}</{tag}>"
-
-    def visit_ListItem(self, node: ListItem) -> str:
-        content = self._render_children(node)
-        return f"<li>{content}</li>"
-
-    def visit_InlineCode(self, node: InlineCode) -> str:
-        content = self._render_children(node)
-        return f"<code>{content}</code>"
-
-    def generic_visit(self, node: Node) -> str:
-        # Fallback for unimplemented nodes (like Lists/BlockQuotes if they appear)
-        return self._render_children(node)
-
-    def _render_children(self, node: Node) -> str:
-        """Helper to visit all children and join their results."""
-        return "".join(self.visit(child) for child in node.children)
+        display_text = escape_html(node.alias if node.alias else node.target)
+        if self.link_resolver is not None:
+            href = self.link_resolver.href(node.target, self.page)
+            if href is None:
+                return f'<a class="dead-link" href="{escape_attr(node.target)}">{display_text}</a>'
+            return f'<a href="{escape_attr(href)}">{display_text}</a>'
+        return f'<a href="{escape_attr(node.target)}">{display_text}</a>'
+
+    def enter_Italic(self, node: Italic) -> str:
+        return "<em>"
+
+    def leave_Italic(self, node: Italic) -> str:
+        return "</em>"
+
+    def enter_Bold(self, node: Bold) -> str:
+        return "<strong>"
+
+    def leave_Bold(self, node: Bold) -> str:
+        return "</strong>"
+
+    def enter_CodeBlock(self, node: CodeBlock) -> str:
+        class_attr = f' class="language-{escape_attr(node.language)}"' if node.language else ""
+        return f'<pre><code{class_attr}>'
+
+    def leave_CodeBlock(self, node: CodeBlock) -> str:
+        return '</code></pre>'
+
+    def enter_ListNode(self, node: ListNode) -> str:
+        return "<ol>" if node.ordered else "<ul>"
+
+    def leave_ListNode(self, node: ListNode) -> str:
+        return "</ol>" if node.ordered else "</ul>"
+
+    def enter_ListItem(self, node: ListItem) -> str:
+        return "<li>"
+
+    def leave_ListItem(self, node: ListItem) -> str:
+        return "</li>"
+
+    def enter_InlineCode(self, node: InlineCode) -> str:
+        return "<code>"
+
+    def leave_InlineCode(self, node: InlineCode) -> str:
+        return "</code>"
+
+    def enter_Node(self, node: Node) -> None:
+        # Fallback for unimplemented nodes (like BlockQuotes if they appear):
+        # render their children without a wrapper.
+        return None
+
+    def _emit(self, node: Node):
+        if self.iterative:
+            self.traverse(node)
+        else:
+            result = self.visit(node)
+            if result is not None:
+                self._out.append(result)
+
+    def _render_children(self, node: Node) -> None:
+        """Helper for `visit_*` methods: visits all children, appending their HTML to the output buffer."""
+        out = self._out
+        visit = self.visit
+        for child in node.children:
+            result = visit(child)
+            # Leaves hand back a string; containers have already written theirs.
+            if result is not None:
+                out.append(result)
+
+def _blocks(node: Union[Node, Iterable[Node]]) -> Iterable[Node]:
+    """The top-level blocks to render for `node`: a Document's children, a lone node, or an iterable of blocks."""
+    if isinstance(node, Document):
+        return node.children
+    if isinstance(node, Node):
+        return [node]
+    return node
+
+def _discard(fragment: str):
+    pass
+
+class RenderResult:
+    """What `MultiRenderer.render_all` produced; outputs that were not asked for are None."""
+    __slots__ = ('html', 'text', 'toc', 'links', 'terms')
+
+    def __init__(self):
+        self.html: Optional[str] = None
+        # Block texts separated by newlines, without markup
+        self.text: Optional[str] = None
+        # (level, title) of every heading, in document order
+        self.toc: Optional[List[Tuple[int, str]]] = None
+        # Every WikiLink target, in document order (as link_index.collect_links)
+        self.links: Optional[List[str]] = None
+        # Weighted term counts for the search index (see search_index.py)
+        self.terms: Optional[Dict[str, int]] = None
+
+class MultiRenderer(HTMLRenderer):
+    """
+    An HTMLRenderer that also collects plain text, a table of contents, the
+    outgoing WikiLinks and search terms of a document during the same tree
+    walk.
+
+        renderer = MultiRenderer(outputs=("html", "toc", "links"))
+        result = renderer.render_all(doc)
+
+    `outputs` is any combination of OUTPUTS. Without "html" no markup is
+    built or escaped; the other methods (`render`, `render_to`, ...) still
+    produce HTML, and collect nothing.
+    """
+    OUTPUTS = ("html", "text", "toc", "links", "terms")
+
+    def __init__(self, link_resolver: Optional[LinkResolver] = None, iterative: bool = False,
+                 outputs: Sequence[str] = OUTPUTS):
+        super().__init__(link_resolver, iterative)
+        unknown = set(outputs).difference(self.OUTPUTS)
+        if unknown:
+            raise ValueError(f"Unknown render outputs: {', '.join(sorted(unknown))}")
+        self.outputs = frozenset(outputs)
+        self._html = True
+        # Collectors of the walk in progress; None when not collected.
+        self._text: Optional[List[str]] = None
+        self._toc: Optional[List[Tuple[int, str]]] = None
+        self._links: Optional[List[str]] = None
+        # Text fragments of the heading being walked
+        self._title: Optional[List[str]] = None
+        # Text fragments by search weight, the weights of the open headings
+        # and bold spans (the last one applies), and the fragments of that weight
+        self._terms: Optional[Dict[int, List[str]]] = None
+        self._weights = [1]
+        self._fragments: Optional[List[str]] = None
+
+    def render_all(self, node: Union[Node, Iterable[Node]], writable: Optional[TextIO] = None) -> RenderResult:
+        """
+        Walks `node` once, producing every output in `self.outputs`. With a
+        `writable`, the HTML is streamed into it (as `render_to`) instead of
+        being returned. Like `render_iter`, `node` can be an iterable of
+        top-level blocks, each released once it has been walked.
+        """
+        outputs = self.outputs
+        result = RenderResult()
+        self._text = [] if "text" in outputs else None
+        self._toc = result.toc = [] if "toc" in outputs else None
+        self._links = result.links = [] if "links" in outputs else None
+        self._html = "html" in outputs
+        if "terms" in outputs:
+            self._terms = {1: [], BOLD_WEIGHT: [], HEADING_WEIGHT: []}
+            self._fragments = self._terms[1]
+        try:
+            if not self._html:
+                saved = self._set_out([])
+                self.emit = _discard
+                try:
+                    for block in _blocks(node):
+                        self._emit(block)
+                finally:
+                    self._set_out(saved)
+            elif writable is not None:
+                self.render_to(node, writable)
+            elif isinstance(node, Node):
+                result.html = self.render(node)
+            else:
+                result.html = "".join(self.render_iter(node))
+            if self._text is not None:
+                result.text = "".join(self._text)
+            if self._terms is not None:
+                result.terms = count_terms((weight, "".join(fragments)) for weight, fragments in self._terms.items())
+        finally:
+            self._html = True
+            self._text = self._toc = self._links = self._title = self._terms = self._fragments = None
+            self._weights = [1]
+        return result
+
+    def _break_text(self):
+        # Starts a new line of plain text at a block boundary
+        text = self._text
+        if text and not text[-1].endswith("\n"):
+            text.append("\n")
+
+    # Words on either side of a block or weight boundary must not run
+    # together: the fragments being left are ended with a newline.
+
+    def _push_weight(self, weight: int):
+        self._fragments.append("\n")
+        weight = max(weight, self._weights[-1])
+        self._weights.append(weight)
+        self._fragments = self._terms[weight]
+
+    def _pop_weight(self):
+        self._fragments.append("\n")
+        self._weights.pop()
+        self._fragments = self._terms[self._weights[-1]]
+
+    def enter_Heading(self, node: Heading) -> str:
+        if self._text is not None:
+            self._break_text()
+        if self._toc is not None:
+            self._title = []
+        if self._fragments is not None:
+            self._push_weight(HEADING_WEIGHT)
+        return f"<h{node.level}>"
+
+    def leave_Heading(self, node: Heading) -> str:
+        if self._title is not None:
+            self._toc.append((node.level, "".join(self._title).strip()))
+            self._title = None
+        if self._fragments is not None:
+            self._pop_weight()
+        return f"</h{node.level}>"
+
+    def enter_Paragraph(self, node: Paragraph) -> str:
+        if self._text is not None:
+            self._break_text()
+        if self._fragments is not None:
+            self._fragments.append("\n")
+        return "<p>"
+
+    def enter_ListItem(self, node: ListItem) -> str:
+        if self._text is not None:
+            self._break_text()
+        if self._fragments is not None:
+            self._fragments.append("\n")
+        return "<li>"
+
+    def enter_CodeBlock(self, node: CodeBlock) -> str:
+        if self._text is not None:
+            self._break_text()
+        if self._fragments is not None:
+            self._fragments.append("\n")
+        return super().enter_CodeBlock(node)
+
+    def enter_Bold(self, node: Bold) -> str:
+        if self._fragments is not None:
+            self._push_weight(BOLD_WEIGHT)
+        return "<strong>"
+
+    def leave_Bold(self, node: Bold) -> str:
+        if self._fragments is not None:
+            self._pop_weight()
+        return "</strong>"
+
+    def visit_Text(self, node: Text) -> Optional[str]:
+        text = node.content or ""
+        if self._text is not None:
+            self._text.append(text)
+        if self._title is not None:
+            self._title.append(text)
+        if self._fragments is not None:
+            self._fragments.append(text)
+        if not self._html:
+            return None
+        return self._escape_text(text)
+
+    def visit_WikiLink(self, node: WikiLink) -> Optional[str]:
+        if self._links is not None:
+            self._links.append(node.target)
+        if self._text is not None or self._title is not None or self._fragments is not None:
+            display_text = node.alias if node.alias else node.target
+            if self._text is not None:
+                self._text.append(display_text)
+            if self._title is not None:
+                self._title.append(display_text)
+            if self._fragments is not None:
+                self._fragments.append(display_text)
+        if not self._html:
+            return None
+        return super().visit_WikiLink(node)
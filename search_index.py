@@ -0,0 +1,392 @@
+"""
+Full-text search over a converted vault: an inverted index built by
+`convert_all(..., search_index=True)` and stored in one file in the output
+directory, read through mmap so opening it costs nothing but the note table.
+
+    index = SearchIndex.open("output_html/.search.idx")
+    for rel, score in index.search("weekly review"):
+        print(rel, score)
+    index.close()
+
+Terms are lowercased `\\w+` runs of the rendered text. Each occurrence counts
+HEADING_WEIGHT inside a heading, BOLD_WEIGHT inside bold text and 1
+elsewhere; results are ranked by BM25 over these weighted counts.
+
+Layout (integers little-endian; varints are unsigned LEB128):
+
+    header     _HEADER: magic, FORMAT_VERSION, note and term counts, the sum
+               of all note lengths, and the offset of each section below
+    notes      _NOTE per note, sorted by path: path (offset and byte length
+               in the string blob) and length (sum of its weighted counts)
+    terms      _TERM per term, sorted by UTF-8 bytes so lookups can
+               binary-search the file: term (offset and byte length in the
+               string blob), document frequency, postings offset and size
+    strings    UTF-8 paths and terms, concatenated
+    postings   per term, (note id delta, weighted count) varint pairs in
+               note id order
+
+The index is rewritten as a whole, but `IndexBuilder.write` takes the
+postings of notes that did not change from the previous file, so an
+incremental build only tokenizes the notes it converted.
+"""
+import argparse
+import heapq
+import itertools
+import math
+import mmap
+import os
+import re
+import struct
+from array import array
+from collections import Counter
+from itertools import accumulate
+from typing import Dict, Iterable, Iterator, List, Optional, Sequence, Tuple
+
+SEARCH_INDEX_NAME = ".search.idx"
+
+MAGIC = b"OMIDX"
+# Bump whenever the layout, the tokenizer or the weights change.
+FORMAT_VERSION = 1
+
+HEADING_WEIGHT = 3
+BOLD_WEIGHT = 2
+
+TOKEN_RE = re.compile(r"\w+")
+# Maps every ASCII character outside \w to a space: for ASCII text,
+# translate + split gives the same tokens as TOKEN_RE, about twice as fast.
+_ASCII_SEPARATORS = str.maketrans({chr(c): " " for c in range(128) if not TOKEN_RE.match(chr(c))})
+
+# BM25 parameters
+K1 = 1.2
+B = 0.75
+
+_HEADER = struct.Struct("<5sB2xIIQQQQQ")
+_NOTE = struct.Struct("<III")
+_TERM = struct.Struct("<IIIQI")
+
+def tokenize(text: str) -> List[str]:
+    text = text.lower()
+    if text.isascii():
+        return text.translate(_ASCII_SEPARATORS).split()
+    return TOKEN_RE.findall(text)
+
+def count_terms(weighted: Iterable[Tuple[int, str]]) -> Dict[str, int]:
+    """Weighted term counts of `(weight, text)` pairs."""
+    terms: Counter = Counter()
+    for weight, text in weighted:
+        if weight == 1:
+            terms.update(tokenize(text))
+        else:
+            # Headings and bold text are short; the bulk goes through update()
+            for term in tokenize(text):
+                terms[term] += weight
+    return terms
+
+def _write_varint(out: bytearray, n: int):
+    while n >= 0x80:
+        out.append(n & 0x7f | 0x80)
+        n >>= 7
+    out.append(n)
+
+def _decode_postings(chunk: bytes) -> Tuple[List[int], List[int]]:
+    """The note ids and weighted counts encoded in `chunk`."""
+    if chunk.isascii():
+        # Every varint is a single byte (small deltas and counts: the bulk of an index)
+        return list(accumulate(chunk[0::2])), list(chunk[1::2])
+    values = []
+    n = shift = 0
+    for byte in chunk:
+        n |= (byte & 0x7f) << shift
+        if byte < 0x80:
+            values.append(n)
+            n = shift = 0
+        else:
+            shift += 7
+    return list(accumulate(values[0::2])), values[1::2]
+
+def _encode_postings(out: bytearray, notes: List[int], counts: List[int]):
+    """Appends the postings of ascending `notes` to `out`."""
+    deltas = [note - previous for previous, note in zip([0] + notes, notes)]
+    if max(deltas) < 0x80 and max(counts) < 0x80:
+        pairs = bytearray(2 * len(notes))
+        pairs[0::2] = deltas
+        pairs[1::2] = counts
+        out += pairs
+        return
+    for delta, count in zip(deltas, counts):
+        _write_varint(out, delta)
+        _write_varint(out, count)
+
+class SearchIndex:
+    """A search index file, memory-mapped. Raises ValueError on foreign or outdated files."""
+    def __init__(self, mm: mmap.mmap):
+        self._mm = mm
+        if mm[:len(MAGIC)] != MAGIC:
+            raise ValueError("Not a search index")
+        (_, version, note_count, self.term_count, self.total_length, notes_off, self._terms_off,
+         self._strings_off, self._postings_off) = _HEADER.unpack_from(mm, 0)
+        if version != FORMAT_VERSION:
+            raise ValueError(f"Unsupported search index version {version}")
+        self.notes: List[str] = []
+        self.lengths = array('I')
+        strings = self._strings_off
+        for offset, size, length in _NOTE.iter_unpack(mm[notes_off:notes_off + note_count * _NOTE.size]):
+            self.notes.append(mm[strings + offset:strings + offset + size].decode('utf-8'))
+            self.lengths.append(length)
+
+    @classmethod
+    def open(cls, path: str) -> 'SearchIndex':
+        with open(path, 'rb') as f:
+            if os.fstat(f.fileno()).st_size < _HEADER.size:
+                raise ValueError("Not a search index")
+            mm = mmap.mmap(f.fileno(), 0, access=mmap.ACCESS_READ)
+        try:
+            return cls(mm)
+        except ValueError:
+            mm.close()
+            raise
+
+    def close(self):
+        self._mm.close()
+
+    def _term(self, i: int) -> Tuple[bytes, int, int, int]:
+        offset, size, df, postings, postings_size = _TERM.unpack_from(self._mm, self._terms_off + i * _TERM.size)
+        start = self._strings_off + offset
+        return self._mm[start:start + size], df, postings, postings_size
+
+    def _find(self, term: bytes) -> int:
+        lo, hi = 0, self.term_count
+        while lo < hi:
+            mid = (lo + hi) // 2
+            if self._term(mid)[0] < term:
+                lo = mid + 1
+            else:
+                hi = mid
+        return lo if lo < self.term_count and self._term(lo)[0] == term else -1
+
+    def postings(self, term: str) -> List[Tuple[str, int]]:
+        """(note, weighted count) of every note containing `term` (one token, any case)."""
+        notes, counts = self._postings(term.lower().encode('utf-8'))
+        return [(self.notes[note], count) for note, count in zip(notes, counts)]
+
+    def _postings(self, term: bytes) -> Tuple[List[int], List[int]]:
+        i = self._find(term)
+        if i < 0:
+            return [], []
+        _, _, offset, size = self._term(i)
+        start = self._postings_off + offset
+        return _decode_postings(self._mm[start:start + size])
+
+    def _entries(self) -> Iterator[Tuple[bytes, bytes]]:
+        """Every term, in file order, with its encoded postings."""
+        for i in range(self.term_count):
+            term, _, offset, size = self._term(i)
+            start = self._postings_off + offset
+            yield term, self._mm[start:start + size]
+
+    def search(self, query: str, limit: int = 10) -> List[Tuple[str, float]]:
+        """The `limit` best notes for `query` (any of its terms), best first, with their BM25 scores."""
+        notes = len(self.notes)
+        if not notes:
+            return []
+        lengths = self.lengths
+        average = self.total_length / notes or 1.0
+        scores: Dict[int, float] = {}
+        for term in set(tokenize(query)):
+            matches, counts = self._postings(term.encode('utf-8'))
+            if not matches:
+                continue
+            idf = math.log(1 + (notes - len(matches) + 0.5) / (len(matches) + 0.5))
+            for note, count in zip(matches, counts):
+                norm = K1 * (1 - B + B * lengths[note] / average)
+                scores[note] = scores.get(note, 0.0) + idf * count * (K1 + 1) / (count + norm)
+        # Ties go to the first path
+        best = heapq.nsmallest(limit, scores.items(), key=lambda item: (-item[1], item[0]))
+        return [(self.notes[note], score) for note, score in best]
+
+def _write_index(path: str, paths: List[str], lengths: List[int],
+                 entries: Iterable[Tuple[bytes, List[int], List[int], Optional[bytes]]]):
+    """
+    Writes an index file of the notes `paths` (sorted) with their `lengths`
+    and the sorted term `entries`: (term, note ids, counts, and their
+    postings if already encoded).
+    """
+    strings = bytearray()
+    note_table = bytearray()
+    for rel, length in zip(paths, lengths):
+        data = rel.encode('utf-8')
+        note_table += _NOTE.pack(len(strings), len(data), length)
+        strings += data
+
+    term_table = bytearray()
+    postings = bytearray()
+    term_count = 0
+    for term, notes, counts, chunk in entries:
+        start = len(postings)
+        if chunk is not None:
+            postings += chunk
+        else:
+            _encode_postings(postings, notes, counts)
+        term_table += _TERM.pack(len(strings), len(term), len(notes), start, len(postings) - start)
+        strings += term
+        term_count += 1
+
+    notes_off = _HEADER.size
+    terms_off = notes_off + len(note_table)
+    strings_off = terms_off + len(term_table)
+    postings_off = strings_off + len(strings)
+    header = _HEADER.pack(MAGIC, FORMAT_VERSION, len(paths), term_count, sum(lengths),
+                          notes_off, terms_off, strings_off, postings_off)
+    tmp = path + ".tmp"
+    with open(tmp, 'wb') as f:
+        for part in (header, note_table, term_table, strings, postings):
+            f.write(part)
+    os.replace(tmp, path)
+
+def merge_indexes(path: str, indexes: Sequence[SearchIndex]):
+    """
+    Writes the index of all notes of `indexes` to `path`, e.g. to combine
+    the indexes of a sharded build. No note may be in more than one index.
+    """
+    paths = sorted(rel for index in indexes for rel in index.notes)
+    for a, b in zip(paths, paths[1:]):
+        if a == b:
+            raise ValueError(f"{a} is in more than one search index")
+    ids = {rel: i for i, rel in enumerate(paths)}
+    lengths = [0] * len(paths)
+    # Each index's note ids map to increasing merged ids, so its postings
+    # stay in order and only need interleaving with the other indexes'
+    renumber = []
+    for index in indexes:
+        mapping = [ids[rel] for rel in index.notes]
+        for old, i in enumerate(mapping):
+            lengths[i] = index.lengths[old]
+        renumber.append(mapping)
+
+    def entries():
+        def tagged(k: int, index: SearchIndex):
+            for term, chunk in index._entries():
+                yield term, k, chunk
+        streams = [tagged(k, index) for k, index in enumerate(indexes)]
+        for term, group in itertools.groupby(heapq.merge(*streams), key=lambda entry: entry[0]):
+            pairs = []
+            for _, k, chunk in group:
+                notes, counts = _decode_postings(chunk)
+                mapping = renumber[k]
+                pairs.extend((mapping[note], count) for note, count in zip(notes, counts))
+            pairs.sort()
+            yield term, [note for note, _ in pairs], [count for _, count in pairs], None
+
+    _write_index(path, paths, lengths, entries())
+
+class IndexBuilder:
+    """
+    Collects the weighted term counts of converted notes, then writes the
+    index for a vault, taking every other note from the previous index.
+
+    Postings are flat arrays of (note, count) pairs in the order notes were
+    added; `write` puts them in path order, so notes can come in any order.
+    """
+    def __init__(self):
+        self._notes: List[str] = []
+        self._lengths: List[int] = []
+        # term -> array of (note, count) pairs, note being an index into _notes
+        self._postings: Dict[str, array] = {}
+
+    def add(self, rel: str, terms: Dict[str, int]):
+        note = len(self._notes)
+        self._notes.append(rel)
+        self._lengths.append(sum(terms.values()))
+        postings = self._postings
+        for term, count in terms.items():
+            pairs = postings.get(term)
+            if pairs is None:
+                pairs = postings[term] = array('I')
+            pairs.append(note)
+            pairs.append(count)
+
+    def write(self, path: str, notes: Iterable[str], base: Optional[SearchIndex] = None):
+        """
+        Writes the index of `notes` (every note of the vault) to `path`: the
+        notes added to this builder, and the rest from `base`. Notes in
+        neither are indexed as empty.
+        """
+        paths = sorted(notes)
+        ids = {rel: i for i, rel in enumerate(paths)}
+        lengths = [0] * len(paths)
+        added = [ids.get(rel, -1) for rel in self._notes]
+        for i, length in zip(added, self._lengths):
+            if i >= 0:
+                lengths[i] = length
+        # Previous note id -> new id, for notes taken over from `base`, and
+        # the previous ids of the notes replaced by this builder
+        carried: Dict[int, int] = {}
+        dropped = set()
+        if base is not None:
+            replaced = set(self._notes)
+            for old, rel in enumerate(base.notes):
+                i = ids.get(rel)
+                if i is not None and rel not in replaced:
+                    carried[old] = i
+                    lengths[i] = base.lengths[old]
+                else:
+                    dropped.add(old)
+        # Notes were only edited: every id stays the same
+        same_ids = base is not None and base.notes == paths
+
+        _write_index(path, paths, lengths, self._entries(base, carried, dropped, added, same_ids))
+
+    def _entries(self, base: Optional[SearchIndex], carried: Dict[int, int], dropped: set, added: List[int],
+                 same_ids: bool) -> Iterator[Tuple[bytes, List[int], List[int], Optional[bytes]]]:
+        """The terms of the new index, in order: (term, note ids, counts, encoded postings if unchanged)."""
+        new_terms = sorted((term.encode('utf-8'), term) for term in self._postings)
+        old_terms = base._entries() if base is not None and carried else iter(())
+        for term, chunk, new in self._merge_terms(old_terms, new_terms):
+            pairs = []
+            if chunk is not None:
+                old_notes, old_counts = _decode_postings(chunk)
+                if same_ids and new is None and dropped.isdisjoint(old_notes):
+                    # Untouched by this update: the encoded postings are still valid
+                    yield term, old_notes, old_counts, chunk
+                    continue
+                pairs.extend((carried[note], count) for note, count in zip(old_notes, old_counts) if note in carried)
+            if new is not None:
+                pairs.extend((added[note], count) for note, count in zip(new[0::2], new[1::2]) if added[note] >= 0)
+            if not pairs:
+                continue
+            # Old pairs are in note order already; only added notes need sorting.
+            if new is not None:
+                pairs.sort()
+            yield term, [note for note, _ in pairs], [count for _, count in pairs], None
+
+    def _merge_terms(self, old_terms: Iterator[Tuple[bytes, bytes]],
+                     new_terms: Sequence[Tuple[bytes, str]]) -> Iterator[Tuple[bytes, Optional[bytes], Optional[array]]]:
+        """Joins the sorted terms of the previous index and of this builder: (term, old postings, new pairs)."""
+        new_iter = iter(new_terms)
+        new = next(new_iter, None)
+        for term, old in old_terms:
+            while new is not None and new[0] < term:
+                yield new[0], None, self._postings[new[1]]
+                new = next(new_iter, None)
+            if new is not None and new[0] == term:
+                yield term, old, self._postings[new[1]]
+                new = next(new_iter, None)
+            else:
+                yield term, old, None
+        while new is not None:
+            yield new[0], None, self._postings[new[1]]
+            new = next(new_iter, None)
+
+if __name__ == "__main__":
+    ap = argparse.ArgumentParser(description="Search a vault converted with --search-index.")
+    ap.add_argument("output_dir")
+    ap.add_argument("query")
+    ap.add_argument("-n", "--limit", type=int, default=10)
+    args = ap.parse_args()
+
+    index = SearchIndex.open(os.path.join(os.path.expanduser(args.output_dir), SEARCH_INDEX_NAME))
+    try:
+        for rel, score in index.search(args.query, args.limit):
+            print(f"{score:8.3f}  {rel}")
+    finally:
+        index.close()
@@ -0,0 +1,212 @@
+"""
+Conversion server: a long-lived process on a Unix domain socket that keeps
+warm parsers and renderers, so editor previews do not pay for interpreter
+startup, imports and setup on every conversion.
+
+    python3 server.py [--socket PATH] [--vault DIR] [--pool N]
+    python3 client.py note.md > preview.html
+
+Protocol: one JSON object per line each way, over a connection that can be
+reused for any number of requests; responses come back in request order.
+
+    {"id": 1, "op": "convert", "output": "html",
+     "items": [{"text": "# Hi"}, {"path": "/vault/a.md", "page": "a.md"}]}
+    -> {"id": 1, "results": [{"html": "<h1>Hi</h1>"}, {"error": "..."}]}
+
+    {"id": 2, "op": "ping"}  ->  {"id": 2, "ok": true, "pid": 123, "requests": 41}
+
+`output` is "html" (default), "ast" (base64 of ast_codec data) or "both".
+An item is markdown `text` or the `path` of a note; `page` is the note's
+path in the vault, which relative links are computed from. With --vault,
+relative paths are taken from the vault, and a path inside it is its own
+page by default. A failing item gets an "error" and the rest of the batch
+is converted; a malformed request gets a top-level "error".
+
+With --vault, WikiLinks resolve against the notes found there when the
+server started, as in batch_converter.py.
+
+Each connection is served by its own thread, so slow or idle clients do not
+hold up others. Conversions take a parser/renderer pair from a pool of
+--pool warm pairs (the GIL runs one conversion at a time anyway).
+"""
+import argparse
+import base64
+import json
+import os
+import queue
+import socket
+import socketserver
+import threading
+from pathlib import Path
+from typing import Optional, Tuple
+
+import ast_codec
+from batch_converter import collect_sources, read_source
+from client import DEFAULT_SOCKET, private_dir
+from link_index import LinkResolver
+from md_parser import Parser
+from renderer import HTMLRenderer
+
+# Longest request line accepted, in bytes
+MAX_REQUEST = 64 * 1024 * 1024
+OUTPUT_FORMATS = ("html", "ast", "both")
+
+class _Handler(socketserver.StreamRequestHandler):
+    def handle(self):
+        while True:
+            line = self.rfile.readline(MAX_REQUEST + 1)
+            if not line:
+                return
+            if len(line) > MAX_REQUEST:
+                self._send({"id": None, "error": f"Request longer than {MAX_REQUEST} bytes"})
+                return
+            try:
+                request = json.loads(line)
+            except ValueError as e:
+                self._send({"id": None, "error": f"Malformed request: {e}"})
+                continue
+            self._send(self.server.respond(request))
+
+    def _send(self, response: dict):
+        self.wfile.write(json.dumps(response, ensure_ascii=False).encode("utf-8") + b"\n")
+        self.wfile.flush()
+
+class ConversionServer(socketserver.ThreadingMixIn, socketserver.UnixStreamServer):
+    """
+    Serves conversions on the Unix socket at `path` (see the module
+    docstring for the protocol) until `shutdown()`.
+
+        with ConversionServer(path, vault="~/Obsidian_Vault") as server:
+            server.serve_forever()
+
+    Raises OSError if another server is already listening at `path`; a
+    socket file left behind by one that died is replaced. The socket is
+    created accessible to this user only; the directory of the default
+    path is created private to the user (or refused if it is not).
+    """
+    daemon_threads = True
+
+    def __init__(self, path: str = DEFAULT_SOCKET, vault: Optional[str] = None, pool_size: int = 4):
+        if pool_size < 1:
+            raise ValueError("The pool needs at least one parser")
+        self.vault = Path(vault).expanduser().resolve() if vault is not None else None
+        resolver = LinkResolver(collect_sources(self.vault)) if self.vault is not None else None
+        self._pool: "queue.SimpleQueue[Tuple[Parser, HTMLRenderer]]" = queue.SimpleQueue()
+        for _ in range(pool_size):
+            self._pool.put((Parser(), HTMLRenderer(resolver)))
+        self.requests = 0
+        self._lock = threading.Lock()
+        if path == DEFAULT_SOCKET:
+            private_dir(os.path.dirname(path), create=True)
+        _remove_stale_socket(path)
+        # Bind with a restrictive umask: a chmod afterwards would leave a
+        # window in which other users could connect.
+        umask = os.umask(0o077)
+        try:
+            super().__init__(path, _Handler)
+        finally:
+            os.umask(umask)
+
+    def server_close(self):
+        super().server_close()
+        try:
+            os.unlink(self.server_address)
+        except FileNotFoundError:
+            pass
+
+    def respond(self, request) -> dict:
+        """The response to one decoded request line."""
+        if not isinstance(request, dict):
+            return {"id": None, "error": "A request must be a JSON object"}
+        response = {"id": request.get("id")}
+        op = request.get("op", "convert")
+        with self._lock:
+            self.requests += 1
+        if op == "ping":
+            response.update(ok=True, pid=os.getpid(), requests=self.requests)
+            return response
+        if op != "convert":
+            response["error"] = f"Unknown op {op!r}"
+            return response
+        output = request.get("output", "html")
+        items = request.get("items")
+        if output not in OUTPUT_FORMATS:
+            response["error"] = f"Unknown output {output!r}, expected one of {', '.join(OUTPUT_FORMATS)}"
+        elif not isinstance(items, list) or not all(isinstance(item, dict) for item in items):
+            response["error"] = "'items' must be a list of objects"
+        else:
+            parser, renderer = self._pool.get()
+            try:
+                response["results"] = [self._convert_item(item, parser, renderer, output) for item in items]
+            finally:
+                self._pool.put((parser, renderer))
+        return response
+
+    def _convert_item(self, item: dict, parser: Parser, renderer: HTMLRenderer, output: str) -> dict:
+        try:
+            return self._convert(item, parser, renderer, output)
+        except Exception as e:
+            # A bug hit by one note must not take the connection or the batch down
+            return {"error": f"{type(e).__name__}: {e}"}
+
+    def _convert(self, item: dict, parser: Parser, renderer: HTMLRenderer, output: str) -> dict:
+        page = item.get("page")
+        if isinstance(item.get("text"), str):
+            text = item["text"]
+        elif isinstance(item.get("path"), str):
+            path = Path(item["path"]).expanduser()
+            if self.vault is not None and not path.is_absolute():
+                path = self.vault / path
+            try:
+                _, text = read_source(path)
+            except (OSError, UnicodeDecodeError) as e:
+                return {"error": str(e)}
+            if page is None and self.vault is not None:
+                try:
+                    page = path.resolve().relative_to(self.vault).as_posix()
+                except ValueError:
+                    pass
+        else:
+            return {"error": "An item needs a 'text' or 'path' string"}
+
+        doc = parser.parse(text)
+        result = {}
+        if output != "ast":
+            renderer.page = page if isinstance(page, str) else ""
+            result["html"] = renderer.render(doc)
+        if output != "html":
+            result["ast"] = base64.b64encode(ast_codec.dump(doc)).decode("ascii")
+        return result
+
+def _remove_stale_socket(path: str):
+    """Removes a socket file at `path` nobody listens on; OSError if a server still does."""
+    if not os.path.exists(path):
+        return
+    probe = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+    try:
+        probe.connect(path)
+    except ConnectionRefusedError:
+        os.unlink(path)
+        return
+    except OSError:
+        # Not a socket, or not ours to use: let bind report it.
+        return
+    finally:
+        probe.close()
+    raise OSError(f"A server is already listening on {path}")
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Serve markdown conversions on a Unix socket (see client.py).")
+    ap.add_argument("--socket", default=DEFAULT_SOCKET, help=f"socket path (default: {DEFAULT_SOCKET})")
+    ap.add_argument("--vault", help="resolve WikiLinks against the notes of this vault")
+    ap.add_argument("--pool", type=int, default=4, help="number of warm parser/renderer pairs")
+    return ap
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    with ConversionServer(args.socket, args.vault, args.pool) as server:
+        print(f"Serving on {args.socket}. Press Ctrl+C to stop.")
+        try:
+            server.serve_forever()
+        except KeyboardInterrupt:
+            pass
@@ -0,0 +1,233 @@
+"""
+Sharded builds: spreads the conversion of one vault over several machines.
+
+    python3 batch_converter.py vault out-0 --shard 0/2     # on one runner
+    python3 batch_converter.py vault out-1 --shard 1/2     # on another
+    python3 shards.py merge site out-0 out-1
+
+Each shard converts the notes `batch_converter.shard_of` assigns to it (a
+hash of the note's relative path, so every host agrees without talking to
+the others) and keeps its own manifest, link index and, with
+--search-index, search index. Links resolve against the whole vault, so a
+shard's pages are the same as a single build's. `merge_shards` copies the
+pages into one site and combines the state files, so the merged directory
+is exactly what a single `convert_all` would have left behind and later
+single-machine builds into it stay incremental. A front matter index
+written into a shard directory (`metadata_index.py --shard`) is combined
+too.
+
+    python3 shards.py build vault site --shards 4
+
+runs every shard as a local process and merges them, standing in for the
+runners.
+"""
+import argparse
+import contextlib
+import io
+import os
+import shutil
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+from typing import Dict, List, Optional, Sequence
+
+from batch_converter import OUTPUTS, convert_all, prune_outputs
+from link_index import LINKS_NAME, LinkIndex
+from manifest import MANIFEST_NAME, BuildManifest
+from metadata_index import METADATA_NAME, build_metadata_index, load_metadata_index, save_metadata_index
+from search_index import SEARCH_INDEX_NAME, SearchIndex, merge_indexes
+
+# Files in a shard's output directory that are combined rather than copied
+STATE_FILES = {MANIFEST_NAME, LINKS_NAME, SEARCH_INDEX_NAME, METADATA_NAME}
+
+def _is_state_file(name: str) -> bool:
+    return name in STATE_FILES or name.startswith(LINKS_NAME) or name.endswith(".tmp")
+
+def copy_outputs(shard_path: Path, output_path: Path) -> int:
+    """
+    Copies the pages and assets of a shard into `output_path`, skipping files
+    whose size and mtime already match. Returns the number of files copied.
+    """
+    copied = 0
+    for root, dirs, files in os.walk(shard_path):
+        rel_dir = os.path.relpath(root, shard_path)
+        target_dir = os.path.join(output_path, rel_dir)
+        os.makedirs(target_dir, exist_ok=True)
+        for name in files:
+            if rel_dir == "." and _is_state_file(name):
+                continue
+            source = os.path.join(root, name)
+            target = os.path.join(target_dir, name)
+            st = os.stat(source)
+            try:
+                old = os.stat(target)
+                if old.st_size == st.st_size and old.st_mtime_ns == st.st_mtime_ns:
+                    continue
+            except FileNotFoundError:
+                pass
+            shutil.copy2(source, target)
+            copied += 1
+    return copied
+
+def merge_shards(shard_dirs: Sequence[str], output_dir: str) -> Dict[str, int]:
+    """
+    Combines the output directories of all shards of one build into
+    `output_dir`: pages and assets, the build manifest, the link index, the
+    search index and the front matter index. Pages of notes that were in
+    the previous merge but in none of the shards now are deleted.
+
+    Raises ValueError if the shards were built with different settings,
+    overlap, or leave notes of the vault unconverted (a shard is missing).
+    Returns counts of notes, copied files and removed notes.
+    """
+    shard_paths = [Path(d).expanduser() for d in shard_dirs]
+    output_path = Path(output_dir).expanduser()
+    if not shard_paths:
+        raise ValueError("No shards to merge")
+
+    manifests = [BuildManifest.read(path) for path in shard_paths]
+    build_key = manifests[0].build_key
+    entries: Dict[str, dict] = {}
+    for path, manifest in zip(shard_paths, manifests):
+        if manifest.build_key != build_key:
+            raise ValueError(f"{path} was built with different settings than {shard_paths[0]}")
+        overlap = entries.keys() & manifest.entries.keys()
+        if overlap:
+            raise ValueError(f"{path} overlaps another shard, e.g. in {min(overlap)}")
+        entries.update(manifest.entries)
+
+    # Every shard's link index knows all notes of the vault
+    link_paths = [os.path.join(path, LINKS_NAME) for path in shard_paths]
+    for path, link_path in zip(shard_paths, link_paths):
+        if not os.path.exists(link_path):
+            raise ValueError(f"No link index in {path}")
+    link_index = LinkIndex(link_paths[0])
+    try:
+        missing = link_index.notes().difference(entries)
+    finally:
+        link_index.close()
+    if missing:
+        raise ValueError(f"{len(missing)} notes were built by none of the shards, e.g. {min(missing)}")
+
+    output_path.mkdir(parents=True, exist_ok=True)
+    copied = sum(copy_outputs(path, output_path) for path in shard_paths)
+
+    try:
+        previous = BuildManifest.read(output_path).entries
+    except ValueError:
+        previous = {}
+    removed = [rel for rel in previous if rel not in entries]
+    prune_outputs(removed, output_path)
+
+    # Built beside the old index, which stays in place until the new one is complete
+    links_tmp = os.path.join(output_path, LINKS_NAME + ".tmp")
+    if os.path.exists(links_tmp):
+        os.unlink(links_tmp)
+    link_index = LinkIndex(links_tmp)
+    try:
+        for link_path in link_paths:
+            link_index.add_index(link_path)
+    finally:
+        link_index.close()
+    os.replace(links_tmp, os.path.join(output_path, LINKS_NAME))
+
+    search_paths = [os.path.join(path, SEARCH_INDEX_NAME) for path in shard_paths]
+    search_path = os.path.join(output_path, SEARCH_INDEX_NAME)
+    present = [os.path.exists(path) for path in search_paths]
+    if all(present):
+        indexes: List[SearchIndex] = []
+        try:
+            for path in search_paths:
+                indexes.append(SearchIndex.open(path))
+            merge_indexes(search_path, indexes)
+        finally:
+            for index in indexes:
+                index.close()
+    elif any(present):
+        raise ValueError("Only some shards have a search index")
+    elif os.path.exists(search_path):
+        os.unlink(search_path)
+
+    metadata_paths = [os.path.join(path, METADATA_NAME) for path in shard_paths]
+    if any(os.path.exists(path) for path in metadata_paths):
+        metadata: Dict[str, dict] = {}
+        for path in metadata_paths:
+            if os.path.exists(path):
+                metadata.update(load_metadata_index(path))
+        save_metadata_index(dict(sorted(metadata.items())), os.path.join(output_path, METADATA_NAME))
+
+    # Last, so an interrupted merge is redone in full
+    manifest = BuildManifest(output_path / MANIFEST_NAME, build_key, entries)
+    manifest.dirty = True
+    manifest.save()
+    return {"notes": len(entries), "copied": copied, "removed": len(removed)}
+
+def _build_shard(input_dir: str, shard_dir: str, shard: tuple, incremental: bool, inline_css: bool,
+                 outputs: Sequence[str], search_index: bool, metadata: bool) -> str:
+    with contextlib.redirect_stdout(io.StringIO()) as log:
+        convert_all(input_dir, shard_dir, incremental=incremental, inline_css=inline_css, outputs=outputs,
+                    search_index=search_index, shard=shard)
+    if metadata:
+        save_metadata_index(build_metadata_index(input_dir, shard=shard), os.path.join(shard_dir, METADATA_NAME))
+    # The summary line of convert_all
+    return log.getvalue().rstrip("\n").rsplit("\n", 1)[-1]
+
+def build_shards(input_dir: str, output_dir: str, shards: int, work_dir: Optional[str] = None,
+                 incremental: bool = True, inline_css: bool = False, outputs: Sequence[str] = ("html",),
+                 search_index: bool = False, metadata: bool = False) -> Dict[str, int]:
+    """
+    Builds `input_dir` as `shards` shards, one local process each, into
+    `work_dir` (default: `output_dir` + ".shards") and merges them into
+    `output_dir`. The shard directories are kept, so the next build is
+    incremental per shard.
+    """
+    if shards < 1:
+        raise ValueError("At least one shard is needed")
+    if work_dir is None:
+        work_dir = str(Path(output_dir).expanduser()) + ".shards"
+    shard_dirs = [os.path.join(work_dir, str(i)) for i in range(shards)]
+    with ProcessPoolExecutor(max_workers=shards) as pool:
+        futures = [pool.submit(_build_shard, input_dir, shard_dir, (i, shards), incremental, inline_css,
+                               outputs, search_index, metadata)
+                   for i, shard_dir in enumerate(shard_dirs)]
+        for i, future in enumerate(futures):
+            print(f"Shard {i}/{shards}: {future.result()}")
+    return merge_shards(shard_dirs, output_dir)
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Merge the shards of a sharded build, or run one locally.")
+    commands = ap.add_subparsers(dest="command", required=True)
+
+    merge = commands.add_parser("merge", help="combine shard output directories into one site")
+    merge.add_argument("output_dir")
+    merge.add_argument("shard_dirs", nargs="+", metavar="shard_dir")
+
+    build = commands.add_parser("build", help="build every shard as a local process, then merge them")
+    build.add_argument("input_dir", nargs="?", default="~/Obsidian_Vault")
+    build.add_argument("output_dir", nargs="?", default="output_html")
+    build.add_argument("--shards", type=int, default=os.cpu_count() or 1,
+                       help="number of shards (default: one per CPU core)")
+    build.add_argument("--work-dir", help="where the shard directories are kept (default: output_dir.shards)")
+    build.add_argument("--force", action="store_true",
+                       help="ignore the shards' build manifests and reconvert every note")
+    build.add_argument("--inline-css", action="store_true",
+                       help="embed the stylesheet in every page instead of linking a shared file")
+    build.add_argument("--outputs", default="html",
+                       help=f"comma-separated outputs per note: {', '.join(OUTPUTS)}; default: html")
+    build.add_argument("--search-index", action="store_true", help="keep a full-text search index")
+    build.add_argument("--metadata", action="store_true",
+                       help=f"also write a front matter index to output_dir/{METADATA_NAME}")
+    return ap
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    if args.command == "merge":
+        shards = len(args.shard_dirs)
+        counts = merge_shards(args.shard_dirs, args.output_dir)
+    else:
+        shards = args.shards
+        counts = build_shards(args.input_dir, args.output_dir, shards, args.work_dir,
+                              incremental=not args.force, inline_css=args.inline_css,
+                              outputs=args.outputs.split(","), search_index=args.search_index,
+                              metadata=args.metadata)
+    print(f"Merged {shards} shards: {counts['notes']} notes, {counts['copied']} files copied, "
+          f"{counts['removed']} removed. Check {args.output_dir} for results.")
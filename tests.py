@@ -1,6 +1,11 @@
+import contextlib
+import io
+import tempfile
 import unittest
+from pathlib import Path
 from md_parser import Parser
 from renderer import HTMLRenderer
+import batch_converter
 
 class TestMarkdownParser(unittest.TestCase):
     def setUp(self):
@@ -130,6 +135,28 @@ class TestMarkdownParser(unittest.TestCase):
         expected_html = '<p>Click <a href="Link">Link</a> or read <em>this</em>.</p>'
         self.assertEqual(html, expected_html)
 
+    def test_nested_emphasis(self):
+        markdown = "*a __b__ c* and **bold *it*** and ***both***"
+        html = self.renderer.render(self.parser.parse(markdown))
+        expected_html = ('<p><em>a <strong>b</strong> c</em> and <strong>bold <em>it</em></strong>'
+                         ' and <em><strong>both</strong></em></p>')
+        self.assertEqual(html, expected_html)
+
+    def test_unmatched_delimiters_stay_text(self):
+        markdown = "a * b, snake_case_name, `code *x*` [[x* ``y *z"
+        html = self.renderer.render(self.parser.parse(markdown))
+        expected_html = '<p>a * b, snake_case_name, <code>code *x*</code> [[x* ``y *z</p>'
+        self.assertEqual(html, expected_html)
+        # The first "[[" swallows up to the first "]]", as before.
+        from ast_nodes import WikiLink
+        self.assertEqual(self.parser.parse("[[x [[y]]").children[0].children, [WikiLink("x [[y")])
+
+    def test_pathological_inline_input(self):
+        # Quadratic for the old regex tokenizer; must stay plain text.
+        markdown = "[[x *a _b " * 5000
+        doc = self.parser.parse(markdown)
+        self.assertEqual(self.renderer.render(doc), "<p>" + markdown.strip() + "</p>")
+
     def test_code_block(self):
         markdown = "```python\nprint('Hello')\n```"
         doc = self.parser.parse(markdown)
@@ -142,6 +169,70 @@ class TestMarkdownParser(unittest.TestCase):
         self.assertIsInstance(doc.children[0].children[0], Text)
         self.assertEqual(doc.children[0].children[0].content, "print('Hello')")
 
+    def test_code_block_is_not_inline_parsed(self):
+        code = "x = [[a]] * *y* `z` __b__ < 1"
+        expected = f'<pre><code class="language-py">{code.replace("<", "&lt;")}</code></pre>'
+        for spans in (False, True):
+            for lazy in (False, True):
+                doc = self.parser.parse(f"```py\n{code}\n```\n", spans=spans, lazy=lazy)
+                self.assertEqual(HTMLRenderer().render(doc), expected)
+
+    def test_html_escaping(self):
+        markdown = '```c"x\nif (a < b && c > d) {}\n```\na <b> & `x<y` [[A<b|c&d]] [["q"]]'
+        html = self.renderer.render(self.parser.parse(markdown))
+        expected_html = ('<pre><code class="language-c&quot;x">if (a &lt; b &amp;&amp; c &gt; d) {}</code></pre>'
+                         '<p>a &lt;b&gt; &amp; <code>x&lt;y</code> <a href="A&lt;b">c&amp;d</a>'
+                         ' <a href="&quot;q&quot;">"q"</a></p>')
+        self.assertEqual(html, expected_html)
+
+    def test_escaped_code_cache(self):
+        from ast_nodes import CodeBlock, SourceText, Text
+        code = "x < y\n" * 1000
+        renderer = HTMLRenderer()
+        renderer.ESCAPE_CACHE_SIZE = 2
+        block = CodeBlock("c")
+        block.add(Text(code))
+        expected = "<pre><code class=\"language-c\">" + code.replace("<", "&lt;") + "</code></pre>"
+        self.assertEqual(renderer.render(block), expected)
+        self.assertEqual(renderer.render(SourceText("#" + code, 1, len(code) + 1)), code.replace("<", "&lt;"))
+        self.assertEqual(len(renderer._escaped), 1)
+        renderer.render(Text(code + "<"))
+        renderer.render(block) # the block's text is now the most recently used
+        renderer.render(Text(code + "<<"))
+        self.assertEqual(list(renderer._escaped), [code, code + "<<"])
+        self.assertEqual(renderer.render(block), expected)
+        # The size limit: room for one text and its escaped copy, and none
+        # at all for a text larger than that
+        renderer.ESCAPE_CACHE_CHARS = 3 * len(code)
+        renderer.render(Text(code + ">"))
+        self.assertEqual(list(renderer._escaped), [code + ">"])
+        self.assertEqual(renderer.render(Text(code * 2)), code.replace("<", "&lt;") * 2)
+        self.assertEqual(list(renderer._escaped), [code + ">"])
+        self.assertEqual(renderer._escaped_chars, len(code + ">") + len(renderer._escaped[code + ">"]))
+
+    def test_multi_renderer(self):
+        from link_index import collect_links
+        from renderer import MultiRenderer
+        markdown = ("---\ntitle: T\n---\n# Head *one* [[X|ex]]\npara [[L]] & <b>\nmore\n\n"
+                    "- a\n- c [[M]]\n```py\nx < 1\ny\n```\n## Two\n")
+        doc = self.parser.parse(markdown)
+        for iterative in (False, True):
+            result = MultiRenderer(iterative=iterative).render_all(doc)
+            self.assertEqual(result.html, self.renderer.render(doc))
+            self.assertEqual(result.text, "Head one ex\npara L & <b> more\na\nc M\nx < 1\ny\nTwo")
+            self.assertEqual(result.toc, [(1, "Head one ex"), (2, "Two")])
+            self.assertEqual(result.links, collect_links(doc))
+            partial = MultiRenderer(iterative=iterative, outputs=("toc", "links")).render_all(doc)
+            self.assertIsNone(partial.html)
+            self.assertIsNone(partial.text)
+            self.assertEqual((partial.toc, partial.links), (result.toc, result.links))
+        out = io.StringIO()
+        streamed = MultiRenderer(outputs=("html", "links")).render_all(doc, out)
+        self.assertEqual(out.getvalue(), result.html)
+        self.assertEqual(streamed.links, result.links)
+        with self.assertRaises(ValueError):
+            MultiRenderer(outputs=("pdf",))
+
     def test_front_matter(self):
         markdown = "---\ntitle: Test\ntags: [a, b]\n---\n# Content"
         doc = self.parser.parse(markdown)
@@ -168,5 +259,983 @@ class TestMarkdownParser(unittest.TestCase):
         for child in doc.children:
             self.assertNotIsInstance(child, FrontMatter)
 
+class TestAstNodes(unittest.TestCase):
+    def test_nodes_are_slotted(self):
+        from ast_nodes import Text, Paragraph, NodeType
+        text = Text("hi")
+        self.assertFalse(hasattr(text, "__dict__"))
+        self.assertEqual(text.children, ())
+        self.assertIs(text.type, NodeType.TEXT)
+        self.assertEqual(Paragraph().children, [])
+        with self.assertRaises(TypeError):
+            text.add(Text("x"))
+
+    def test_equality_and_pretty(self):
+        doc = Parser().parse("# Hi *there*\n[[T|a]]")
+        self.assertEqual(doc, Parser().parse("# Hi *there*\n[[T|a]]"))
+        self.assertNotEqual(doc, Parser().parse("# Hi"))
+        self.assertEqual(doc.pretty(), (
+            "Document\n"
+            "  Heading (level=1)\n"
+            "    Text (content='Hi ')\n"
+            "    Italic\n"
+            "      Text (content='there')\n"
+            "  Paragraph\n"
+            "    WikiLink (target=T, alias=a)\n"
+        ))
+
+class TestBlockRegistry(unittest.TestCase):
+    def test_dispatch_by_first_character(self):
+        from block_processors import HeadingProcessor, CodeBlockProcessor, ListProcessor, ParagraphProcessor
+        blocks = Parser().blocks
+        self.assertIsInstance(blocks.find("# Title"), HeadingProcessor)
+        self.assertIsInstance(blocks.find("  ```py"), CodeBlockProcessor)
+        self.assertIsInstance(blocks.find("  12. item"), ListProcessor)
+        self.assertIsInstance(blocks.find("*emphasis*"), ParagraphProcessor)
+        self.assertIsInstance(blocks.find("  # not a heading"), ParagraphProcessor)
+        self.assertTrue(blocks.interrupts("## Next"))
+        self.assertFalse(blocks.interrupts("- item"))
+
+    def test_register_custom_block(self):
+        from ast_nodes import ContainerNode, Text
+        from block_processors import BlockProcessor
+
+        class Quote(ContainerNode):
+            __slots__ = ()
+
+        class QuoteProcessor(BlockProcessor):
+            start_chars = '>'
+            interrupts_paragraph = True
+
+            def can_start(self, line):
+                return line.startswith('>')
+
+            def run(self, parent, reader):
+                quote = Quote()
+                while reader.has_next() and self.can_start(reader.peek()):
+                    quote.add(Text(reader.next()[1:].strip()))
+                parent.add(quote)
+                return quote
+
+        class QuoteRenderer(HTMLRenderer):
+            def visit_Quote(self, node):
+                self._out.append("<blockquote>")
+                self._render_children(node)
+                self._out.append("</blockquote>")
+
+        parser = Parser()
+        parser.register(QuoteProcessor(), priority=15)
+        doc = parser.parse("para\n> quoted *text*\n> more")
+        self.assertEqual(QuoteRenderer().render(doc), "<p>para</p><blockquote>quoted <em>text</em>more</blockquote>")
+
+class TestNodeVisitor(unittest.TestCase):
+    MARKDOWN = "---\na: 1\n---\n# H *a*\n\npara __b__ [[x|y]] `c`\n- i\n1. j\n```py\nc\n```"
+
+    def deep_paragraph(self, depth):
+        from ast_nodes import Document, Paragraph, Bold, Italic, Text
+        doc = Document()
+        node = Paragraph()
+        doc.add(node)
+        for level in range(depth):
+            inner = Bold() if level % 2 else Italic()
+            node.add(inner)
+            node = inner
+        node.add(Text("*deep*"))
+        return doc
+
+    def test_handlers_cached_per_visitor_class(self):
+        from ast_nodes import Text, SourceText
+        from visitor import NodeVisitor
+
+        class Upper(HTMLRenderer):
+            def visit_Text(self, node):
+                return node.content.upper()
+
+        self.assertEqual(Upper().render(Text("a")), "A")
+        self.assertEqual(HTMLRenderer().render(Text("a")), "a")
+        # SourceText falls back to visit_Text along its MRO
+        self.assertEqual(Upper().render(SourceText("xbc", 1, 3)), "BC")
+        self.assertIs(Upper._visit_handlers[SourceText], Upper.visit_Text)
+        self.assertIs(HTMLRenderer._visit_handlers[SourceText], HTMLRenderer.visit_Text)
+        with self.assertRaises(NotImplementedError):
+            NodeVisitor().visit(Text("a"))
+
+    def test_iterative_render_matches_recursive(self):
+        doc = Parser().parse(self.MARKDOWN)
+        self.assertEqual(HTMLRenderer(iterative=True).render(doc), HTMLRenderer().render(doc))
+        self.assertEqual(list(HTMLRenderer(iterative=True).render_iter(doc)), list(HTMLRenderer().render_iter(doc)))
+
+    def test_deep_trees_need_no_recursion(self):
+        import sys
+        depth = sys.getrecursionlimit() * 2
+        doc = self.deep_paragraph(depth)
+        Parser()._process_inline_elements(doc)
+        html = HTMLRenderer(iterative=True).render(doc)
+        self.assertTrue(html.startswith("<p><em><strong><em>"))
+        self.assertIn("<strong><em>deep</em></strong>", html)
+        self.assertEqual(html.count("</strong>") + html.count("</em>"), depth + 1)
+        with self.assertRaises(RecursionError):
+            HTMLRenderer().render(doc)
+
+class TestSourceSpans(unittest.TestCase):
+    MARKDOWN = (
+        "---\ntitle: T\n---\n#   Head *one*  \n  para *line\nmore* [[A\nB|c\nd]]  \n\n"
+        "- a `x`\n1. __b__\n```py\nx = *1*\n\ny\n```\n```\n```\n#\ntail _end_"
+    )
+
+    def setUp(self):
+        self.parser = Parser()
+        self.renderer = HTMLRenderer()
+
+    def test_spans_render_like_substrings(self):
+        plain = self.parser.parse(self.MARKDOWN)
+        spans = self.parser.parse(self.MARKDOWN, spans=True)
+        self.assertEqual(self.renderer.render(spans), self.renderer.render(plain))
+        self.assertEqual(spans.pretty(), plain.pretty().replace("Text (", "SourceText (").replace("    Text\n", "    SourceText\n"))
+
+    def test_spans_point_into_source(self):
+        from ast_nodes import SourceText, source_range
+        text = "# Title\n\nSome *words* here"
+        doc = self.parser.parse(text, spans=True)
+        leaf = doc.children[1].children[1].children[0]
+        self.assertIsInstance(leaf, SourceText)
+        self.assertIs(leaf.source, text)
+        self.assertEqual(text[leaf.start:leaf.end], "words")
+        self.assertEqual(source_range(doc.children[0]), (2, 7))
+        self.assertEqual(source_range(doc.children[1]), (9, len(text)))
+        self.assertIsNone(source_range(self.parser.parse(text).children[0]))
+
+class TestLazyInline(unittest.TestCase):
+    MARKDOWN = "---\ntags: [x]\n---\n# Title *x*\npara __b__ [[L|l]]\n\n- a\n- `b`\n\n```py\ncode\n```"
+
+    def setUp(self):
+        self.parser = Parser()
+        self.renderer = HTMLRenderer()
+
+    def test_lazy_matches_eager(self):
+        eager = self.parser.parse(self.MARKDOWN)
+        for spans in (False, True):
+            lazy = self.parser.parse(self.MARKDOWN, spans=spans, lazy=True)
+            self.assertEqual(self.renderer.render(lazy), self.renderer.render(eager))
+        self.assertEqual(self.parser.parse(self.MARKDOWN, lazy=True), eager)
+        self.assertEqual(list(self.parser.parse_stream(self.MARKDOWN.split('\n'), lazy=True)), eager.children)
+
+    def test_inline_pass_deferred_until_children_read(self):
+        doc = self.parser.parse(self.MARKDOWN, lazy=True)
+        heading = doc.children[1]
+        items = doc.children[3].children
+        self.assertFalse(heading.inline_parsed)
+        self.assertEqual(heading.raw_text, "Title *x*")
+        self.assertEqual(items[1].raw_text, "`b`")
+
+        self.assertEqual(len(heading.children), 2)
+        self.assertTrue(heading.inline_parsed)
+        self.assertIsNone(heading.raw_text)
+        self.assertFalse(items[0].inline_parsed)
+
+class TestParseCache(unittest.TestCase):
+    TEXT = "---\ntags: [a, b]\n---\n# Title\nSome *text* and [[Link]].\n\n- [ ] task\n- [ ] task"
+
+    def test_copy_is_deep(self):
+        from ast_nodes import Text
+        doc = Parser().parse(self.TEXT)
+        clone = doc.copy()
+        self.assertEqual(clone, doc)
+        clone.children[1].children.append(Text("x"))
+        clone.children[0].meta['tags'].append("c")
+        self.assertEqual(doc, Parser().parse(self.TEXT))
+
+    def test_copy_keeps_lazy_blocks_lazy(self):
+        parser = Parser()
+        doc = parser.parse(self.TEXT, lazy=True, spans=True)
+        clone = doc.copy()
+        self.assertFalse(clone.children[1].inline_parsed)
+        self.assertFalse(doc.children[1].inline_parsed)
+        self.assertEqual(clone, parser.parse(self.TEXT, spans=True))
+
+    def test_cached_blocks_are_read_only(self):
+        from parse_cache import CachingParser
+        parser = CachingParser()
+        first = parser.parse(self.TEXT)
+        heading, items = first.children[1], first.children[3]
+        with self.assertRaises(AttributeError):
+            heading.level = 3
+        with self.assertRaises(TypeError):
+            heading.children.append(heading.children[0])
+        with self.assertRaises(TypeError):
+            first.children[0].meta['tags'].append("c")
+        # Editing a copy leaves the cache alone
+        first.children[1] = heading.copy()
+        first.children[1].level = 3
+        first.children[1].children.clear()
+        del first.children[3]
+        items.copy().children.pop()
+        second = parser.parse(self.TEXT)
+        self.assertEqual(parser.stats()['documents']['hits'], 1)
+        self.assertEqual(second, Parser().parse(self.TEXT))
+        self.assertEqual(HTMLRenderer().render(second), HTMLRenderer().render(Parser().parse(self.TEXT)))
+
+    def test_fragment_cache(self):
+        from parse_cache import CachingParser
+        parser = CachingParser(max_documents=0, max_fragments=16)
+        doc = parser.parse(self.TEXT)
+        self.assertEqual(doc, Parser().parse(self.TEXT))
+        # The two identical list items: stored on the second sighting
+        self.assertEqual(parser.stats()['fragments']['entries'], 1)
+        again = parser.parse(self.TEXT)
+        self.assertEqual(parser.stats()['fragments']['hits'], 2)
+        with self.assertRaises(AttributeError):
+            again.children[3].children[0].children[0].content = "changed"
+
+    def test_lru_limits(self):
+        from parse_cache import LRUCache
+        cache = LRUCache(max_entries=2, max_bytes=10)
+        cache.put("a", 1, 4)
+        cache.put("b", 2, 4)
+        self.assertEqual(cache.get("a"), 1) # "b" is now least recently used
+        cache.put("c", 3, 4) # over both limits: evicts "b"
+        self.assertIsNone(cache.get("b"))
+        self.assertFalse(cache.put("huge", 4, 11))
+        self.assertEqual((len(cache), cache.bytes, cache.evictions), (2, 8, 1))
+        self.assertEqual(cache.stats()['hits'], 1)
+
+    def test_admit_on_repeat(self):
+        from parse_cache import LRUCache
+        cache = LRUCache(max_entries=4, max_bytes=100, admit_on_repeat=True)
+        self.assertFalse(cache.put("a", 1, 1))
+        self.assertTrue(cache.put("a", 1, 1))
+        self.assertEqual(cache.get("a"), 1)
+
+class TestAstCodec(unittest.TestCase):
+    TEXT = ("---\ntitle: 'Q'\ntags: [a, 2, True]\n---\n# Title *é*\nSee [[Target|alias]] and [[Plain]].\n\n"
+            "```py\nx = 1\n```\n1. one `code`\n2. __two__\n")
+
+    def test_round_trip(self):
+        from ast_codec import dump, load
+        parser = Parser()
+        doc = parser.parse(self.TEXT)
+        self.assertEqual(load(dump(doc)), doc)
+        # Spans and lazy blocks come back as the plain, fully parsed tree
+        self.assertEqual(load(dump(parser.parse(self.TEXT, spans=True))), doc)
+        self.assertEqual(load(dump(parser.parse(self.TEXT, lazy=True))), doc)
+
+    def test_strings_are_stored_once(self):
+        from ast_codec import dump
+        parser = Parser()
+        once = len(dump(parser.parse("A long repeated line of text\n")))
+        five = len(dump(parser.parse("- A long repeated line of text\n" * 5)))
+        self.assertLess(five, once + 20)
+
+    def test_front_matter_values(self):
+        from ast_nodes import Document, FrontMatter
+        from ast_codec import dump, load
+        doc = Document()
+        doc.add(FrontMatter({'n': -300, 'f': 1.5, 'none': None, 'nested': {'k': [False, 'v']}}))
+        self.assertEqual(load(dump(doc)), doc)
+
+    def test_deep_trees(self):
+        from ast_nodes import Bold, Document, Paragraph, Text
+        from ast_codec import dump, load
+        doc = node = Document()
+        node.add(Paragraph())
+        node = node.children[0]
+        for _ in range(5000):
+            node.add(Bold())
+            node = node.children[0]
+        node.add(Text("deep"))
+        node = load(dump(doc)).children[0] # (== itself recurses)
+        depth = 0
+        while isinstance(node.children[0], Bold):
+            node = node.children[0]
+            depth += 1
+        self.assertEqual((depth, node.children), (5000, [Text("deep")]))
+
+    def test_rejects_foreign_data(self):
+        from ast_codec import FORMAT_VERSION, MAGIC, dump, load
+        with self.assertRaises(ValueError):
+            load(b"not an ast")
+        data = dump(Parser().parse("x"))
+        with self.assertRaises(ValueError):
+            load(MAGIC + bytes([FORMAT_VERSION + 1]) + data[len(MAGIC) + 1:])
+
+    def test_rejects_truncated_and_corrupted_data(self):
+        from ast_codec import MAGIC, dump, load
+        data = dump(Parser().parse("---\nn: 1.5\ntags: [a, b]\n---\n# Ünïcode\n\n- [[x|y]] **z**\n"))
+        for end in range(len(data)):
+            with self.assertRaises(ValueError, msg=end):
+                load(data[:end])
+        with self.assertRaises(ValueError):
+            load(data + b"\0")
+        # Flipping any byte must not raise anything else (it may still load)
+        for i in range(len(MAGIC) + 1, len(data)):
+            try:
+                load(data[:i] + bytes([data[i] ^ 0xff]) + data[i + 1:])
+            except ValueError:
+                pass
+
+class TestReparse(unittest.TestCase):
+    TEXT = ("---\ntitle: T\n---\n# Heading\nFirst paragraph\nstill first.\n\nSecond *para*.\n\n"
+            "- one\n- two\n\n```\ncode\n```\n\nLast [[Link]] paragraph.\n")
+
+    def setUp(self):
+        self.parser = Parser()
+
+    def check(self, old: str, new: str, spans: bool = False):
+        doc = self.parser.parse(old, spans=spans)
+        edit = self.parser.reparse(doc, old, new, spans=spans)
+        full = self.parser.parse(new, spans=spans)
+        if spans:
+            self.assertEqual(HTMLRenderer().render(edit.doc), HTMLRenderer().render(full))
+        else:
+            self.assertEqual(edit.doc, full)
+        self.assertEqual(edit.doc._block_starts, full._block_starts)
+        return doc, edit
+
+    def test_edit_inside_a_block_reuses_the_others(self):
+        doc, edit = self.check(self.TEXT, self.TEXT.replace("Second *para*", "Second **para**"))
+        self.assertEqual((edit.start, edit.end, edit.old_end), (2, 4, 4))
+        self.assertIs(edit.doc.children[0], doc.children[0])
+        self.assertIs(edit.doc.children[-1], doc.children[-1])
+
+    def test_edits_that_change_block_structure(self):
+        cases = [
+            ("Second *para*.\n\n", "Second *para*.\n"),       # the list lines join the paragraph
+            ("still first.\n\n", "still first.\n"),            # joins two paragraphs
+            ("\nSecond", "\n# Second"),                         # paragraph becomes a heading
+            ("```\ncode", "code"),                               # unmatched fence swallows the rest
+            ("title: T", "title: U"),                             # front matter
+            ("---\ntitle", "--\ntitle"),                         # no longer front matter
+            ("paragraph.\n", "paragraph.\nMore text\n"),        # append at the end
+            ("# Heading", "# Heading"),                           # no change
+        ]
+        for old, new in cases:
+            with self.subTest(old=old, new=new):
+                self.check(self.TEXT, self.TEXT.replace(old, new, 1))
+                self.check(self.TEXT, self.TEXT.replace(old, new, 1), spans=True)
+
+    def test_text_inserted_before_front_matter(self):
+        from ast_nodes import FrontMatter
+        old = "---\ntitle: x\n---\n# H\n"
+        for prefix in ("\n", "Intro\n\n", "# Top\n"):
+            with self.subTest(prefix=prefix):
+                doc, edit = self.check(old, prefix + old)
+                self.assertNotIsInstance(edit.doc.children[0], FrontMatter)
+                self.assertEqual(HTMLRenderer().render(edit.doc), HTMLRenderer().render(self.parser.parse(prefix + old)))
+                self.check(old, prefix + old, spans=True)
+        # ... and removed again: the front matter is back at offset 0
+        self.check("Intro\n\n" + old, old)
+
+    def test_random_edits(self):
+        import random
+        rng = random.Random(7)
+        pieces = ["\n", "\n\n", "# ", "- ", "```", "---\n", "*", "__", "[[", "]]", "`", "x "]
+        old = self.TEXT * 3
+        doc = self.parser.parse(old)
+        for _ in range(300):
+            at = rng.randrange(len(old) + 1)
+            new = old[:at] + rng.choice(pieces) + old[at + rng.choice([0, 0, 1, 3]):]
+            edit = self.parser.reparse(doc, old, new)
+            self.assertEqual(edit.doc, self.parser.parse(new))
+            doc, old = edit.doc, new
+
+    def test_update_blocks_matches_a_full_render(self):
+        renderer = HTMLRenderer()
+        doc = self.parser.parse(self.TEXT)
+        blocks = renderer.render_blocks(doc)
+        self.assertEqual("".join(blocks), renderer.render(doc))
+        new = self.TEXT.replace("still first.\n\n", "still first.\n")
+        renderer.update_blocks(blocks, self.parser.reparse(doc, self.TEXT, new))
+        self.assertEqual("".join(blocks), renderer.render(self.parser.parse(new)))
+
+    def test_documents_without_offsets_are_parsed_in_full(self):
+        from ast_codec import dump, load
+        doc = load(dump(self.parser.parse(self.TEXT)))
+        new = self.TEXT.replace("one", "uno")
+        edit = self.parser.reparse(doc, self.TEXT, new)
+        self.assertEqual((edit.start, edit.end, edit.old_end), (0, len(edit.doc.children), len(doc.children)))
+        self.assertEqual(edit.doc, self.parser.parse(new))
+
+class TestStreamingParser(unittest.TestCase):
+    MARKDOWN = "---\ntitle: T\n---\n# Head *one*\npara line\nmore\n\n- a\n- __b__\n```py\nx = 1\n\ny\n```\ntail [[Link]]\n"
+
+    def setUp(self):
+        self.parser = Parser()
+        self.renderer = HTMLRenderer()
+
+    def test_parse_stream_matches_parse(self):
+        expected = self.parser.parse(self.MARKDOWN)
+        blocks = list(self.parser.parse_stream(self.MARKDOWN.split('\n')))
+        self.assertEqual(blocks, expected.children)
+
+    def test_parse_file_matches_parse(self):
+        with tempfile.TemporaryDirectory() as tmp:
+            path = Path(tmp) / "note.md"
+            for text in (self.MARKDOWN, self.MARKDOWN.rstrip('\n'), "```\nopen fence\n", ""):
+                path.write_text(text, encoding="utf-8")
+                self.assertEqual(list(self.parser.parse_file(path)), self.parser.parse(text).children)
+
+    def test_blocks_are_yielded_as_they_close(self):
+        consumed = []
+        def lines():
+            for line in ["# Title", "body", "", "second"]:
+                consumed.append(line)
+                yield line
+
+        stream = self.parser.parse_stream(lines())
+        heading = next(stream)
+        self.assertEqual(self.renderer.render(heading), "<h1>Title</h1>")
+        # Only one line of lookahead past the heading has been read
+        self.assertEqual(consumed, ["# Title", "body"])
+        self.assertEqual([self.renderer.render(b) for b in stream], ["<p>body</p>", "<p>second</p>"])
+
+class TestLinkResolver(unittest.TestCase):
+    def test_resolution_rules(self):
+        from link_index import LinkResolver, link_key
+        resolver = LinkResolver(["Note.md", "deep/dir/Note.md", "dir/Other Page.md", "x.excalidraw.md"])
+        self.assertEqual(resolver.resolve("note"), "Note.md")
+        self.assertEqual(resolver.resolve("deep/dir/Note"), "deep/dir/Note.md")
+        self.assertEqual(resolver.resolve("Other Page.md#Intro"), "dir/Other Page.md")
+        self.assertEqual(resolver.resolve("x.excalidraw"), "x.excalidraw.md")
+        self.assertIsNone(resolver.resolve("nope"))
+        self.assertIsNone(link_key("image.PNG"))
+        self.assertIsNone(link_key("#Heading"))
+        self.assertEqual(resolver.href("Other Page", "deep/dir/Note.md"), "../../dir/Other%20Page.html")
+        self.assertEqual(resolver.href("#Heading", "Note.md"), "#Heading")
+        self.assertIsNone(resolver.href("nope", "Note.md"))
+
+class TestStreamingRenderer(unittest.TestCase):
+    MARKDOWN = "# Title *x*\npara __b__ [[L|l]]\n\n- a\n- `b`\n\n```py\ncode\n```"
+
+    def setUp(self):
+        self.doc = Parser().parse(self.MARKDOWN)
+        self.renderer = HTMLRenderer()
+
+    def test_render_iter_yields_one_chunk_per_block(self):
+        chunks = list(self.renderer.render_iter(self.doc))
+        self.assertEqual(len(chunks), len(self.doc.children))
+        self.assertEqual("".join(chunks), self.renderer.render(self.doc))
+
+    def test_render_to_matches_render(self):
+        self.renderer.BUFFER_SIZE = 8 # Force several flushes
+        buf = io.StringIO()
+        written = self.renderer.render_to(self.doc, buf)
+        self.assertEqual(buf.getvalue(), self.renderer.render(self.doc))
+        self.assertEqual(written, len(buf.getvalue()))
+
+    def test_render_single_block(self):
+        self.assertEqual(self.renderer.render(self.doc.children[0]), "<h1>Title <em>x</em></h1>")
+
+class TestBatchConverter(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.vault = self.root / "vault"
+        (self.vault / "sub").mkdir(parents=True)
+        (self.vault / "README.md").write_text("# Vault\n", encoding="utf-8")
+        (self.vault / "a.md").write_text("# A\nSee [[b]].", encoding="utf-8")
+        (self.vault / "b.md").write_text("Some *text*.", encoding="utf-8")
+        (self.vault / "sub" / "README.md").write_text("- one\n- two", encoding="utf-8")
+        (self.vault / "sub" / "c.md").write_text("```\ncode\n```", encoding="utf-8")
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def convert(self, out: str, **kwargs) -> str:
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            batch_converter.convert_all(str(self.vault), str(self.root / out), **kwargs)
+        return buf.getvalue()
+
+    def read_tree(self, out: str) -> dict:
+        base = self.root / out
+        return {str(p.relative_to(base)): p.read_text(encoding="utf-8") for p in sorted(base.rglob("*.html"))}
+
+    def test_parallel_matches_serial(self):
+        serial_log = self.convert("serial", workers=1)
+        parallel_log = self.convert("parallel", workers=2)
+        self.assertEqual(self.read_tree("serial"), self.read_tree("parallel"))
+        self.assertEqual(serial_log.replace("serial", "parallel"), parallel_log)
+        self.assertIn("Processed 5 files", serial_log)
+
+    def test_page_layout(self):
+        from page_template import ASSETS_DIR
+        self.convert("out")
+        out = self.root / "out"
+        page = (out / "a.html").read_text(encoding="utf-8")
+        self.assertTrue(page.startswith("<!DOCTYPE html>\n<html>\n<head>\n    <title>a</title>"))
+        self.assertTrue(page.endswith('<body>\n    <h1>A</h1><p>See <a href="b.html">b</a>.</p>\n</body>\n</html>'))
+
+        # The stylesheet is written once, under a content hash, and linked
+        [css] = (out / ASSETS_DIR).iterdir()
+        self.assertEqual(css.read_text(encoding="utf-8"), HTMLRenderer().get_css())
+        self.assertIn(f'<link rel="stylesheet" href="{ASSETS_DIR}/{css.name}">', page)
+        self.assertNotIn("<style>", page)
+        sub_page = (out / "sub" / "c.html").read_text(encoding="utf-8")
+        self.assertIn(f'href="../{ASSETS_DIR}/{css.name}"', sub_page)
+
+    def test_outputs(self):
+        import json
+        log = self.convert("out", outputs=["search", "text"])
+        out = self.root / "out"
+        self.assertFalse((out / "a.html").exists())
+        self.assertEqual((out / "a.txt").read_text(encoding="utf-8"), "A\nSee b.")
+        record = json.loads((out / "a.json").read_text(encoding="utf-8"))
+        self.assertEqual(record, {"title": "a", "toc": [[1, "A"]], "links": ["b"], "text": "A\nSee b."})
+        self.assertIn("Processed 5 files", log)
+        # Unchanged notes are skipped by their primary output; other outputs rebuild everything.
+        self.assertIn("Processed 0 files", self.convert("out", outputs=["text", "search"]))
+        self.assertIn("Processed 5 files", self.convert("out", outputs=["html", "text"]))
+        self.assertTrue((out / "a.html").exists())
+        (self.vault / "a.md").unlink()
+        self.convert("out", outputs=["html", "text"])
+        self.assertEqual([p.name for p in out.glob("a.*")], [])
+        with self.assertRaises(ValueError):
+            self.convert("out", outputs=["pdf"])
+
+    def test_search_index(self):
+        from search_index import SEARCH_INDEX_NAME, SearchIndex
+        (self.vault / "b.md").write_text("# Apples\nSome **pears** and apples.", encoding="utf-8")
+        self.convert("out", search_index=True)
+        path = str(self.root / "out" / SEARCH_INDEX_NAME)
+        index = SearchIndex.open(path)
+        try:
+            self.assertEqual(index.notes, ["README.md", "a.md", "b.md", "sub/README.md", "sub/c.md"])
+            # Heading 3, bold 2, body 1
+            self.assertEqual(index.postings("APPLES"), [("b.md", 4)])
+            self.assertEqual(index.postings("pears"), [("b.md", 2)])
+            # One match each; the shorter note ranks first
+            self.assertEqual([rel for rel, _ in index.search("see code")], ["sub/c.md", "a.md"])
+            self.assertEqual(index.search("nothing"), [])
+        finally:
+            index.close()
+
+        # An incremental run only converts the changed note; the others keep their postings.
+        (self.vault / "sub" / "c.md").write_text("More apples", encoding="utf-8")
+        (self.vault / "a.md").unlink()
+        log = self.convert("out", search_index=True)
+        self.assertIn("Processed 1 files", log)
+        index = SearchIndex.open(path)
+        try:
+            self.assertEqual([rel for rel, _ in index.search("apples")], ["b.md", "sub/c.md"])
+            self.assertEqual(index.postings("code"), [])
+            self.assertEqual(index.postings("vault"), [("README.md", 3)])
+        finally:
+            index.close()
+        self.convert("fresh", search_index=True)
+        self.assertEqual(Path(path).read_bytes(), (self.root / "fresh" / SEARCH_INDEX_NAME).read_bytes())
+        # Runs that do not maintain the index drop it; the next indexing run converts everything.
+        self.convert("out")
+        self.assertFalse(Path(path).exists())
+        self.assertIn("Processed 4 files", self.convert("out", search_index=True))
+
+    def test_sharded_build_matches_single_build(self):
+        import json
+        import shards
+        from link_index import LINKS_NAME, LinkIndex
+        from manifest import MANIFEST_NAME
+        from search_index import SEARCH_INDEX_NAME
+        self.assertEqual(batch_converter.parse_shard("1/3"), (1, 3))
+        for spec in ("3/3", "-1/2", "1", "a/b"):
+            with self.assertRaises(ValueError):
+                batch_converter.parse_shard(spec)
+        notes = ["README.md", "a.md", "b.md", "sub/README.md", "sub/c.md"]
+        self.assertEqual(sorted(n for i in range(3) for n in notes if batch_converter.shard_of(n, 3) == i), notes)
+
+        def check_merged():
+            self.convert("single", search_index=True)
+            shard_dirs = [str(self.root / f"shard-{i}") for i in range(3)]
+            for i, shard_dir in enumerate(shard_dirs):
+                batch_converter.convert_all(str(self.vault), shard_dir, shard=(i, 3), search_index=True)
+            shards.merge_shards(shard_dirs, str(self.root / "merged"))
+            self.assertEqual(self.read_tree("merged"), self.read_tree("single"))
+            for name in (SEARCH_INDEX_NAME, MANIFEST_NAME):
+                self.assertEqual((self.root / "merged" / name).read_bytes(), (self.root / "single" / name).read_bytes())
+            single = LinkIndex(str(self.root / "single" / LINKS_NAME))
+            merged = LinkIndex(str(self.root / "merged" / LINKS_NAME))
+            try:
+                self.assertEqual(merged.notes(), single.notes())
+                for rel in single.notes():
+                    self.assertEqual(merged.outgoing(rel), single.outgoing(rel))
+                    self.assertEqual(merged.backlinks(rel), single.backlinks(rel))
+            finally:
+                single.close()
+                merged.close()
+            return shard_dirs
+
+        with contextlib.redirect_stdout(io.StringIO()):
+            shard_dirs = check_merged()
+            # Removing a note a page links to rebuilds that page in its own shard
+            (self.vault / "b.md").unlink()
+            check_merged()
+        self.assertFalse((self.root / "merged" / "b.html").exists())
+        self.assertNotIn('href="b.html"', (self.root / "merged" / "a.html").read_text(encoding="utf-8"))
+
+        # Merging only some of the shards, or one twice, is refused
+        with self.assertRaises(ValueError):
+            shards.merge_shards(shard_dirs[1:], str(self.root / "partial"))
+        with self.assertRaises(ValueError):
+            shards.merge_shards(shard_dirs + shard_dirs[:1], str(self.root / "partial"))
+
+        # The local stand-in runs the shards as processes, front matter index included
+        (self.vault / "a.md").write_text("---\ntitle: A\n---\n# A", encoding="utf-8")
+        with contextlib.redirect_stdout(io.StringIO()):
+            shards.build_shards(str(self.vault), str(self.root / "local"), 2, metadata=True)
+        self.assertEqual(self.read_tree("local"), self.read_tree("merged") | {"a.html": self.read_tree("local")["a.html"]})
+        metadata = json.loads((self.root / "local" / ".metadata.json").read_text(encoding="utf-8"))
+        self.assertEqual(metadata["notes"], {"a.md": {"title": "A"}})
+
+    def test_memory_budget(self):
+        from md_parser import Parser
+        from renderer import MultiRenderer
+        (self.vault / "b.md").write_text("# B\nSome *text* and [[a]].\r\n\r\n- one\n", encoding="utf-8")
+        parser, renderer = Parser(), MultiRenderer()
+        whole = renderer.render_all(parser.parse((self.vault / "b.md").read_text(encoding="utf-8")))
+        streamed = renderer.render_all(parser.parse_file(self.vault / "b.md"))
+        self.assertEqual((streamed.html, streamed.text, streamed.toc, streamed.links, streamed.terms),
+                         (whole.html, whole.text, whole.toc, whole.links, whole.terms))
+
+        outputs = ("html", "text", "search")
+        self.convert("default", outputs=outputs, search_index=True)
+        # A budget no note fits in: every note is streamed, with the same outputs
+        log = self.convert("low", outputs=outputs, search_index=True, memory_budget=1)
+        self.assertIn("Processing b.md... peak RSS ", log)
+        self.assertIn("MB (streamed)", log)
+        self.assertIn("5 notes streamed", log)
+        for ext in ("html", "txt", "json", "idx"):
+            default = sorted((self.root / "default").rglob(f"*.{ext}"))
+            low = sorted((self.root / "low").rglob(f"*.{ext}"))
+            self.assertEqual([p.read_bytes() for p in low], [p.read_bytes() for p in default])
+        # Unchanged notes are recognised by their streamed hash
+        (self.vault / "a.md").touch()
+        log = self.convert("low", outputs=outputs, search_index=True, memory_budget=1)
+        self.assertIn("Processed 0 files (5 unchanged, 0 removed)", log)
+
+        log = self.convert("roomy", memory_budget=1 << 40)
+        self.assertIn("Processed 5 files", log)
+        self.assertIn("0 notes streamed", log)
+        self.assertEqual(self.read_tree("roomy"), self.read_tree("default"))
+        with self.assertRaises(ValueError):
+            self.convert("parallel", workers=2, memory_budget=1 << 30)
+
+    def test_inline_css_pages(self):
+        self.convert("out", inline_css=True)
+        page = (self.root / "out" / "a.html").read_text(encoding="utf-8")
+        self.assertIn(f"<style>\n        {HTMLRenderer().get_css()}\n    </style>\n</head>", page)
+        # Switching layouts rebuilds every page
+        log = self.convert("out")
+        self.assertIn("Processed 5 files", log)
+
+    def test_superseded_assets_are_removed(self):
+        from page_template import Asset, PageTemplate, ASSETS_DIR
+        out = self.root / "out"
+        (out / ASSETS_DIR).mkdir(parents=True)
+        (out / ASSETS_DIR / "note.html").write_text("not ours", encoding="utf-8")
+        old = PageTemplate([Asset("style.css", b"a {}")])
+        new = PageTemplate([Asset("style.css", b"b {}")])
+        self.assertEqual(old.write_assets(str(out)), [old.assets[0].path])
+        self.assertEqual(old.write_assets(str(out)), [])
+        new.write_assets(str(out))
+        self.assertEqual(sorted(p.name for p in (out / ASSETS_DIR).iterdir()),
+                         sorted(["note.html", new.assets[0].path.split("/")[1]]))
+        self.assertNotEqual(old.key, new.key)
+
+    def test_incremental_rebuild_skips_unchanged(self):
+        self.convert("out")
+        log = self.convert("out")
+        self.assertIn("Processed 0 files (5 unchanged, 0 removed)", log)
+
+        (self.vault / "b.md").write_text("Some __new__ text.", encoding="utf-8")
+        log = self.convert("out")
+        self.assertIn("Processing b.md...", log)
+        self.assertIn("Processed 1 files", log)
+        self.assertIn("<strong>new</strong>", (self.root / "out" / "b.html").read_text(encoding="utf-8"))
+
+    def test_incremental_rebuild_prunes_deleted_notes(self):
+        self.convert("out")
+        (self.vault / "sub" / "c.md").unlink()
+        (self.vault / "sub" / "README.md").unlink()
+        log = self.convert("out")
+        self.assertIn("2 removed", log)
+        self.assertFalse((self.root / "out" / "sub").exists())
+        self.assertTrue((self.root / "out" / "a.html").exists())
+
+    def test_metadata_index(self):
+        import metadata_index
+        (self.vault / "a.md").write_text("---\ntitle: A\ntags: [x, y]\ndraft: True\n---\n# A", encoding="utf-8")
+        self.assertEqual(metadata_index.read_front_matter(self.vault / "a.md"),
+                         {'title': 'A', 'tags': ['x', 'y'], 'draft': True})
+        self.assertEqual(metadata_index.read_front_matter(self.vault / "b.md"), {})
+
+        serial = metadata_index.build_metadata_index(str(self.vault))
+        self.assertEqual(serial, {"a.md": {'title': 'A', 'tags': ['x', 'y'], 'draft': True}})
+        self.assertEqual(metadata_index.build_metadata_index(str(self.vault), workers=2), serial)
+
+        path = self.root / "meta.json"
+        metadata_index.save_metadata_index(serial, path)
+        self.assertEqual(metadata_index.load_metadata_index(path), serial)
+
+    def test_front_matter_scan_stops_at_closing_line(self):
+        import metadata_index
+        consumed = []
+        def lines():
+            for line in ["---\n", "k: 1\n", "---\n", "# Body\n", "more\n"]:
+                consumed.append(line)
+                yield line
+        self.assertEqual(metadata_index.scan_front_matter(lines()), {'k': 1})
+        self.assertEqual(len(consumed), 3)
+
+    def test_wikilinks_resolve_through_link_index(self):
+        from link_index import LinkIndex, LINKS_NAME
+        (self.vault / "sub" / "c.md").write_text("[[a]] [[Missing]] [[b#Part|B]] ![[pic.png]]", encoding="utf-8")
+        self.convert("out")
+        page = (self.root / "out" / "sub" / "c.html").read_text(encoding="utf-8")
+        self.assertIn('<a href="../a.html">a</a>', page)
+        self.assertIn('<a class="dead-link" href="Missing">Missing</a>', page)
+        self.assertIn('<a href="../b.html#Part">B</a>', page)
+        self.assertIn('<a href="pic.png">pic.png</a>', page)
+
+        index = LinkIndex(str(self.root / "out" / LINKS_NAME))
+        self.assertEqual(index.backlinks("a.md"), ["sub/c.md"])
+        self.assertEqual(index.backlinks("b.md"), ["a.md", "sub/c.md"])
+        self.assertEqual(index.dead_links(), [("sub/c.md", "Missing")])
+        index.close()
+
+    def test_new_note_relinks_pages_that_reference_it(self):
+        from link_index import LinkIndex, LINKS_NAME
+        (self.vault / "b.md").write_text("See [[Missing]].", encoding="utf-8")
+        self.convert("out")
+        (self.vault / "missing.md").write_text("Here now.", encoding="utf-8")
+        log = self.convert("out")
+        self.assertIn("Processing b.md...", log)
+        self.assertIn("Processing missing.md...", log)
+        self.assertIn("Processed 2 files", log)
+        self.assertIn('<a href="missing.html">Missing</a>', (self.root / "out" / "b.html").read_text(encoding="utf-8"))
+
+        index = LinkIndex(str(self.root / "out" / LINKS_NAME))
+        self.assertEqual(index.dead_links(), [])
+        self.assertEqual(index.outgoing("b.md"), [("Missing", "missing.md")])
+        index.close()
+
+    def test_profiler_records_notes_processors_and_trace(self):
+        from profiler import PHASES, Profiler
+        profiler = Profiler()
+        self.convert("out", profiler=profiler)
+        notes = {note.rel: note for note in profiler.notes}
+        self.assertEqual(sorted(notes), ["README.md", "a.md", "b.md", "sub/README.md", "sub/c.md"])
+        a = notes["a.md"]
+        self.assertEqual(a.bytes, len("# A\nSee [[b]]."))
+        self.assertGreater(a.nodes, 3)
+        self.assertEqual(set(a.phases), set(PHASES))
+        self.assertEqual(profiler.processors["HeadingProcessor"][0], 2) # README.md and a.md
+        self.assertEqual(profiler.processors["ListProcessor"][0], 1)
+        self.assertIn("slowest notes", profiler.report())
+
+        events = profiler.trace()["traceEvents"]
+        self.assertTrue(all(event["ph"] == "X" and event["dur"] >= 0 for event in events))
+        self.assertIn("sub/c.md", {event["name"] for event in events if event["cat"] == "note"})
+        self.assertIn("scan", {event["name"] for event in events if event["cat"] == "run"})
+
+        # Unchanged notes are only read
+        profiler = Profiler()
+        self.convert("out", profiler=profiler)
+        self.assertEqual(profiler.notes, [])
+
+    def test_profiler_counts_nested_phases_once(self):
+        import time
+        from profiler import Profiler
+        profiler = Profiler()
+        with profiler.note("x") as note:
+            with profiler.phase("render"):
+                for _ in profiler.phase_iter("parse", [1, 2]):
+                    with profiler.phase("parse_inline"):
+                        time.sleep(0.02)
+        self.assertGreaterEqual(note.phases["parse_inline"], 0.04)
+        self.assertLess(note.phases["render"], 0.02)
+        self.assertLessEqual(sum(note.phases.values()), note.total)
+
+        # A streamed note is parsed inside its rendering
+        profiler = Profiler()
+        self.convert("out", profiler=profiler, memory_budget=1)
+        for note in profiler.notes:
+            self.assertIn("parse_blocks", note.phases)
+            self.assertLessEqual(sum(note.phases.values()), note.total)
+
+    def test_force_rebuild(self):
+        self.convert("out")
+        log = self.convert("out", incremental=False)
+        self.assertIn("Processed 5 files", log)
+
+class TestWatch(unittest.TestCase):
+    def setUp(self):
+        from watch import VaultWatcher
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.vault = self.root / "vault"
+        self.out = self.root / "out"
+        (self.vault / "sub").mkdir(parents=True)
+        (self.vault / "README.md").write_text("# Vault\n", encoding="utf-8")
+        (self.vault / "a.md").write_text("See [[Missing]].", encoding="utf-8")
+        (self.vault / "b.md").write_text("Some *text*.", encoding="utf-8")
+        (self.vault / "sub" / "README.md").write_text("- one", encoding="utf-8")
+        self.watcher = VaultWatcher(str(self.vault), str(self.out))
+        self.watcher.start(quiet=True)
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def page(self, name: str) -> str:
+        return (self.out / name).read_text(encoding="utf-8")
+
+    def test_edit_rewrites_only_that_page(self):
+        (self.vault / "b.md").write_text("Some **bold** text.", encoding="utf-8")
+        self.assertEqual(self.watcher.update(), ["b.md"])
+        self.assertIn("<strong>bold</strong>", self.page("b.html"))
+        self.assertEqual(self.watcher.update(), [])
+
+    def test_new_note_relinks_and_removal_prunes(self):
+        (self.vault / "missing.md").write_text("Here now.", encoding="utf-8")
+        self.assertEqual(self.watcher.update(paths=["missing.md"]), ["a.md", "missing.md"])
+        self.assertIn('<a href="missing.html">Missing</a>', self.page("a.html"))
+
+        (self.vault / "missing.md").unlink()
+        self.assertEqual(self.watcher.update(paths=["missing.md"]), ["missing.md", "a.md"])
+        self.assertFalse((self.out / "missing.html").exists())
+        self.assertNotIn('href="missing.html"', self.page("a.html"))
+
+    def test_paths_outside_converted_folders_are_ignored(self):
+        (self.vault / "plain").mkdir()
+        (self.vault / "plain" / "x.md").write_text("No README here.", encoding="utf-8")
+        self.assertEqual(self.watcher.update(paths=["plain/x.md", "b.txt"]), [])
+
+    def test_search_index_follows_edits(self):
+        from search_index import SEARCH_INDEX_NAME, SearchIndex
+        from watch import VaultWatcher
+        watcher = VaultWatcher(str(self.vault), str(self.out), search_index=True)
+        watcher.start(quiet=True)
+        (self.vault / "b.md").write_text("Some **fresh** text.", encoding="utf-8")
+        (self.vault / "a.md").unlink()
+        watcher.update()
+        watcher.save()
+        index = SearchIndex.open(str(self.out / SEARCH_INDEX_NAME))
+        try:
+            self.assertEqual([rel for rel, _ in index.search("fresh")], ["b.md"])
+            self.assertEqual(index.search("missing"), [])
+            self.assertEqual(index.notes, ["README.md", "b.md", "sub/README.md"])
+        finally:
+            index.close()
+        # Without search_index, watch mode drops the index it would leave outdated
+        VaultWatcher(str(self.vault), str(self.out)).start(quiet=True)
+        self.assertFalse((self.out / SEARCH_INDEX_NAME).exists())
+
+    def test_save_lets_batch_conversion_skip_the_notes(self):
+        (self.vault / "b.md").write_text("Edited.", encoding="utf-8")
+        (self.vault / "missing.md").write_text("Here now.", encoding="utf-8")
+        self.watcher.update()
+        self.watcher.save()
+        buf = io.StringIO()
+        with contextlib.redirect_stdout(buf):
+            batch_converter.convert_all(str(self.vault), str(self.out))
+        self.assertIn("Processed 0 files", buf.getvalue())
+
+class TestServer(unittest.TestCase):
+    def setUp(self):
+        import threading
+        from server import ConversionServer
+        self.tmp = tempfile.TemporaryDirectory()
+        self.root = Path(self.tmp.name)
+        self.vault = self.root / "vault"
+        (self.vault / "sub").mkdir(parents=True)
+        (self.vault / "README.md").write_text("# Vault\n", encoding="utf-8")
+        (self.vault / "sub" / "README.md").write_text("See [[a]].", encoding="utf-8")
+        (self.vault / "a.md").write_text("# A\nSome *text*.", encoding="utf-8")
+        self.socket = str(self.root / "server.sock")
+        self.server = ConversionServer(self.socket, vault=str(self.vault), pool_size=2)
+        self.thread = threading.Thread(target=self.server.serve_forever, daemon=True)
+        self.thread.start()
+
+    def tearDown(self):
+        self.server.shutdown()
+        self.server.server_close()
+        self.thread.join()
+        self.tmp.cleanup()
+
+    def test_socket_and_default_directory_are_private(self):
+        import stat
+        from client import private_dir
+        self.assertEqual(stat.S_IMODE(Path(self.socket).stat().st_mode) & 0o077, 0)
+        private = self.root / "private"
+        private_dir(str(private), create=True)
+        self.assertEqual(stat.S_IMODE(private.stat().st_mode), 0o700)
+        shared = self.root / "shared"
+        shared.mkdir()
+        shared.chmod(0o755)
+        with self.assertRaises(OSError):
+            private_dir(str(shared), create=True)
+        (self.root / "link").symlink_to(private)
+        with self.assertRaises(OSError):
+            private_dir(str(self.root / "link"))
+
+    def test_convert_text_paths_and_ast(self):
+        import base64
+        import ast_codec
+        from client import Client
+        text = "# Title\nSome **bold** and [[a]] <3."
+        with Client(self.socket) as client:
+            results = client.convert([{"text": text}, {"path": "sub/README.md"},
+                                      {"path": str(self.root / "nope.md")}, {"neither": 1}], output="both")
+            self.assertEqual(results[0]["html"], '<h1>Title</h1><p>Some <strong>bold</strong> and <a href="a.html">a</a> &lt;3.</p>')
+            self.assertEqual(base64.b64decode(results[0]["ast"]), ast_codec.dump(Parser().parse(text)))
+            # Links resolve against the vault, relative to the note's own page
+            self.assertIn('<a href="../a.html">a</a>', results[1]["html"])
+            self.assertIn("error", results[2])
+            self.assertIn("error", results[3])
+            # The connection stays usable, also after a rejected request
+            with self.assertRaises(ValueError):
+                client.convert([], output="pdf")
+            self.assertEqual(client.convert([{"text": "x", "page": "sub/x.md"}]), [{"html": "<p>x</p>"}])
+            self.assertTrue(client.ping()["ok"])
+
+    def test_concurrent_clients(self):
+        import threading
+        from client import Client
+        expected = {i: HTMLRenderer().render(Parser().parse(f"# Note {i}\n- item *{i}*")) for i in range(40)}
+        errors = []
+
+        def run(first: int):
+            try:
+                with Client(self.socket) as client:
+                    for i in range(first, 40, 4):
+                        results = client.convert([{"text": f"# Note {i}\n- item *{i}*"}] * 3)
+                        if results != [{"html": expected[i]}] * 3:
+                            errors.append(i)
+            except Exception as e:
+                errors.append(e)
+
+        threads = [threading.Thread(target=run, args=(k,)) for k in range(4)]
+        for thread in threads:
+            thread.start()
+        for thread in threads:
+            thread.join()
+        self.assertEqual(errors, [])
+
+    def test_client_entry_point_and_socket_handling(self):
+        import client
+        from server import ConversionServer
+        out = io.StringIO()
+        with contextlib.redirect_stdout(out):
+            status = client.main(["--socket", self.socket, str(self.vault / "a.md")])
+        self.assertEqual(status, 0)
+        self.assertEqual(out.getvalue(), "<h1>A</h1><p>Some <em>text</em>.</p>")
+        # A live server is not replaced; a dead one's socket file is
+        with self.assertRaises(OSError):
+            ConversionServer(self.socket)
+        stale = str(self.root / "stale.sock")
+        import socket
+        sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+        sock.bind(stale)
+        sock.close()
+        ConversionServer(stale).server_close()
+        self.assertFalse(Path(stale).exists())
+
 if __name__ == '__main__':
     unittest.main()
@@ -1,13 +1,129 @@
+from typing import Any, Callable, Dict, Optional, Tuple
 from ast_nodes import Node
 
 class NodeVisitor:
+    """
+    Dispatches nodes to `visit_ClassName` methods.
+
+    Handlers are resolved once per node class and cached on the visitor
+    class, so `visit` is a dict lookup instead of building a method name and
+    calling getattr for every node. A node class without its own handler
+    falls back along its MRO (SourceText is handled by `visit_Text`), then
+    to `generic_visit`.
+
+    Containers can instead be handled by `enter_ClassName` (before the
+    children) and an optional `leave_ClassName` (after them). Visitors
+    written that way can walk a tree recursively with `visit`, or with an
+    explicit stack via `traverse`, which is not bound by the recursion limit.
+    Non-None results of handlers called by either walk are passed to `emit`.
+    """
+    # Per visitor class (see __init_subclass__): node class -> handler
+    _visit_handlers: Dict[type, Callable] = {}
+    # Per visitor class: node class -> (enter, leave), or None for non-containers
+    _container_handlers: Dict[type, Optional[Tuple[Callable, Optional[Callable]]]] = {}
+
+    def __init_subclass__(cls, **kwargs):
+        super().__init_subclass__(**kwargs)
+        # Each subclass gets its own caches, since it can override handlers.
+        cls._visit_handlers = {}
+        cls._container_handlers = {}
+
+    @classmethod
+    def _find(cls, prefix: str, node_class: type) -> Optional[Callable]:
+        for klass in node_class.__mro__:
+            handler = getattr(cls, prefix + klass.__name__, None)
+            if handler is not None:
+                return handler
+        return None
+
+    @classmethod
+    def _resolve_container(cls, node_class: type) -> Optional[Tuple[Callable, Optional[Callable]]]:
+        # A `visit_` handler takes precedence: such nodes are not descended into.
+        handlers = None
+        if cls._find('visit_', node_class) is None:
+            enter = cls._find('enter_', node_class)
+            if enter is not None:
+                handlers = (enter, cls._find('leave_', node_class))
+        cls._container_handlers[node_class] = handlers
+        return handlers
+
+    @classmethod
+    def _resolve(cls, node_class: type) -> Callable:
+        handler = cls._find('visit_', node_class)
+        if handler is None:
+            handlers = cls._resolve_container(node_class)
+            if handlers is not None:
+                enter, leave = handlers
+                def handler(self, node):
+                    return self._visit_container(node, enter, leave)
+            else:
+                handler = cls.generic_visit
+        cls._visit_handlers[node_class] = handler
+        return handler
+
     def visit(self, node: Node):
         """
-        Dynamically dispatch to a method named 'visit_ClassName'.
+        Dispatch to the method named 'visit_ClassName' (resolved once per class).
+        """
+        try:
+            handler = self._visit_handlers[node.__class__]
+        except KeyError:
+            handler = self._resolve(node.__class__)
+        return handler(self, node)
+
+    def _visit_container(self, node: Node, enter: Callable, leave: Optional[Callable]):
+        emit = self.emit
+        result = enter(self, node)
+        if result is not None:
+            emit(result)
+        visit = self.visit
+        for child in node.children:
+            result = visit(child)
+            if result is not None:
+                emit(result)
+        if leave is not None:
+            result = leave(self, node)
+            if result is not None:
+                emit(result)
+
+    def traverse(self, node: Node):
+        """
+        Walks `node` and its subtree in document order with an explicit stack.
+        Nodes with an `enter_` handler are descended into; all other nodes
+        are passed to `visit`.
         """
-        method_name = 'visit_' + node.__class__.__name__
-        visitor = getattr(self, method_name, self.generic_visit)
-        return visitor(node)
+        containers = self._container_handlers
+        resolve = self._resolve_container
+        visit_handlers = self._visit_handlers
+        visit = self.visit
+        emit = self.emit
+        stack = [node]
+        pop = stack.pop
+        push = stack.append
+        while stack:
+            item = pop()
+            if item.__class__ is tuple:
+                # A container's children are done: (leave, container)
+                result = item[0](self, item[1])
+            else:
+                try:
+                    handlers = containers[item.__class__]
+                except KeyError:
+                    handlers = resolve(item.__class__)
+                if handlers is None:
+                    handler = visit_handlers.get(item.__class__)
+                    result = handler(self, item) if handler is not None else visit(item)
+                else:
+                    enter, leave = handlers
+                    if leave is not None:
+                        push((leave, item))
+                    stack.extend(reversed(item.children))
+                    result = enter(self, item)
+            if result is not None:
+                emit(result)
+
+    def emit(self, result: Any):
+        """Receives the non-None handler results of a walk. Ignored by default."""
 
     def generic_visit(self, node: Node):
         """
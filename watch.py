@@ -0,0 +1,467 @@
+"""
+Watch mode: keeps a vault's output up to date while notes are being edited.
+
+    python3 watch.py [input_dir] [output_dir] [--interval 0.2] [--debounce 0.05] [--poll] [--search-index]
+
+The vault is converted once (incrementally, like batch_converter.py), then
+every note's AST and page HTML are kept in memory. On Linux the vault is
+watched with inotify, so only the files named in events are looked at;
+elsewhere (or with --poll) every note is stat'ed each interval. After a
+burst of saves settles, only the changed notes are re-parsed, and only they
+plus the pages whose WikiLinks resolve differently (because a note appeared
+or disappeared) are re-rendered. Pages whose HTML did not change are not
+rewritten.
+
+With --search-index, the vault's search index (see search_index.py) is
+kept too: notes re-parsed while watching are tokenized as their pages are
+rendered, and the index is rewritten with them when the watcher stops.
+Without it, the index is deleted on start, as by batch_converter.py, since
+watching would leave it outdated.
+"""
+import argparse
+import contextlib
+import ctypes
+import ctypes.util
+import io
+import os
+import posixpath
+import select
+import struct
+import time
+from pathlib import Path
+from typing import Dict, Iterable, List, Optional, Set, Tuple
+
+from ast_nodes import Document
+from batch_converter import build_key, collect_sources, convert_all, output_file_for, page_template, prune_outputs, read_source
+from link_index import LINKS_NAME, LinkIndex, LinkResolver, collect_links, link_key, note_keys
+from manifest import BuildManifest, content_digest
+from md_parser import Parser
+from renderer import HTMLRenderer, MultiRenderer, RenderResult
+from search_index import SEARCH_INDEX_NAME, IndexBuilder, SearchIndex
+
+# (mtime_ns, size) per note, as the scanner sees it
+Stats = Dict[str, Tuple[int, int]]
+
+# Directories collect_sources never descends into
+SKIP_DIRS = {".obsidian", ".git"}
+
+def _readme_dirs(stats: Stats) -> Set[str]:
+    """The directories whose notes are converted: those holding a README.md."""
+    return {posixpath.dirname(rel) for rel in stats if posixpath.basename(rel).lower() == 'readme.md'}
+
+class _Inotify:
+    """
+    Minimal inotify binding (Linux only, through libc). Reports the vault
+    paths that were written, created, deleted or moved, relative to the root.
+    """
+    IN_CLOSE_WRITE = 0x8
+    IN_MOVED_FROM = 0x40
+    IN_MOVED_TO = 0x80
+    IN_CREATE = 0x100
+    IN_DELETE = 0x200
+    IN_DELETE_SELF = 0x400
+    IN_MOVE_SELF = 0x800
+    IN_Q_OVERFLOW = 0x4000
+    IN_IGNORED = 0x8000
+    IN_ISDIR = 0x40000000
+    MASK = IN_CLOSE_WRITE | IN_MOVED_FROM | IN_MOVED_TO | IN_CREATE | IN_DELETE | IN_DELETE_SELF | IN_MOVE_SELF
+    EVENT = struct.Struct("iIII")
+
+    def __init__(self, root: Path):
+        libc_name = ctypes.util.find_library("c")
+        self._libc = ctypes.CDLL(libc_name, use_errno=True)
+        self.fd = self._libc.inotify_init1(os.O_NONBLOCK | os.O_CLOEXEC)
+        if self.fd < 0:
+            raise OSError(ctypes.get_errno(), "inotify_init1 failed")
+        self.root = root
+        self.dirs: Dict[int, str] = {} # watch descriptor -> relative directory ("" for the root)
+        self._watch_tree("")
+
+    @classmethod
+    def open(cls, root: Path) -> Optional['_Inotify']:
+        """Returns a watcher for `root`, or None where inotify is unavailable."""
+        try:
+            return cls(root)
+        except (OSError, AttributeError):
+            return None
+
+    def fileno(self) -> int:
+        return self.fd
+
+    def close(self):
+        os.close(self.fd)
+
+    def _watch_tree(self, rel_dir: str):
+        for root, dirs, _ in os.walk(os.path.join(self.root, rel_dir)):
+            dirs[:] = [d for d in dirs if d not in SKIP_DIRS]
+            wd = self._libc.inotify_add_watch(self.fd, os.fsencode(root), self.MASK)
+            if wd < 0:
+                raise OSError(ctypes.get_errno(), f"inotify_add_watch failed for {root}")
+            rel = os.path.relpath(root, self.root).replace(os.sep, '/')
+            self.dirs[wd] = "" if rel == "." else rel
+
+    def _rewatch(self):
+        for wd in list(self.dirs):
+            self._libc.inotify_rm_watch(self.fd, wd)
+        self.dirs.clear()
+        self._watch_tree("")
+
+    def read(self) -> Optional[Set[str]]:
+        """
+        Drains the pending events. Returns the relative paths of the files they
+        name, or None when the vault has to be rescanned: the queue overflowed,
+        or a directory or README.md appeared, disappeared or moved (which
+        changes the set of notes beyond the paths themselves).
+        """
+        paths: Set[str] = set()
+        rescan = False
+        while True:
+            try:
+                data = os.read(self.fd, 64 * 1024)
+            except BlockingIOError:
+                break
+            offset = 0
+            while offset < len(data):
+                wd, mask, _, length = self.EVENT.unpack_from(data, offset)
+                offset += self.EVENT.size
+                name = os.fsdecode(data[offset:offset + length].rstrip(b"\0"))
+                offset += length
+
+                if mask & self.IN_Q_OVERFLOW:
+                    rescan = True
+                    continue
+                if mask & self.IN_IGNORED:
+                    self.dirs.pop(wd, None)
+                    continue
+                rel_dir = self.dirs.get(wd)
+                if rel_dir is None or mask & (self.IN_DELETE_SELF | self.IN_MOVE_SELF):
+                    continue # Reported by the parent directory
+                rel = posixpath.join(rel_dir, name) if rel_dir else name
+                if mask & self.IN_ISDIR:
+                    if name in SKIP_DIRS:
+                        continue
+                    rescan = True
+                    if mask & self.IN_CREATE:
+                        self._watch_tree(rel)
+                    elif mask & (self.IN_MOVED_FROM | self.IN_MOVED_TO):
+                        # Watches below a moved directory keep their old paths.
+                        self._rewatch()
+                elif name.lower() == 'readme.md' and not mask & self.IN_CLOSE_WRITE:
+                    rescan = True
+                elif name.endswith(".md"):
+                    paths.add(rel)
+        return None if rescan else paths
+
+class VaultWatcher:
+    """
+    In-memory state of a converted vault: for every note its stats, AST,
+    outgoing WikiLinks and last written HTML, plus a reverse index from link
+    keys to the notes using them.
+
+    With `search_index`, the search index in the output directory is kept
+    up to date as well (written by `save`); without it, `start` deletes it.
+    """
+    def __init__(self, input_dir: str, output_dir: str, inline_css: bool = False, search_index: bool = False):
+        self.input_path = Path(input_dir).expanduser()
+        self.output_path = Path(output_dir).expanduser()
+        self.inline_css = inline_css
+        self.search_index = search_index
+        self.parser = Parser()
+        self.stats: Stats = {}
+        self.docs: Dict[str, Document] = {}
+        self.html: Dict[str, str] = {}
+        self.links: Dict[str, List[str]] = {}
+        self.linkers: Dict[str, Set[str]] = {}
+        self.resolver = LinkResolver(())
+        self.renderer = MultiRenderer(self.resolver, outputs=("html", "terms")) if search_index else HTMLRenderer(self.resolver)
+        self.template = page_template(self.renderer, inline_css)
+        # Since the last save(): notes re-parsed (with the content digest and
+        # stat they were read with), and notes whose links were re-resolved.
+        self._converted: Dict[str, Tuple[str, os.stat_result]] = {}
+        self._relinked: Set[str] = set()
+        # Search terms of the re-parsed notes, and whether notes were removed
+        self._terms: Dict[str, Dict[str, int]] = {}
+        self._removed = False
+        self._readme_dirs: Set[str] = set()
+
+    def start(self, quiet: bool = False):
+        """Brings the output up to date on disk, then loads every note into memory."""
+        log = contextlib.redirect_stdout(io.StringIO()) if quiet else contextlib.nullcontext()
+        with log:
+            convert_all(str(self.input_path), str(self.output_path), inline_css=self.inline_css,
+                        search_index=self.search_index)
+
+        self.stats = self.scan()
+        self._readme_dirs = _readme_dirs(self.stats)
+        self.resolver = self.renderer.link_resolver = LinkResolver(self.stats)
+        index = LinkIndex(os.path.join(self.output_path, LINKS_NAME))
+        try:
+            for rel in self.stats:
+                _, content = read_source(self.input_path / rel)
+                # The links come from the index convert_all just updated, so
+                # inline parsing can wait until a page is actually re-rendered.
+                links = [target for target, _ in index.outgoing(rel)]
+                self._set_doc(rel, self.parser.parse(content, lazy=True), links)
+        finally:
+            index.close()
+
+    def scan(self) -> Stats:
+        """Stats every note of the vault."""
+        stats = {}
+        for rel in collect_sources(self.input_path):
+            try:
+                st = os.stat(os.path.join(self.input_path, rel))
+            except FileNotFoundError:
+                continue # Deleted since the walk
+            stats[rel] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def stat_paths(self, paths: Iterable[str]) -> Dict[str, Optional[Tuple[int, int]]]:
+        """
+        Stats only `paths` (relative posix paths reported by the watcher). A
+        path maps to None when it is not, or no longer, a note of the vault.
+        """
+        stats = {}
+        for rel in paths:
+            stats[rel] = None
+            if not rel.endswith(".md") or posixpath.dirname(rel) not in self._readme_dirs:
+                continue
+            try:
+                st = os.stat(os.path.join(self.input_path, rel))
+            except (FileNotFoundError, NotADirectoryError):
+                continue
+            stats[rel] = (st.st_mtime_ns, st.st_size)
+        return stats
+
+    def update(self, stats: Optional[Stats] = None, paths: Optional[Iterable[str]] = None) -> List[str]:
+        """
+        Applies the difference between `stats` (by default a fresh scan) and
+        the last applied state. With `paths`, only those notes are looked at,
+        which keeps the cost independent of the vault size. Returns the notes
+        whose pages were rewritten or removed.
+        """
+        old = self.stats
+        if paths is not None:
+            seen = self.stat_paths(paths)
+            added = {rel for rel, st in seen.items() if st is not None and rel not in old}
+            removed = {rel for rel, st in seen.items() if st is None and rel in old}
+            changed = {rel for rel, st in seen.items() if st is not None and rel in old and st != old[rel]}
+            if not (added or removed or changed):
+                return []
+            for rel in removed:
+                del old[rel]
+            for rel in added | changed:
+                old[rel] = seen[rel]
+            stats = old
+        else:
+            if stats is None:
+                stats = self.scan()
+            added = stats.keys() - old.keys()
+            removed = old.keys() - stats.keys()
+            changed = {rel for rel in stats.keys() & old.keys() if stats[rel] != old[rel]}
+            if not (added or removed or changed):
+                return []
+            self.stats = stats
+            self._readme_dirs = _readme_dirs(stats)
+
+        affected: Set[str] = set()
+        if added or removed:
+            # Links to these notes now resolve differently.
+            self.resolver = self.renderer.link_resolver = LinkResolver(stats)
+            for rel in added | removed:
+                for key in note_keys(rel):
+                    affected.update(self.linkers.get(key, ()))
+
+        for rel in removed:
+            self._set_doc(rel, None)
+            self.html.pop(rel, None)
+            self._converted.pop(rel, None)
+            self._terms.pop(rel, None)
+            self._removed = True
+        prune_outputs(sorted(removed), self.output_path)
+
+        missing = set()
+        for rel in added | changed:
+            path = os.path.join(self.input_path, rel)
+            try:
+                st = os.stat(path)
+                data, content = read_source(path)
+            except FileNotFoundError:
+                # Deleted since the scan; the next scan reports the removal.
+                missing.add(rel)
+                continue
+            self._set_doc(rel, self.parser.parse(content))
+            self._converted[rel] = (content_digest(data), st)
+
+        written = sorted(removed)
+        for rel in sorted((added | changed | affected) - removed - missing):
+            if self._write_page(rel):
+                written.append(rel)
+        self._relinked |= affected - removed
+        return written
+
+    def run(self, interval: float = 0.2, debounce: float = 0.05, poll: bool = False):
+        """
+        Watches the vault until interrupted, with inotify where available and
+        otherwise by polling every `interval` seconds. Changes are applied once
+        the vault has been quiet for `debounce` seconds.
+        """
+        notify = None if poll else _Inotify.open(self.input_path)
+        try:
+            if notify is not None:
+                self._run_inotify(notify, debounce)
+            else:
+                self._run_polling(interval, debounce)
+        except KeyboardInterrupt:
+            pass
+        finally:
+            if notify is not None:
+                notify.close()
+            self.save()
+
+    def _run_inotify(self, notify: _Inotify, debounce: float):
+        while True:
+            select.select([notify], [], [])
+            paths: Optional[Set[str]] = set()
+            # Keep collecting until no event arrived for `debounce` seconds
+            while True:
+                events = notify.read()
+                paths = None if paths is None or events is None else paths | events
+                if not select.select([notify], [], [], debounce)[0]:
+                    break
+            start = time.perf_counter()
+            written = self.update() if paths is None else self.update(paths=paths)
+            self._report(written, start)
+
+    def _run_polling(self, interval: float, debounce: float):
+        while True:
+            time.sleep(interval)
+            stats = self.scan()
+            if stats == self.stats:
+                continue
+            # Wait for the burst of saves to settle
+            while True:
+                time.sleep(debounce)
+                settled = self.scan()
+                if settled == stats:
+                    break
+                stats = settled
+            start = time.perf_counter()
+            self._report(self.update(stats), start)
+
+    def _report(self, written: List[str], start: float):
+        if not written:
+            return
+        elapsed = (time.perf_counter() - start) * 1000
+        for rel in written:
+            print(f"Updated {rel}")
+        print(f"Applied {len(written)} page updates in {elapsed:.1f} ms")
+
+    def save(self):
+        """
+        Records the notes converted in memory in the build manifest and link
+        index, so the next batch conversion skips them.
+        """
+        manifest = BuildManifest.load(self.output_path, build_key(self.renderer, self.template))
+        index = LinkIndex(os.path.join(self.output_path, LINKS_NAME))
+        try:
+            for rel, (digest, st) in sorted(self._converted.items()):
+                manifest.record(rel, digest, st)
+            for rel in sorted(self._converted.keys() | (self._relinked & self.stats.keys())):
+                index.set_links(rel, self.links[rel], self.resolver)
+            manifest.prune(self.stats)
+            index.set_notes(self.stats)
+        finally:
+            index.close()
+        manifest.save()
+        if self.search_index:
+            self._save_search_index()
+        self._converted.clear()
+        self._relinked.clear()
+
+    def _save_search_index(self):
+        """Rewrites the search index with the notes re-parsed or removed since the last save."""
+        search_path = os.path.join(self.output_path, SEARCH_INDEX_NAME)
+        try:
+            base = SearchIndex.open(search_path)
+        except (OSError, ValueError):
+            # Gone or unreadable: index every note from memory
+            base = None
+            for rel in self.stats.keys() - self._terms.keys():
+                self._terms[rel] = self._render(rel).terms
+        try:
+            if base is None or self._terms or self._removed:
+                builder = IndexBuilder()
+                for rel, terms in self._terms.items():
+                    builder.add(rel, terms)
+                builder.write(search_path, self.stats, base)
+        finally:
+            if base is not None:
+                base.close()
+        self._terms.clear()
+        self._removed = False
+
+    def _set_doc(self, rel: str, doc: Optional[Document], links: Optional[List[str]] = None):
+        """
+        Stores (or, with None, forgets) the AST of `rel` and keeps the reverse
+        link index in step. `links` defaults to the WikiLinks found in `doc`.
+        """
+        for target in self.links.pop(rel, ()):
+            key = link_key(target)
+            if key is not None:
+                self.linkers[key].discard(rel)
+        if doc is None:
+            self.docs.pop(rel, None)
+            return
+        self.docs[rel] = doc
+        links = self.links[rel] = collect_links(doc) if links is None else links
+        for target in links:
+            key = link_key(target)
+            if key is not None:
+                self.linkers.setdefault(key, set()).add(rel)
+
+    def _render(self, rel: str) -> RenderResult:
+        """The HTML and search terms of `rel` (with `search_index` only)."""
+        self.renderer.page = rel
+        return self.renderer.render_all(self.docs[rel])
+
+    def _write_page(self, rel: str) -> bool:
+        """Renders `rel` and writes its page if the HTML changed. Returns whether it wrote."""
+        if self.search_index and rel in self._converted:
+            result = self._render(rel)
+            self._terms[rel] = result.terms
+            body = result.html
+        else:
+            self.renderer.page = rel
+            body = self.renderer.render(self.docs[rel])
+        html = self.template.header(rel, Path(rel).stem) + body + self.template.FOOTER
+        if self.html.get(rel) == html:
+            return False
+        self.html[rel] = html
+        output_file = output_file_for(rel, self.output_path)
+        os.makedirs(os.path.dirname(output_file), exist_ok=True)
+        with open(output_file, 'w', encoding='utf-8') as f:
+            f.write(html)
+        return True
+
+def build_arg_parser() -> argparse.ArgumentParser:
+    ap = argparse.ArgumentParser(description="Keep the HTML of an Obsidian vault up to date while it is edited.")
+    ap.add_argument("input_dir", nargs="?", default="~/Obsidian_Vault")
+    ap.add_argument("output_dir", nargs="?", default="output_html")
+    ap.add_argument("--interval", type=float, default=0.2, help="seconds between polls of the vault (with --poll)")
+    ap.add_argument("--debounce", type=float, default=0.05,
+                    help="seconds the vault must stay unchanged before a burst of saves is applied")
+    ap.add_argument("--poll", action="store_true", help="poll the vault even where inotify is available")
+    ap.add_argument("--inline-css", action="store_true",
+                    help="embed the stylesheet in every page instead of linking a shared file")
+    ap.add_argument("--search-index", action="store_true",
+                    help=f"keep the full-text search index in output_dir/{SEARCH_INDEX_NAME} up to date")
+    return ap
+
+if __name__ == "__main__":
+    args = build_arg_parser().parse_args()
+    watcher = VaultWatcher(args.input_dir, args.output_dir, inline_css=args.inline_css,
+                           search_index=args.search_index)
+    watcher.start()
+    print(f"Watching {watcher.input_path} ({len(watcher.stats)} notes). Press Ctrl+C to stop.")
+    watcher.run(args.interval, args.debounce, poll=args.poll)